@@ -0,0 +1,278 @@
+# Stage-level benchmark for the optimization_engine pipeline
+#
+# Generates synthetic service requests shaped like demo/demo_nsd1.sg.yaml and function
+# catalogs shaped like demo/apps.nf.yaml, serves them from local stub Topology and
+# Service Catalog servers and reports per-stage latency percentiles and peak memory.
+#
+# Usage:
+#   python benchmarks/bench_pipeline.py --functions 10,100,1000 --links 2 --sites 3 --iterations 50
+#   python benchmarks/bench_pipeline.py --per-model    # also the whole pipeline with each model enabled alone
+
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import yaml
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+CATALOG_NAME = "apps.nf.yaml"
+DEFAULT_MODELS = "autologic,greedysplit,capacityaware,multilevel,partition"
+
+# Synthetic inputs
+
+def generate_catalog(n_functions, rng):
+    network_functions = []
+    application_functions = []
+    for i in range(n_functions):
+        descriptor = {
+            "nf-vcpu": rng.randint(1, 8),
+            "nf-memory": rng.randint(1, 16),
+            "nf-storage": rng.randint(10, 100),
+        }
+        if i % 2 == 0:
+            network_functions.append({"nf-instance-id": f"nf-{i}-i01", **descriptor})
+        else:
+            application_functions.append({"af-instance-id": f"af-{i}-i01", **descriptor})
+    return yaml.safe_dump({"network-functions": network_functions, "application-functions": application_functions}, sort_keys=False)
+
+def generate_nsd(n_functions, n_links, rng):
+    network_functions = []
+    application_functions = []
+    ids = []
+    for i in range(n_functions):
+        if i % 2 == 0:
+            ids.append(f"nf-{i}-i01")
+            network_functions.append({"nf-instance-id": ids[-1], "nf-id": f"nf-{i}", "nf-name": f"Network Function {i}",
+                                      "nf-version": "v1.0", "nf-mgmt-network": "shared-mgmt-net"})
+        else:
+            ids.append(f"af-{i}-i01")
+            application_functions.append({"af-instance-id": ids[-1], "af-id": f"af-{i}", "af-name": f"Application Function {i}",
+                                          "af-version": "1.0", "af-mgmt-network": "shared-mgmt-net"})
+    links = []
+    for j in range(n_links):
+        # A chain keeps the graph connected, the rest are random shortcuts
+        u = ids[j % n_functions]
+        v = ids[(j + 1) % n_functions] if j < n_functions - 1 else rng.choice(ids)
+        links.append({"link-id": f"link-{j}", "connection-points": [
+            {"member-connection-point-index": 1, "member-if-id-ref": f"{u}:port-1"},
+            {"member-connection-point-index": 2, "member-if-id-ref": f"{v}:port-2"},
+        ]})
+    return {"lnsd": {
+        "ns-instance-id": f"bench-{n_functions}-{n_links}",
+        "ns": {
+            "name": "Benchmark Service", "id": "bench", "vendor": "D6G", "descriptor-version": "1.0", "site-id": "SITE0",
+            "network-functions": network_functions,
+            "application-functions": application_functions,
+            "mas-agent": {"instance-id": "mas0012", "id": "smas001", "name": "service_mas", "version": "v1.0"},
+            "forwarding_graphs": [{"member-graph-index": 1, "graph-name": "uplink", "links": links, "e2e_delay_budget": "5ms"}],
+        },
+    }}
+
+def generate_topology(n_sites, n_functions, rng):
+    # Enough capacity in total for the service, spread unevenly over the sites
+    per_site = max(1, (n_functions * 8) // max(1, n_sites - 1))
+    nodes = [{"site_id": f"SITE{i}", "cpu": per_site * rng.randint(1, 3), "mem": per_site * 2 * rng.randint(1, 3),
+              "storage": per_site * 100 * rng.randint(1, 3), "iml_endpoint": f"http://iml{i}:5000"} for i in range(n_sites)]
+    links = [{"source": f"SITE{i}", "destination": f"SITE{i + 1}", "latency_ms": round(rng.uniform(0.5, 5.0), 2)} for i in range(n_sites - 1)]
+    return nodes, links
+
+# Stub Topology and Service Catalog servers
+
+class StubState:
+    catalog = ""
+    nodes = []
+    links = []
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.startswith("/retrieve/"):
+            body = {"file_name": CATALOG_NAME, "file_content": StubState.catalog}
+        elif self.path == "/nodes/":
+            body = {"nodes": StubState.nodes}
+        elif self.path == "/links/":
+            body = {"links": StubState.links}
+        elif self.path.startswith("/nodes/"):
+            site_id = self.path.rsplit("/", 1)[1]
+            body = next((node for node in StubState.nodes if node["site_id"] == site_id), None)
+            if body is None:
+                self.send_error(404)
+                return
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Measurements
+
+def measure(func, iterations):
+    # Latency samples first, then one extra traced run for the peak memory
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": max(samples), "peak_kib": peak / 1024}, result
+
+def unsupported(plugin, domains, functions):
+    # Why a model does not support a case, from its declared capabilities
+    reasons = []
+    for capability, value in (("domains", domains), ("functions", functions)):
+        low, high = plugin.capabilities[capability]
+        if value < low or high is not None and value > high:
+            reasons.append(f"{value} {capability}, supports {low}..{'any' if high is None else high}")
+    if not reasons:
+        low, high = plugin.capabilities["part_size"]
+        reasons.append(f"{functions / domains:.1f} functions per domain, supports {low}..{'any' if high is None else high}")
+    return "; ".join(reasons)
+
+def run_case(n_functions, n_links, n_sites, iterations, models, seed, per_model=False):
+    import library.translator as translator
+    import library.optimization_engine as optimization_engine
+    import library.placements as placements
+    import library.resources.functions as functions
+    import library.resources.monitoring as monitoring
+    import library.resources.topology as topology
+    import library.registry as registry
+
+    rng = random.Random(seed)
+    StubState.catalog = generate_catalog(n_functions, rng)
+    StubState.nodes, StubState.links = generate_topology(n_sites, n_functions, rng)
+    functions.function_catalog_cache.invalidate()
+    topology.topology_cache.invalidate()
+
+    nsd = generate_nsd(n_functions, n_links, rng)
+    request = base64.b64encode(yaml.safe_dump(nsd, sort_keys=False).encode())
+    catalog = functions.get_function_catalog(CATALOG_NAME)
+    substrate, domains, site_resources = topology.fetch_d6g_site_info("SITE0")
+
+    results = {}
+    results["decode"], envelope = measure(lambda: translator.parse_request(request), iterations)
+    results["request2graph"], (graph, _) = measure(
+        lambda: translator.request2graph(envelope, catalog.functions, index=catalog.by_id), iterations)
+    results["check_resources"], _ = measure(
+        lambda: monitoring.rank_placements(None, site_resources, required=monitoring.request_demand(graph)), iterations)
+
+    subgraphs = None
+    skipped = {}
+    for name in models:
+        plugin = MODELS[name]
+        if not plugin.supports(domains, len(graph)):
+            skipped[name] = unsupported(plugin, domains, len(graph))
+            continue
+        results[f"model:{name}"], picked = measure(lambda: registry.run_model(name, graph, substrate, domains), iterations)
+        if subgraphs is None and isinstance(picked, list) and picked:
+            subgraphs = picked
+    if subgraphs:
+        results["graph2request"], _ = measure(
+            lambda: translator.graphs2requests(subgraphs, envelope), iterations)
+
+    # The whole pipeline from scratch on every run, a stored placement would turn the repeated
+    # request into an incremental repair
+    def fresh_run():
+        placements.placement_store.invalidate()
+        return optimization_engine.optimization_engine(request, "SITE0")
+    results["optimization_engine"], _ = measure(fresh_run, iterations)
+
+    if per_model:
+        # The whole pipeline with one model enabled at a time
+        enabled = list(registry.enabled_models)
+        try:
+            for name in models:
+                if name in skipped:
+                    continue
+                registry.enabled_models[:] = [name]
+                results[f"optimization_engine:{name}"], _ = measure(fresh_run, iterations)
+        finally:
+            registry.enabled_models[:] = enabled
+    return results, skipped
+
+def load_models(names):
+    # Models are looked up in the plugin registry, so entry point and configured plugins can be benchmarked too
+    import library.registry as registry
+    plugins = {}
+    for name in names:
+        plugin = registry.models.get(name)
+        if plugin is None:
+            raise SystemExit(f"Unknown model {name}")
+        plugins[name] = plugin
+    return plugins
+
+MODELS = {}
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage-level benchmark for the optimization_engine pipeline")
+    parser.add_argument("--functions", default="10,100,1000", help="Comma separated service sizes (number of functions)")
+    parser.add_argument("--links", type=float, default=2.0, help="Links per function")
+    parser.add_argument("--sites", type=int, default=3, help="Number of sites in the stub topology")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed iterations per stage")
+    parser.add_argument("--models", default=DEFAULT_MODELS, help="Comma separated model pool algorithms to benchmark")
+    parser.add_argument("--per-model", action="store_true", help="Also time the whole pipeline with each model enabled alone")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    port = str(server.server_address[1])
+    # The pipeline modules read their upstream endpoints from the environment
+    os.environ.update({
+        "TOPOLOGY_MODULE_HOST": "127.0.0.1", "TOPOLOGY_MODULE_PORT": port,
+        "SERVICE_CATALOG_HOST": "127.0.0.1", "SERVICE_CATALOG_PORT": port,
+        "SITE": "SITE0",
+        # Runs of the benchmark must not feed the model selector statistics of a deployment
+        "SELECTOR_STATS_PATH": "",
+    })
+    logging.disable(logging.INFO)
+    models = [name.strip() for name in args.models.split(",") if name.strip()]
+    MODELS.update(load_models(models))
+
+    report = []
+    for n_functions in [int(n) for n in args.functions.split(",")]:
+        n_links = int(n_functions * args.links)
+        results, skipped = run_case(n_functions, n_links, args.sites, args.iterations, models, args.seed, args.per_model)
+        report.append({"functions": n_functions, "links": n_links, "sites": args.sites, "stages": results, "skipped": skipped})
+
+    server.shutdown()
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for case in report:
+        print(f"\nfunctions={case['functions']} links={case['links']} sites={case['sites']}")
+        print(f"{'stage':<36}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'peak KiB':>12}")
+        for stage, stats in case["stages"].items():
+            print(f"{stage:<36}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}{stats['peak_kib']:>12.1f}")
+        for name, reason in case["skipped"].items():
+            print(f"{'model:' + name:<36}skipped ({reason})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# SO <-> OE message codec
+#
+# Messages that carry a content-type header are encoded with MessagePack (or JSON) and, above
+# a size threshold, compressed with zstd (content-encoding header). Messages without the
+# header are legacy: base64 encoded YAML/JSON requests and JSON replies. The OE answers in the
+# content type of the request, so the SO picks the format.
+
+import json
+import logging
+import library.config as config
+import library.translator as translator
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+ZSTD = "zstd"
+
+CONTENT_TYPES = {"msgpack": MSGPACK, "json": JSON}
+
+def _default(value):
+    # Frozen request decorations (see translator.freeze) and YAML timestamps/sets
+    return translator.json_default(value)
+
+def is_supported(content_type):
+    return content_type == JSON or (content_type == MSGPACK and msgpack is not None)
+
+def encode(payload, content_type, compress_threshold=None):
+    # Returns (body, content_encoding)
+    if content_type == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        body = msgpack.packb(payload, default=_default, use_bin_type=True)
+    elif content_type == JSON:
+        body = json.dumps(payload, default=_default, separators=(",", ":")).encode('utf-8')
+    else:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    if compress_threshold is None:
+        compress_threshold = config.MESSAGE_COMPRESS_THRESHOLD
+    if zstandard is not None and 0 < compress_threshold <= len(body):
+        return zstandard.ZstdCompressor(level=config.MESSAGE_COMPRESS_LEVEL).compress(body), ZSTD
+    return body, None
+
+def decode(body, content_type, content_encoding=None):
+    if content_encoding == ZSTD:
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        # Bound the decompressed size, a small frame must not expand into an oversized request
+        limit = config.REQUEST_MAX_BYTES
+        try:
+            size = zstandard.frame_content_size(body)
+            if size > limit:
+                raise ValueError(f"decompressed request is {size} bytes, at most {limit} are allowed")
+            body = zstandard.ZstdDecompressor().decompress(body, max_output_size=limit)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd body: {e}")
+    elif content_encoding not in (None, "", "identity"):
+        raise ValueError(f"Unsupported content encoding: {content_encoding}")
+    if content_type == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if content_type == JSON:
+        return json.loads(body)
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+def decode_request(body, content_type=None, content_encoding=None):
+    # RequestEnvelope of a service request, legacy messages go through the content sniffing parser
+    if not content_type:
+        return translator.parse_request(body)
+    service = decode(body, content_type, content_encoding)
+    # There is no text body to relay for encoded requests, raw stays None
+    return translator.RequestEnvelope(None, content_encoding or "identity", content_type, service)
+
+def encode_reply(payload, content_type=None):
+    # Returns (body, content_type, content_encoding), in the format of the request
+    if content_type and is_supported(content_type):
+        body, content_encoding = encode(payload, content_type)
+        return body, content_type, content_encoding
+    return translator.encode_response(payload), None, None
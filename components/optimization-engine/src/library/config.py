@@ -6,9 +6,28 @@ import os
 rabbitmq_host = os.getenv("RABBITMQ_HOST", "localhost")
 input_topic = os.getenv("INPUT_TOPIC", "input_topic")
 output_topic = os.getenv("OUTPUT_TOPIC", "output_topic")
+# Number of unacknowledged service requests the broker may push to this consumer
+prefetch_count = int(os.getenv("PREFETCH_COUNT", "4"))
+
+# Worker pool parameters
+# "thread" keeps everything in-process (I/O bound pipeline), "process" runs each
+# request in a separate interpreter so CPU bound partitioning scales across cores
+worker_mode = os.getenv("WORKER_MODE", "thread")
+worker_count = int(os.getenv("WORKER_COUNT", str(os.cpu_count() or 1)))
+
+# Messaging backend ("rabbitmq" or "kafka")
+messaging_system = os.getenv("MESSAGING_SYSTEM", "rabbitmq")
 
 # Kafka connection parameters
 kafka_bootstrap_servers = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+kafka_group_id = os.getenv("KAFKA_GROUP_ID", "optimization-engine")
+# Replies wait up to linger ms to be sent in batches of up to max batch size bytes, compressed per batch
+kafka_linger_ms = int(os.getenv("KAFKA_LINGER_MS", "5"))
+kafka_max_batch_size = int(os.getenv("KAFKA_MAX_BATCH_SIZE", str(256 * 1024)))
+kafka_compression = os.getenv("KAFKA_COMPRESSION", "zstd") or None
+# Requests are fetched in batches of up to this many records, waiting at most fetch max wait ms
+kafka_max_poll_records = int(os.getenv("KAFKA_MAX_POLL_RECORDS", "64"))
+kafka_fetch_max_wait_ms = int(os.getenv("KAFKA_FETCH_MAX_WAIT_MS", "50"))
 
 # Site parameters
 d6g_site = os.getenv("SITE", "site")
@@ -16,7 +35,74 @@ d6g_site = os.getenv("SITE", "site")
 # Topology Module connection parameters
 TOPOLOGY_MODULE_HOST = os.getenv("TOPOLOGY_MODULE_HOST", "localhost")
 TOPOLOGY_MODULE_PORT = os.getenv("TOPOLOGY_MODULE_PORT", "8000")
+# Seconds a topology snapshot is used before it is refreshed from the Topology Module
+TOPOLOGY_REFRESH_INTERVAL = float(os.getenv("TOPOLOGY_REFRESH_INTERVAL", "10"))
 
 # Service Catalog connection parameters
 SERVICE_CATALOG_HOST = os.getenv("SERVICE_CATALOG_HOST", "localhost")
 SERVICE_CATALOG_PORT = os.getenv("SERVICE_CATALOG_PORT", "8003")
+
+# Upstream HTTP client parameters (seconds)
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "1.0"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "5.0"))
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "10.0"))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "10"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "1"))
+
+# Function catalog cache parameters
+FUNCTION_CATALOG_TTL = float(os.getenv("FUNCTION_CATALOG_TTL", "30"))
+FUNCTION_CATALOG_MAX_ENTRIES = int(os.getenv("FUNCTION_CATALOG_MAX_ENTRIES", "8"))
+FUNCTION_CATALOG_MAX_BYTES = int(os.getenv("FUNCTION_CATALOG_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Admission parameters
+# Up to this many candidate sites every subset of sites is evaluated for split deployments
+ADMISSION_MAX_EXHAUSTIVE_SITES = int(os.getenv("ADMISSION_MAX_EXHAUSTIVE_SITES", "12"))
+ADMISSION_MAX_PLACEMENTS = int(os.getenv("ADMISSION_MAX_PLACEMENTS", "10"))
+
+# Port of the Prometheus metrics listener (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "8000"))
+
+# Placement store parameters
+# Number of services whose last placement is kept for incremental re-optimisation (0 disables it)
+PLACEMENT_STORE_MAX_ENTRIES = int(os.getenv("PLACEMENT_STORE_MAX_ENTRIES", "256"))
+
+# Message codec parameters (requests with a content-type header)
+# Encoded messages at least this large are zstd compressed (0 disables compression)
+MESSAGE_COMPRESS_THRESHOLD = int(os.getenv("MESSAGE_COMPRESS_THRESHOLD", "16384"))
+MESSAGE_COMPRESS_LEVEL = int(os.getenv("MESSAGE_COMPRESS_LEVEL", "3"))
+
+# Request validation limits, larger requests are rejected at the consumer
+REQUEST_MAX_BYTES = int(os.getenv("REQUEST_MAX_BYTES", str(16 * 1024 * 1024)))
+NSD_MAX_FUNCTIONS = int(os.getenv("NSD_MAX_FUNCTIONS", "10000"))
+NSD_MAX_LINKS = int(os.getenv("NSD_MAX_LINKS", "100000"))
+
+# Model Pool and Model Selector plugins, enabled by name in order ("name=module:function" registers a new one)
+OE_MODELS = os.getenv("OE_MODELS", "autologic,greedysplit,capacityaware,multilevel,partition")
+OE_SELECTOR = os.getenv("OE_SELECTOR", "intelligence")
+
+# Per-domain size bounds of the partition model (max 0 means unbounded)
+PARTITION_MIN_SIZE = int(os.getenv("PARTITION_MIN_SIZE", "2"))
+PARTITION_MAX_SIZE = int(os.getenv("PARTITION_MAX_SIZE", "0"))
+
+# Performance-learning model selector (intelligence) parameters
+# Statistics file, kept across restarts (empty disables persistence)
+SELECTOR_STATS_PATH = os.getenv("SELECTOR_STATS_PATH", "state/selector-stats.json")
+SELECTOR_STATS_FLUSH_INTERVAL = float(os.getenv("SELECTOR_STATS_FLUSH_INTERVAL", "30"))
+# Trade-off between placement quality (0) and model run time (1), run times are scored against the target (seconds)
+SELECTOR_LATENCY_WEIGHT = float(os.getenv("SELECTOR_LATENCY_WEIGHT", "0.3"))
+SELECTOR_LATENCY_TARGET = float(os.getenv("SELECTOR_LATENCY_TARGET", "0.05"))
+SELECTOR_EXPLORATION = float(os.getenv("SELECTOR_EXPLORATION", "0.5"))
+
+# Model portfolio racing parameters
+# Per-request latency budget in seconds for racing the enabled models in worker processes (0 runs only the selected model)
+PORTFOLIO_DEADLINE = float(os.getenv("PORTFOLIO_DEADLINE", "0"))
+PORTFOLIO_WORKERS = int(os.getenv("PORTFOLIO_WORKERS", str(min(4, os.cpu_count() or 1))))
+PORTFOLIO_MAX_MODELS = int(os.getenv("PORTFOLIO_MAX_MODELS", "4"))
+# Seconds past the deadline a race without a feasible placement waits for one before it gives up
+PORTFOLIO_GRACE = float(os.getenv("PORTFOLIO_GRACE", "1.0"))
+
+# Multilevel partitioner parameters
+# Parts may hold this fraction more functions than an even split
+MULTILEVEL_IMBALANCE = float(os.getenv("MULTILEVEL_IMBALANCE", "0.03"))
+# Links with a latency bound (ms) tighter than this weigh proportionally more when partitioning
+LINK_LATENCY_REFERENCE_MS = float(os.getenv("LINK_LATENCY_REFERENCE_MS", "10"))
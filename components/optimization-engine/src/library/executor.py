@@ -0,0 +1,43 @@
+# ProcessingSystems/executor.py
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from .config import worker_mode, worker_count
+from . import metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_executor: Executor | None = None
+
+def get_executor() -> Executor:
+    # Lazily create the bounded worker pool shared by all consumers
+    global _executor
+    if _executor is None:
+        if worker_mode == "process":
+            # Spawn instead of fork: the parent runs an event loop and broker I/O threads
+            _executor = ProcessPoolExecutor(max_workers=worker_count, mp_context=multiprocessing.get_context("spawn"))
+        elif worker_mode == "thread":
+            _executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="oe-worker")
+        else:
+            raise ValueError(f"Invalid worker mode specified: {worker_mode}")
+        logger.info("Started %s worker pool with %d workers.", worker_mode, worker_count)
+    return _executor
+
+async def run_in_worker(func, *args):
+    # Run a blocking pipeline step off the event loop
+    loop = asyncio.get_running_loop()
+    if worker_mode == "process":
+        # Metrics recorded in the worker process are merged into this process' registry
+        result, snapshot = await loop.run_in_executor(get_executor(), metrics.capture, func, *args)
+        metrics.REGISTRY.merge(snapshot)
+        return result
+    return await loop.run_in_executor(get_executor(), func, *args)
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
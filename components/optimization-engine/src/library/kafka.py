@@ -1,15 +1,151 @@
 # ProcessingSystems/kafka.py
+#
+# Kafka counterpart of rabbitmq.py. Requests are fetched in batches by a consumer group member
+# and the records of all assigned partitions are processed concurrently, at most prefetch_count
+# at a time. Offsets are committed per partition up to the oldest record still in flight, so a
+# restart or rebalance never skips a request (at-least-once, like the RabbitMQ acks). Replies
+# go to the topic named in the reply-to header (OUTPUT_TOPIC otherwise), keyed and tagged with
+# the correlation id of the request, through a batching and compressing producer.
 
-from kafka import KafkaConsumer, KafkaProducer
-from .config import kafka_bootstrap_servers, input_topic, output_topic
+import asyncio
+import logging
+import time
+from collections import deque
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, ConsumerRebalanceListener
+from .config import (kafka_bootstrap_servers, input_topic, output_topic, prefetch_count, kafka_group_id, kafka_linger_ms,
+                     kafka_max_batch_size, kafka_compression, kafka_max_poll_records, kafka_fetch_max_wait_ms)
+from .messaging import process_request
 
-def consume_messages():
-    from .messaging import process_message, logger  # Moved imports here
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
-    consumer = KafkaConsumer(input_topic, bootstrap_servers=kafka_bootstrap_servers)
-    producer = KafkaProducer(bootstrap_servers=kafka_bootstrap_servers)
+def _headers(record):
+    return {key: value.decode() for key, value in (record.headers or ())}
 
-    for message in consumer:
-        modified_message = process_message(message)
-        if modified_message:
-            producer.send(output_topic, modified_message.encode())
+class _Partition:
+    # Records of one partition in offset order, [offset, done] pairs
+    __slots__ = ("inflight", "tasks", "next_offset")
+
+    def __init__(self):
+        self.inflight = deque()
+        self.tasks = set()
+        self.next_offset = None
+
+    def complete(self):
+        # Offset to commit once the oldest records are done, None when it did not move
+        moved = False
+        while self.inflight and self.inflight[0][1]:
+            self.next_offset = self.inflight.popleft()[0] + 1
+            moved = True
+        return self.next_offset if moved else None
+
+class KafkaConnection(ConsumerRebalanceListener):
+    def __init__(self):
+        self.consumer = AIOKafkaConsumer(
+            bootstrap_servers=kafka_bootstrap_servers, group_id=kafka_group_id, enable_auto_commit=False,
+            auto_offset_reset="earliest", max_poll_records=kafka_max_poll_records, fetch_max_wait_ms=kafka_fetch_max_wait_ms)
+        self.producer = AIOKafkaProducer(
+            bootstrap_servers=kafka_bootstrap_servers, linger_ms=kafka_linger_ms, max_batch_size=kafka_max_batch_size,
+            compression_type=kafka_compression, acks="all")
+        self.partitions = {}
+        self.commits = {}
+        self.slots = asyncio.Semaphore(prefetch_count)
+        self.message_counter = 0
+        self.task = None
+
+    async def start(self):
+        await self.producer.start()
+        self.consumer.subscribe([input_topic], listener=self)
+        await self.consumer.start()
+        self.task = asyncio.create_task(self.poll())
+        self.task.add_done_callback(self._stopped)
+
+    def _stopped(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Kafka consumer stopped: {str(task.exception())}")
+
+    async def poll(self):
+        while True:
+            batches = await self.consumer.getmany(timeout_ms=1000, max_records=kafka_max_poll_records)
+            for tp, records in batches.items():
+                partition = self.partitions.setdefault(tp, _Partition())
+                for record in records:
+                    # Back pressure: fetch no further than the worker pool can take
+                    await self.slots.acquire()
+                    entry = [record.offset, False]
+                    partition.inflight.append(entry)
+                    task = asyncio.create_task(self.handle(tp, partition, entry, record))
+                    partition.tasks.add(task)
+                    task.add_done_callback(partition.tasks.discard)
+            await self.commit()
+
+    async def handle(self, tp, partition, entry, record):
+        self.message_counter += 1
+        headers = _headers(record)
+        try:
+            # Producer timestamp of the record (create time)
+            enqueued_at = record.timestamp / 1000.0 if record.timestamp else time.time()
+            reply = await process_request(record.value, headers.get("content-type"), headers.get("content-encoding"),
+                                          enqueued_at, self.message_counter)
+            if reply:
+                body, content_type, content_encoding = reply
+                correlation_id = headers.get("correlation-id")
+                reply_headers = [(key, value.encode()) for key, value in
+                                 (("content-type", content_type), ("content-encoding", content_encoding),
+                                  ("correlation-id", correlation_id)) if value]
+                # Wait for the broker, the request is committed only once its reply is stored
+                delivery = await self.producer.send(headers.get("reply-to") or output_topic, body,
+                                                    key=correlation_id.encode() if correlation_id else record.key,
+                                                    headers=reply_headers)
+                await delivery
+        except Exception as e:
+            # Like a rejected RabbitMQ message, a failed request is not retried
+            logger.error(f"Error processing message at {tp.topic}[{tp.partition}]@{record.offset}: {str(e)}")
+        finally:
+            entry[1] = True
+            offset = partition.complete()
+            if offset is not None:
+                self.commits[tp] = offset
+            self.slots.release()
+
+    async def commit(self):
+        if not self.commits:
+            return
+        commits, self.commits = self.commits, {}
+        try:
+            await self.consumer.commit(commits)
+        except Exception as e:
+            logger.error(f"Error committing offsets: {str(e)}")
+
+    async def on_partitions_revoked(self, revoked):
+        # Finish the requests of partitions moving to another member and commit them first
+        tasks = [task for tp in revoked if tp in self.partitions for task in self.partitions[tp].tasks]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self.commit()
+        for tp in revoked:
+            self.partitions.pop(tp, None)
+
+    async def on_partitions_assigned(self, assigned):
+        logger.info("Assigned partitions: %s", sorted(f"{tp.topic}[{tp.partition}]" for tp in assigned))
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        tasks = [task for partition in self.partitions.values() for task in partition.tasks]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self.commit()
+        await self.consumer.stop()
+        await self.producer.stop()
+
+async def consume_messages():
+    try:
+        connection = KafkaConnection()
+        await connection.start()
+        logger.info("Waiting for messages to process. To exit, press CTRL+C")
+        return connection
+    except Exception as e:
+        logger.error(f"Error in consuming messages: {str(e)}")
+        raise
@@ -1,22 +1,58 @@
 # ProcessingSystems/messaging.py
-import yaml
+#
+# Transport independent handling of a service request: size check, decoding, validation and
+# the optimization pipeline in the worker pool. The RabbitMQ and Kafka consumers only move
+# bytes and headers.
+
+import time
 import logging
-from aio_pika import IncomingMessage
+from .config import d6g_site
+from .executor import run_in_worker
+from . import metrics
+
+# Functionality
+import library.optimization_engine as optimization_engine
+import library.codec as codec
+import library.schema as schema
 
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def process_message(message: IncomingMessage):
+REJECTED_REQUESTS = metrics.REGISTRY.counter("oe_rejected_requests_total", "Service requests rejected at the consumer by reason.", ["reason"])
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram("oe_queue_wait_seconds", "Time a service request waited in the broker and the worker pool queue.")
+
+def _timed_pipeline(envelope, site, enqueued_at, content_type):
+    # Runs in the worker pool: everything before this point was queueing
+    QUEUE_WAIT_SECONDS.observe(max(0.0, time.time() - enqueued_at))
+    # The reply is encoded in the worker too, in the content type of the request
+    return codec.encode_reply(optimization_engine.optimize(envelope, site), content_type)
+
+def _reject(errors, reason, content_type):
+    logger.info("Rejected service request (%s): %s", reason, errors[:3])
+    REJECTED_REQUESTS.inc(reason=reason)
+    return codec.encode_reply(schema.error_payload(errors), content_type)
+
+async def process_request(body, content_type, content_encoding, enqueued_at, message_counter):
+    # Returns the reply as (body, content_type, content_encoding), raises on internal errors
+    reply_type = content_type if codec.is_supported(content_type) else None
+    # Reject oversized and malformed requests before any upstream I/O or worker time is spent
+    errors = schema.check_size(body)
+    if errors:
+        return _reject(errors, "size", reply_type)
     try:
-        parsed_yaml = yaml.safe_load(message.body)
-        logger.info("Processing message...")
-        logger.info("Received and processing YAML data:")
-        logger.info(parsed_yaml)
-
-        modified_message = f"Processed: {message.body.decode()}"
-        logger.info(modified_message)
-
-        logger.info("Message processing complete.")
-        return modified_message
-    except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
-        return None
+        # Decode the request once, every pipeline stage works on the parsed envelope
+        envelope = codec.decode_request(body, content_type, content_encoding)
+    except ValueError as e:
+        return _reject([{"path": "", "message": str(e)}], "decode", reply_type)
+    errors = schema.validate_request(envelope.service)
+    if errors:
+        return _reject(errors, "schema", reply_type)
+    logger.info("Received service optimization request number:" + str(message_counter) + ", with ns instance id:" + str(envelope.instance_id))
+
+    # Run the blocking pipeline in the worker pool so the loop keeps consuming
+    modified_message = await run_in_worker(_timed_pipeline, envelope, d6g_site, enqueued_at, reply_type)
+    logger.info("Optimization Engine returned a modified service request.")
+    if modified_message == -1:
+        logger.error(f"Optimization Engine returned an error. Error during optimization pipeline.")
+    logger.info("Optimized request ready for dispatch.")
+    return modified_message
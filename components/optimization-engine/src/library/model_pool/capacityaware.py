@@ -0,0 +1,145 @@
+# Capacity and Latency Aware Placement
+# v1.0
+
+# Explanation:
+# - Sites and Capacities: Every site of the substrate (topology graph) is a bin with cpu/mem/storage capacity. Site-to-site latency is the shortest latency_ms path between them.
+# - Demands: Every service function asks for nf-vcpu/nf-memory/nf-storage (missing values count as 0).
+# - Placement Order: Functions are visited in breadth-first order from the most demanding function, so neighbouring functions are placed one after the other.
+# - Assign Greedily: Each function goes to the feasible site that minimises the latency-weighted traffic towards its already placed neighbours. Ties go to the least utilised site.
+# - Refine: One sweep moves the functions on a cut edge to a feasible site with lower traffic cost, if there is one.
+# - Pinned Functions: A previous placement can pin functions to their site (incremental re-optimisation), then only the other functions are assigned and refined.
+# - Create Subgraphs: One subgraph per used site, tagged with its site id. Returns -1 when the service does not fit.
+
+# Modules
+import networkx as nx
+import numpy as np
+from library.servicegraph import ServiceGraph
+
+RESOURCES = ("nf-vcpu", "nf-memory", "nf-storage")
+CAPACITIES = ("cpu", "mem", "storage")
+
+# Latency matrices per (topology version, sites), the substrate rarely changes between requests
+_latency_cache = {}
+
+def _latency_matrix(substrate, sites):
+    key = (substrate.graph.get("version"), tuple(sites))
+    L = _latency_cache.get(key)
+    if L is not None:
+        return L
+    index = {site: i for i, site in enumerate(sites)}
+    unreachable = 1.0 + sum(latency for _, _, latency in substrate.edges(data="latency_ms", default=0.0))
+    L = np.full((len(sites), len(sites)), unreachable)
+    for site, distances in nx.all_pairs_dijkstra_path_length(substrate, weight="latency_ms"):
+        if site not in index:
+            continue
+        row = L[index[site]]
+        for other, latency in distances.items():
+            if other in index:
+                row[index[other]] = latency
+    if len(_latency_cache) > 32:
+        _latency_cache.clear()
+    _latency_cache[key] = L
+    return L
+
+# MAIN
+def capacityaware(graph, substrate, domains=3, pinned=None):
+
+    sites = list(substrate.nodes())[:domains]
+    # Work on the compact array form, networkx service graphs are converted once
+    compact = ServiceGraph.from_networkx(graph)
+    n = compact.number_of_nodes()
+    if n == 0:
+        return []
+    if not sites:
+        return -1
+
+    S = len(sites)
+    capacity = np.array([[float(substrate.nodes[site].get(c, 0)) for c in CAPACITIES] for site in sites])
+    demand = compact.demand
+    L = _latency_matrix(substrate, sites)
+    residual = capacity.copy()
+    # Avoid division by zero for sites that advertise no capacity for a resource
+    scale = np.where(capacity > 0, capacity, 1.0)
+
+    # Neighbour index/weight arrays per function (CSR layout)
+    eu, ev = compact.edge_u, compact.edge_v
+    indptr, dst = compact.indptr, compact.indices
+    wts = compact.edge_weight[compact.edge_of]
+
+    # Breadth-first placement order starting from the most demanding function of each component
+    order = compact.bfs_order(np.argsort(-demand.sum(axis=1), kind="stable").tolist())
+
+    placement = np.full(n, -1, dtype=np.int64)
+    # Utilisation only breaks ties between sites with the same traffic cost
+    tie_break = 1e-6 / max(1.0, float(L.min(initial=1.0, where=L > 0)))
+    load = np.zeros(S)
+    zero_cost = np.zeros(S)
+
+    def pick_site(i, d, current=-1):
+        lo, hi = indptr[i], indptr[i + 1]
+        sites_of = placement[dst[lo:hi]]
+        placed = sites_of >= 0
+        cost = L[:, sites_of[placed]] @ wts[lo:hi][placed] if hi > lo else zero_cost
+        feasible = (residual >= d).all(axis=1)
+        if current >= 0:
+            feasible[current] = True
+        elif not feasible.any():
+            return -1, cost
+        score = cost + tie_break * load
+        score[~feasible] = np.inf
+        return int(np.argmin(score)), cost
+
+    def update_load(site):
+        load[site] = ((capacity[site] - residual[site]) / scale[site]).max()
+
+    # Pinned functions keep the site of a previous placement, only the others are placed and refined
+    if pinned:
+        site_index = {site: s for s, site in enumerate(sites)}
+        for i, record in enumerate(compact.records):
+            s = site_index.get(pinned.get(record.name), -1)
+            if s >= 0 and (residual[s] >= demand[i]).all():
+                placement[i] = s
+                residual[s] -= demand[i]
+        for s in range(S):
+            update_load(s)
+    movable = placement < 0
+
+    # Greedy assignment
+    for i in order:
+        if placement[i] >= 0:
+            continue
+        d = demand[i]
+        site, _ = pick_site(i, d)
+        if site < 0:
+            return -1
+        placement[i] = site
+        residual[site] -= d
+        update_load(site)
+
+    # Refinement sweep over the functions that talk to another site
+    cut = placement[eu] != placement[ev]
+    boundary = np.unique(np.concatenate([eu[cut], ev[cut]]))
+    boundary = boundary[movable[boundary]]
+    for i in boundary:
+        d = demand[i]
+        current = placement[i]
+        residual[current] += d
+        site, cost = pick_site(i, d, current)
+        if cost[site] < cost[current] - 1e-9:
+            placement[i] = site
+        residual[placement[i]] -= d
+        update_load(current)
+        update_load(placement[i])
+
+    # Create subgraphs for each used site
+    subgraphs = []
+    for s, site in enumerate(sites):
+        part = np.flatnonzero(placement == s)
+        if not len(part):
+            continue
+        # Subgraph views share the graph attributes of the service graph, give each its own
+        subgraph = compact.take(part) if graph is compact else graph.subgraph([compact.records[i].name for i in part.tolist()])
+        subgraph.graph = dict(graph.graph, site_id=site)
+        subgraphs.append(subgraph)
+
+    return subgraphs
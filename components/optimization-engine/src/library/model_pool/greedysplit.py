@@ -2,9 +2,9 @@
 # Dr. Anestis Dalgkitsis | v1.54.23
 
 # Explanation:
-# - Initialize Empty Subgraphs: Create three empty subgraphs.
+# - Initialize Empty Partitions: Create three empty node lists.
 # - Assign Nodes Greedily: Iterate through nodes (in a shuffled order for randomness) and assign each node to the subgraph with the fewest nodes at the time of assignment.
-# - Include Edges: Ensure that edges between nodes within the same subgraph are included in the respective subgraph.
+# - Include Edges: The induced subgraph of each partition includes the edges between its nodes and keeps the node attributes.
 
 # Modules
 import networkx as nx
@@ -12,14 +12,12 @@ import random
 
 def greedysplit(graph, substrate, domains=3):
 
-    # Create empty subgraphs
-    subgraphs = [nx.Graph(), nx.Graph(), nx.Graph()]
-    
     # Get a list of nodes and shuffle it to ensure randomness
     nodes = list(graph.nodes())
     random.shuffle(nodes)
     
-    # Track the number of nodes in each subgraph
+    # Track the nodes and the number of nodes in each subgraph
+    parts = [[], [], []]
     subgraph_sizes = [0, 0, 0]
     
     # Distribute nodes to subgraphs greedily
@@ -28,15 +26,11 @@ def greedysplit(graph, substrate, domains=3):
         min_index = subgraph_sizes.index(min(subgraph_sizes))
         
         # Add the node to this subgraph
-        subgraphs[min_index].add_node(node)
+        parts[min_index].append(node)
         subgraph_sizes[min_index] += 1
     
-    # Add edges to the subgraphs
-    for edge in graph.edges():
-        u, v = edge
-        for i, subgraph in enumerate(subgraphs):
-            if u in subgraph.nodes() and v in subgraph.nodes():
-                subgraph.add_edge(u, v)
+    # Induced subgraphs keep the node attributes and the edges between nodes within the same subgraph
+    subgraphs = [graph.subgraph(part) for part in parts]
     
     # return subgraphs
     # return subgraphs[0], subgraphs[1], subgraphs[2]
@@ -0,0 +1,262 @@
+# Multilevel k-way Partitioning
+# v1.0
+
+# Explanation:
+# - Edge Weights: Links weigh by their traffic, the translator derives it from the bandwidth and latency annotations of the NSD links (1 when there are none). The objective is the weight of the links between functions on different sites.
+# - Coarsen: Heavy-edge matching pairs functions along their heaviest links (functions whose heaviest free neighbours are each other, then a handshake between randomly coloured functions, a few rounds) and contracts the pairs, summing node and link weights, until the graph has a few dozen nodes per domain or stops shrinking.
+# - Initial Partition: The coarsest graph is cut into k parts of equal node weight along breadth-first orders from several random starts, the cut with the lowest weight wins.
+# - Uncoarsen and Refine: The partition is projected back level by level and refined with FM/KL style boundary moves: every function whose links pull it more to another part than to its own moves there, highest gain first, as long as the target part stays within the balance tolerance. Passes alternate the move direction between parts (lower to higher index, then back), so neighbours never swap places in the same pass, and a pass that does not reduce the cut is undone.
+# - Balance: Parts hold at most (1 + MULTILEVEL_IMBALANCE) * n / k functions, overloaded parts hand their functions with the best gain to parts with room.
+# - Create Subgraphs: One subgraph per non-empty part. Everything is done on NumPy arrays, sparse service graphs of 10^5 functions take about half a second.
+
+# Modules
+import numpy as np
+import library.config as config
+from library.servicegraph import ServiceGraph
+
+# Stop coarsening at this many nodes per domain, or when a level shrinks by less than 10%
+COARSEST_PER_PART = 30
+MATCHING_ROUNDS = 3
+INITIAL_TRIES = 8
+REFINE_PASSES = 8
+
+class _Level:
+    __slots__ = ("n", "vw", "eu", "ev", "ew", "cmap")
+
+    def __init__(self, n, vw, eu, ev, ew):
+        self.n = n
+        self.vw = vw
+        self.eu = eu
+        self.ev = ev
+        self.ew = ew
+        self.cmap = None
+
+    def directed(self):
+        return np.concatenate([self.eu, self.ev]), np.concatenate([self.ev, self.eu]), np.concatenate([self.ew, self.ew])
+
+def _merge_edges(n, eu, ev, ew):
+    # Drops self loops and sums the weights of parallel edges
+    keep = eu != ev
+    lo = np.minimum(eu[keep], ev[keep]).astype(np.int64)
+    hi = np.maximum(eu[keep], ev[keep]).astype(np.int64)
+    keys, inverse = np.unique(lo * n + hi, return_inverse=True)
+    # bincount returns integers for no edges at all, the weights stay float
+    return keys // n, keys % n, np.bincount(inverse, weights=ew[keep], minlength=len(keys)).astype(float)
+
+# Coarsening
+
+def _heaviest(n, src, dst, key, mask):
+    # Per function the neighbour behind its heaviest link among mask (-1 for none) and the link key
+    best = np.full(n, -np.inf)
+    np.maximum.at(best, src[mask], key[mask])
+    hit = mask & (key == best[src])
+    pick = np.full(n, -1, dtype=np.int64)
+    pick[src[hit]] = dst[hit]
+    return pick, best
+
+def _match(level, max_vw, rng):
+    n = level.n
+    src, dst, w = level.directed()
+    # Random jitter breaks ties between equally heavy links
+    key = w * (1.0 + 1e-6 * rng.random(len(w)))
+    allowed = level.vw[src] + level.vw[dst] <= max_vw
+    src, dst, key = src[allowed], dst[allowed], key[allowed]
+    match = np.full(n, -1, dtype=np.int64)
+    for _ in range(MATCHING_ROUNDS):
+        free = (match[src] < 0) & (match[dst] < 0)
+        if not free.any():
+            break
+        # Functions whose heaviest free neighbours are each other
+        pick, _ = _heaviest(n, src, dst, key, free)
+        candidates = np.flatnonzero(pick >= 0)
+        mutual = candidates[pick[pick[candidates]] == candidates]
+        match[mutual] = pick[mutual]
+
+        # Handshake: randomly coloured proposers ask their heaviest free neighbour of the other
+        # colour, which accepts the heaviest proposal
+        proposer = rng.random(n) < 0.5
+        free = (match[src] < 0) & (match[dst] < 0) & proposer[src] & ~proposer[dst]
+        pick, best = _heaviest(n, src, dst, key, free)
+        s = np.flatnonzero(pick >= 0)
+        accepted, _ = _heaviest(n, pick[s], s, best[s], np.ones(len(s), dtype=bool))
+        d = np.flatnonzero(accepted >= 0)
+        match[d] = accepted[d]
+        match[accepted[d]] = d
+    return match
+
+def _coarsen(level, max_vw, rng):
+    match = _match(level, max_vw, rng)
+    representative = np.arange(level.n)
+    matched = match >= 0
+    representative[matched] = np.minimum(representative[matched], match[matched])
+    _, cmap = np.unique(representative, return_inverse=True)
+    nc = int(cmap.max()) + 1 if level.n else 0
+    level.cmap = cmap
+    vw = np.bincount(cmap, weights=level.vw, minlength=nc)
+    eu, ev, ew = _merge_edges(nc, cmap[level.eu], cmap[level.ev], level.ew)
+    return _Level(nc, vw, eu, ev, ew)
+
+# Initial partition
+
+def _bfs_order(level, start):
+    src, dst, _ = level.directed()
+    order = np.argsort(src, kind="stable")
+    indices = dst[order]
+    indptr = np.zeros(level.n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=level.n), out=indptr[1:])
+    seen = np.zeros(level.n, dtype=bool)
+    result = []
+    for root in [start] + list(range(level.n)):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = [root]
+        for i in queue:
+            for j in indices[indptr[i]:indptr[i + 1]].tolist():
+                if not seen[j]:
+                    seen[j] = True
+                    queue.append(j)
+        result.extend(queue)
+    return np.asarray(result, dtype=np.int64)
+
+def _initial(level, k, max_load, rng):
+    total = level.vw.sum()
+    best, best_cut = None, np.inf
+    # Fewer tries when coarsening stopped early on a large graph
+    for _ in range(max(2, min(INITIAL_TRIES, 50 * COARSEST_PER_PART * k // max(level.n, 1)))):
+        order = _bfs_order(level, int(rng.integers(level.n)))
+        middle = np.cumsum(level.vw[order]) - level.vw[order] / 2.0
+        part = np.empty(level.n, dtype=np.int64)
+        part[order] = np.minimum((middle * k / total).astype(np.int64), k - 1)
+        part = _refine(level, part, k, max_load)
+        cut = float(level.ew[part[level.eu] != part[level.ev]].sum())
+        if cut < best_cut:
+            best, best_cut = part, cut
+    return best
+
+# Refinement
+
+def _connectivity(level, part, k, directed):
+    src, dst, w = directed
+    conn = np.bincount(src * k + part[dst], weights=w, minlength=level.n * k).astype(float)
+    return conn.reshape(level.n, k)
+
+def _accept(order, target, weight, room):
+    # Prefix of the moves (in order) that fits into the room left in every target part
+    t = target[order]
+    by_target = np.argsort(t, kind="stable")
+    ts = t[by_target]
+    cumulative = np.cumsum(weight[order][by_target])
+    starts = np.searchsorted(ts, ts, side="left")
+    before = np.where(starts > 0, cumulative[starts - 1], 0.0)
+    fits = cumulative - before <= room[ts]
+    return order[by_target[fits]]
+
+def _refine(level, part, k, max_load):
+    directed = level.directed()
+    rows = np.arange(level.n)
+    total = directed[2].sum()
+    part = _rebalance(level, part, k, max_load, directed)
+    conn = _connectivity(level, part, k, directed)
+    internal = conn[rows, part]
+    # Every cut link is counted once from each side
+    cut = (total - internal.sum()) / 2.0
+    idle = 0
+    for step in range(REFINE_PASSES):
+        load = np.bincount(part, weights=level.vw, minlength=k)
+        options = conn.copy()
+        options[rows, part] = -np.inf
+        target = options.argmax(axis=1)
+        gain = options[rows, target] - internal
+        forward = target > part if step % 2 == 0 else target < part
+        candidates = np.flatnonzero((gain > 0) & forward)
+        moved = _accept(candidates[np.argsort(-gain[candidates], kind="stable")], target, level.vw, max_load - load)
+        if len(moved):
+            moved_part = part.copy()
+            moved_part[moved] = target[moved]
+            moved_conn = _connectivity(level, moved_part, k, directed)
+            moved_internal = moved_conn[rows, moved_part]
+            moved_cut = (total - moved_internal.sum()) / 2.0
+            # Simultaneous moves can work against each other, a pass that does not help is dropped
+            if moved_cut < cut:
+                part, conn, internal, cut, idle = moved_part, moved_conn, moved_internal, moved_cut, 0
+                continue
+        idle += 1
+        if idle == 2:
+            break
+    return part
+
+def _rebalance(level, part, k, max_load, directed):
+    for _ in range(4 * k):
+        load = np.bincount(part, weights=level.vw, minlength=k)
+        over = np.flatnonzero(load > max_load)
+        if len(over) == 0:
+            break
+        conn = _connectivity(level, part, k, directed)
+        moved_any = False
+        for p in over.tolist():
+            members = np.flatnonzero(part == p)
+            weights = level.vw[members]
+            internal = conn[members, p]
+            # Only parts with room for the function, ties go to the least loaded part
+            options = conn[members] - 1e-9 * load
+            options[load[None, :] + weights[:, None] > max_load] = -np.inf
+            options[:, p] = -np.inf
+            target = options.argmax(axis=1)
+            gain = options[np.arange(len(members)), target] - internal
+            possible = np.flatnonzero(np.isfinite(gain))
+            if len(possible) == 0:
+                continue
+            order = possible[np.argsort(-gain[possible], kind="stable")]
+            take = order[np.cumsum(weights[order]) - weights[order] < load[p] - max_load]
+            targets = np.full(level.n, -1, dtype=np.int64)
+            targets[members] = target
+            moved = _accept(members[take], targets, level.vw, max_load - load)
+            if len(moved):
+                part[moved] = targets[moved]
+                load = np.bincount(part, weights=level.vw, minlength=k)
+                moved_any = True
+        if not moved_any:
+            break
+    return part
+
+# MAIN
+def multilevel(graph, substrate, domains=3):
+
+    graph = ServiceGraph.from_networkx(graph)
+    n = len(graph)
+    if n == 0:
+        return []
+    k = max(1, min(domains, n))
+    rng = np.random.default_rng()
+    eps = config.MULTILEVEL_IMBALANCE
+
+    # Coarsen
+    level = _Level(n, np.ones(n), graph.edge_u.astype(np.int64), graph.edge_v.astype(np.int64), graph.edge_weight.astype(float))
+    level.eu, level.ev, level.ew = _merge_edges(n, level.eu, level.ev, level.ew)
+    levels = [level]
+    coarsest = COARSEST_PER_PART * k
+    max_vw = max(1.0, 1.5 * n / coarsest)
+    while level.n > coarsest:
+        coarse = _coarsen(level, max_vw, rng)
+        if coarse.n > 0.9 * level.n:
+            level.cmap = None
+            break
+        levels.append(coarse)
+        level = coarse
+
+    # Part weight bound, coarse levels get the slack of their heaviest node
+    def max_load(level):
+        return max((1.0 + eps) * n / k, np.ceil(n / k)) + level.vw.max() - 1.0
+
+    # Partition the coarsest graph, then project back and refine
+    part = _initial(level, k, max_load(level), rng)
+    for finer in reversed(levels[:-1]):
+        part = _refine(finer, part[finer.cmap], k, max_load(finer))
+
+    subgraphs = []
+    for p in range(k):
+        ids = np.flatnonzero(part == p)
+        if len(ids):
+            subgraphs.append(graph.take(ids))
+    return subgraphs
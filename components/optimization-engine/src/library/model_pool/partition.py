@@ -1,44 +1,41 @@
 # Partition Demo Automation
 # Ported from Cyril Hsu's work.
 
+# Explanation:
+# - Part Sizes: The n functions are split into n_domain parts of n // n_domain functions, the first n % n_domain parts get one more. These are the most balanced sizes and they respect the per-part bounds [min_size, max_size] whenever any split does (n_domain * min_size <= n <= n_domain * max_size).
+# - Cut Points: The parts are consecutive runs of a breadth-first order of the service graph, so neighbouring functions tend to share a part. The first sweep starts from a random function (demo randomness), the second one from the function the first reached last.
+# - Create Subgraphs: One induced subgraph per part, keyed by the real function ids. Returns -1 when the bounds cannot be met.
+
 # Modules
-import networkx as nx
 import random
-import copy
+import library.config as config
+from library.servicegraph import ServiceGraph
+
+def part_sizes(n, n_domain, min_size, max_size):
+    # Balanced part sizes, None when the bounds cannot be met (max_size 0 means unbounded)
+    if n_domain < 1 or n < n_domain * min_size or (max_size and n > n_domain * max_size):
+        return None
+    base, extra = divmod(n, n_domain)
+    return [base + 1 if d < extra else base for d in range(n_domain)]
+
+# simple partition with balanced cut points
+def partition(r, sub, n_domain=3, min_size=None, max_size=None):
+    G = ServiceGraph.from_networkx(r)
+    min_size = config.PARTITION_MIN_SIZE if min_size is None else min_size
+    max_size = config.PARTITION_MAX_SIZE if max_size is None else max_size
+    sizes = part_sizes(len(G), n_domain, min_size, max_size)
+    if sizes is None:
+        return -1
+
+    starts = list(range(len(G)))
+    random.shuffle(starts)
+    # A second sweep from the function reached last starts every component at its periphery,
+    # so consecutive runs of the order stay connected (e.g. a chain is cut into segments)
+    order = G.bfs_order(G.bfs_order(starts)[::-1])
 
-# simple partition with random cut points
-def partition(r, sub, n_domain=3):
-    G = r
-    assert len(G.nodes) >= n_domain
-    valid = False
-    while not valid:
-      cut_point = random.sample(list(range(1, len(G.nodes))), n_domain-1)
-      cut_point.sort()
-      # idx = list(range(len(G.nodes)))
-      idx = [str(n) for n in list(range(len(G.nodes)))]
-      ##
-      G0 = idx[:cut_point[0]]
-      G1 = idx[cut_point[0]:cut_point[1]]
-      G2 = idx[cut_point[1]:]
-      if len(G0)>=2 and len(G1)>=2 and len(G2)>=2 and len(G0)<=4 and len(G1)<=4 and len(G2)<=4:
-          valid=True
-    ##
-    H0 = nx.Graph(G.subgraph([n for n in G0]))
-    # print("H0")
-    # print(H0)
-    H1 = nx.Graph(G.subgraph([n for n in G1]))
-    # print("H1")
-    # print(H1)
-    H2 = nx.Graph(G.subgraph([n for n in G2]))
-    # print("H2")
-    # print(H2)
-    ##
-    r0 = copy.deepcopy(r)
-    r0 = H0
-    r1 = copy.deepcopy(r)
-    r1 = H1
-    r2 = copy.deepcopy(r)
-    r2 = H2
-    r = [r0, r1, r2]
-    # return r0, r1, r2
-    return r
+    subgraphs = []
+    cut_point = 0
+    for size in sizes:
+        subgraphs.append(G.take(order[cut_point:cut_point + size]))
+        cut_point += size
+    return subgraphs
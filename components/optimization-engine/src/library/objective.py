@@ -0,0 +1,85 @@
+# Placement quality
+#
+# A common objective for the subgraphs returned by any Model Pool algorithm, so that models
+# can be compared with each other (model selection, racing):
+# - Feasible: the model returned subgraphs, every function of the service is in exactly one and,
+#   given the substrate, no site is loaded beyond its cpu/mem/storage capacity.
+# - Cut Weight: the summed weight of the links between functions in different subgraphs, as a
+#   fraction of the total link weight (inter-site traffic).
+# - Imbalance: the largest subgraph relative to an even split over the used subgraphs, minus 1.
+# The cost combines both (lower is better) and the score maps it to [0, 1] (higher is better,
+# 0 for infeasible placements).
+
+import numpy as np
+
+IMBALANCE_WEIGHT = 0.25
+# Site capacities in the order of the function demands (servicegraph.DEMAND_FIELDS)
+CAPACITIES = ("cpu", "mem", "storage")
+
+class Quality:
+    __slots__ = ("feasible", "cut_weight", "cut_fraction", "imbalance", "parts")
+
+    def __init__(self, feasible, cut_weight=0.0, cut_fraction=0.0, imbalance=0.0, parts=0):
+        self.feasible = feasible
+        self.cut_weight = cut_weight
+        self.cut_fraction = cut_fraction
+        self.imbalance = imbalance
+        self.parts = parts
+
+    @property
+    def cost(self):
+        if not self.feasible:
+            return float("inf")
+        return self.cut_fraction + IMBALANCE_WEIGHT * self.imbalance
+
+    @property
+    def score(self):
+        return 1.0 / (1.0 + self.cost) if self.feasible else 0.0
+
+    def as_dict(self):
+        return {"feasible": self.feasible, "cut_weight": self.cut_weight, "cut_fraction": self.cut_fraction,
+                "imbalance": self.imbalance, "parts": self.parts, "score": self.score}
+
+    def __repr__(self):
+        return f"Quality(feasible={self.feasible}, cut_fraction={self.cut_fraction:.3f}, imbalance={self.imbalance:.3f})"
+
+INFEASIBLE = Quality(False)
+
+def evaluate(graph, subgraphs, substrate=None):
+    # Quality of a model result (list of subgraphs, -1 or None) for the ServiceGraph it partitions.
+    # Subgraphs are placed on their site_id, or else on the substrate site of the same position.
+    if not isinstance(subgraphs, (list, tuple)) or not subgraphs:
+        return INFEASIBLE
+    n = len(graph)
+    part = np.full(n, -1, dtype=np.int32)
+    sizes = []
+    loads = {}
+    sites = list(substrate.nodes()) if substrate is not None else None
+    for p, subgraph in enumerate(subgraphs):
+        ids = [graph.index.get(node, -1) for node in subgraph.nodes()]
+        if not ids:
+            continue
+        ids = np.asarray(ids, dtype=np.int64)
+        # Unknown functions or functions placed twice
+        if (ids < 0).any() or (part[ids] >= 0).any():
+            return INFEASIBLE
+        part[ids] = len(sizes)
+        sizes.append(len(ids))
+        if sites is not None:
+            site = subgraph.graph.get("site_id") or (sites[p] if p < len(sites) else None)
+            if site not in substrate:
+                return INFEASIBLE
+            loads[site] = loads.get(site, 0.0) + graph.demand[ids].sum(axis=0)
+    if (part < 0).any():
+        return INFEASIBLE
+    # Sites loaded beyond their capacity
+    for site, load in loads.items():
+        capacity = np.array([float(substrate.nodes[site].get(c, 0) or 0) for c in CAPACITIES])
+        if (load > capacity + 1e-9).any():
+            return INFEASIBLE
+
+    cut = part[graph.edge_u] != part[graph.edge_v]
+    cut_weight = float(graph.edge_weight[cut].sum())
+    total = float(graph.edge_weight.sum())
+    imbalance = max(sizes) * len(sizes) / n - 1.0 if n else 0.0
+    return Quality(True, cut_weight, cut_weight / total if total else 0.0, imbalance, len(sizes))
@@ -1,68 +1,100 @@
 # Optimization Engine Module Core Flow
 
 # Python Modules
-import json
 import logging
+import time
 import yaml
+from functools import partial
 # Local Modules
 import library.translator as translator
-
-# Demo Selector Pool
-import library.selector_pool.random_selection as random_selection
-
-# Demo Model Pool
-import library.model_pool.partition as partition
-import library.model_pool.autologic as autologic
-import library.model_pool.greedysplit as greedysplit
+import library.placements as placements
+import library.schema as schema
+import library.registry as registry
+import library.objective as objective
+import library.portfolio as portfolio
+import library.metrics as metrics
 
 # Demo Data
 import library.resources.topology as topology
 import library.resources.monitoring as monitoring
 import library.resources.functions as functions
+import library.resources.upstream as upstream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Model Pool Demo Configuration
-algorithms = {
-    "partition.py": {"enabled": False},
-    "autologic.py": {"enabled": True},
-    "greedysplit.py": {"enabled": True},
-}
-
-# Model Selector Demo Configuration
-selectors = {
-    "spinwheel.py (Default)": {"enabled": True},
-    "intelligence.py": {"enabled": False},
-}
+# Hot-path metrics
+STAGE_SECONDS = metrics.REGISTRY.histogram("oe_stage_seconds", "Time spent in each optimization pipeline stage.", ["stage"])
+REQUEST_SECONDS = metrics.REGISTRY.histogram("oe_request_seconds", "End-to-end optimization pipeline latency.", ["outcome"])
+REQUESTS = metrics.REGISTRY.counter("oe_requests_total", "Optimization requests by outcome.", ["outcome"])
+MODEL_PICKS = metrics.REGISTRY.counter("oe_model_picks_total", "Model pool picks by model.", ["model"])
+MODEL_SECONDS = metrics.REGISTRY.histogram("oe_model_seconds", "Partitioning time by model.", ["model"])
 
 def optimization_engine(data, d6g_site):
+    # Legacy entry point, the reply as JSON bytes
+    return translator.encode_response(optimize(data, d6g_site))
+
+def optimize(data, d6g_site):
+    # Runs the pipeline and returns the reply payload, the caller picks the wire format
+    start = time.perf_counter()
+    payload = _optimization_engine(data, d6g_site)
+    # Error and failure payloads are single-key objects (or an error string)
+    if isinstance(payload, dict) and "Error" in payload or isinstance(payload, str) and payload.startswith("Error"):
+        outcome = "error"
+    elif isinstance(payload, dict) and "Failed" in payload:
+        outcome = "failed"
+    else:
+        outcome = "ok"
+    REQUESTS.inc(outcome=outcome)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+    return payload
+
+def _optimization_engine(data, d6g_site):
+    stages = metrics.StageTimer(STAGE_SECONDS)
 
-    # Fetch VNF data from Service Catalog
-    logger.info("Fetching functions information from the Service Catalog module...")
+    # The consumer hands over a parsed and validated envelope, raw requests (e.g. from the benchmarks) are parsed and validated here
+    if not isinstance(data, translator.RequestEnvelope):
+        try:
+            data = translator.parse_request(data)
+        except ValueError as e:
+            logger.info("Error: Failed to decode service request: %s", e)
+            error_payload = {"Error": "Failed to translate service request, check syntax."}
+            return error_payload
+        errors = schema.validate_request(data.service)
+        if errors:
+            logger.info("Error: Invalid service request: %s", errors[:3])
+            return schema.error_payload(errors)
+    envelope = data
+    stages.mark("decode")
+
+    # Fetch VNF data from Service Catalog and topology from Topology Module concurrently
+    logger.info("Fetching functions information from the Service Catalog module and topology from Topology module...")
     # TODO: Do we really want to have a hardcoded graph name here?
-    function_info = functions.fetch_service_catalog_info(funtions_graph_name = "apps.nf.yaml", data = data)
-    if function_info is None:
+    # The function catalog is served from the descriptor cache and only revalidated once its TTL expires
+    function_catalog, site_info = upstream.fetch_parallel(
+        partial(functions.get_function_catalog, funtions_graph_name = "apps.nf.yaml"),
+        partial(topology.fetch_d6g_site_info, d6g_site),
+    )
+    if function_catalog is None:
         logger.info("Error: Failed to fetch function information, check configuration.")
         error_payload = {"Error": "Failed to fetch function information, check configuration."}
-        return json.dumps(error_payload).encode('utf-8')
+        return error_payload
     else:
         logger.info("Function information fetched successfully from the Service Catalog module.")
 
-    function_info = yaml.safe_load(function_info)
-    # Fetch topology from Topology Module
-    logger.info("Fetching topology from Topology module...")
-    topologyGraph, domains, site_resources = topology.fetch_d6g_site_info(d6g_site)
+    function_info = function_catalog.functions
+    topologyGraph, domains, site_resources = site_info if site_info is not None else (None, None, None)
+    stages.mark("fetch")
     if topologyGraph is None:
         logger.info("Error: Failed to fetch topology, check configuration.")
         error_payload = {"Error": "Failed to fetch topology, check configuration."}
-        return json.dumps(error_payload).encode('utf-8')
+        return error_payload
     else:
         logger.info("Topology fetched successfully from Topology module.")
     if domains is None:
         logger.info("Error: Failed to fetch domains, check configuration.")
         error_payload = {"Error": "Failed to fetch domains, check configuration."}
-        return json.dumps(error_payload).encode('utf-8')
+        return error_payload
     # Fetch topology resources from monitoring (Disabled for now)
     # logger.info("Fetching topology resources from monitoring module...")
     # topology_resources = monitoring.fetchTopologyResources(d6g_site)
@@ -70,88 +102,158 @@ def optimization_engine(data, d6g_site):
 
     # Translate NSD to internal structure
     logger.info("Translating service request to internal graph...")
-    serviceGraph, decorations = translator.request2graph(data, function_info)
+    try:
+        serviceGraph, decorations = translator.request2graph(envelope, function_info, index=function_catalog.by_id)
+    except translator.DemandError as e:
+        logger.info("Error: Invalid resource demands of the requested functions: %s", e)
+        error_payload = {"Error": "Invalid resource demands: " + str(e), "errors": e.errors}
+        return error_payload
     if serviceGraph is None:
         logger.info("Error: Failed to translate service request, check syntax.")
         error_payload = {"Error": "Failed to translate service request, check syntax."}
-        return json.dumps(error_payload).encode('utf-8')
+        return error_payload
     else:
         logger.info("Service request decoded successfully.")
+    stages.mark("request2graph")
 
-    # Check for local D6G site resource availability
+    # Check resource availability on the local D6G site and on every site reachable from it
     logger.info("Checking resource availability...")
-    if monitoring.check_resources(function_info, site_resources):
-        logger.info("Ok: There are enough resources to host the service in the current region.")
+    # Only the functions the request asks for count towards the demand
+    ranked = monitoring.rank_placements(function_info, site_resources, required=monitoring.request_demand(serviceGraph))
+    if ranked:
+        logger.info("Ok: There are enough resources to host the service in the current region. Best placement: " + str(ranked[0]["sites"]))
     else:
         logger.info("Failed: The local region does not have enough resources to host the service.")
         error_payload = {"Failed": "The local region does not have enough resources to host the service. Relaying service request to the next region."}
-        return json.dumps(error_payload).encode('utf-8')
-    
-    logger.info("Checking if there is only one D6G node in the site...")
-    # Check if only one D6G node in site, if yes forward the request to back to the local SO
-    if domains == 1:
-        logger.info("Success: There is only one D6G node in the site. Forwarding request to the local SO.")
-        # Decode bytes to string if data is in bytes format
-        if isinstance(data, bytes):
-            data = data.decode('utf-8')
-        return json.dumps(data).encode('utf-8')
-
-    # Route to enabled autoselector from Selector Pool
-    pick = random_selection.spinwheel(algorithms)
-    logger.info("Model Selector: " + str(pick))
-
-    # Route to selected Model from the Model Pool
-    subgraphs = []
-    try:
-        if pick == "partition.py (Default)":
-            subgraphs = partition.partition(serviceGraph, topologyGraph, domains)
-        elif pick == "autologic.py":
-            subgraphs = autologic.autologic(serviceGraph, topologyGraph, domains)
-        elif pick == "greedysplit.py":
-            subgraphs = greedysplit.greedysplit(serviceGraph, topologyGraph, domains)
+        return error_payload
+    stages.mark("check_resources")
+
+    # Place on the best admitted site set (fewest sites, then the nearest, then most headroom) that an
+    # enabled model can partition into, instead of spreading the service over every reachable site
+    reachable = [site["site-id-ref"] for site in site_resources["site-resources"]]
+    admitted = next((placement["sites"] for placement in ranked if registry.eligible_models(len(placement["sites"]), len(serviceGraph))),
+                    reachable)
+
+    logger.info("Checking if the local D6G node can host the service alone...")
+    # Check if only the local D6G node is needed (or there is no other one), if yes forward the request to back to the local SO
+    if ranked[0]["sites"] == [d6g_site] or domains == 1:
+        logger.info("Success: The local D6G node can host the service. Forwarding request to the local SO.")
+        # Relay the request exactly as it was received (legacy) or as decoded from the wire format
+        return envelope.service if envelope.raw is None else envelope.raw.decode('utf-8')
+
+    # Re-submitted services are repaired from their stored placement while the topology is unchanged
+    topology_version = topologyGraph.graph.get("version")
+    pinned = placements.repair_plan(envelope.instance_id, serviceGraph, topology_version, d6g_site)
+
+    # The admitted sites only fit the service in total, if the functions cannot be packed on them
+    # the service is placed on every reachable site instead
+    site_sets = [admitted] if len(admitted) == len(reachable) else [admitted, reachable]
+    for sites in site_sets:
+        substrate = topology.ordered_subgraph(topologyGraph, sites)
+        domains = len(sites)
+        logger.info("Placing the service on sites: " + str(sites))
+
+        # Re-submitted services are repaired by an enabled model that supports it, or optimised from scratch
+        repair = registry.repair_model(domains, len(serviceGraph)) if pinned is not None else None
+        if pinned is not None and repair is None:
+            logger.info("No enabled model can repair the previous placement, optimising from scratch.")
+
+        # Route to enabled autoselector from Selector Pool, among the models that support this request
+        if repair is not None:
+            pick = "incremental"
+        elif portfolio.enabled():
+            # The enabled models race each other, the best placement before the deadline wins
+            context = registry.request_context(domains, len(serviceGraph), serviceGraph.number_of_edges())
+            pick = "portfolio"
         else:
-            logger.info("Error: Unknown model selected, check Model Pool configuration.")
-            error_payload = "Error: Unknown model selected, check Model Pool configuration."
-            return json.dumps(error_payload).encode('utf-8')
-    except Exception as e:
-        logger.error("Internal error occurred in selected model: " + str(e))
-        error_payload = {"Error": "Internal error occurred in selected model: " + str(e)}
-        return json.dumps(error_payload).encode('utf-8')
-    
+            context = registry.request_context(domains, len(serviceGraph), serviceGraph.number_of_edges())
+            pick = registry.select_model(context)
+            if pick is None:
+                logger.info("Error: No enabled model supports %d functions on %d domains, check Model Pool configuration.", len(serviceGraph), domains)
+                error_payload = {"Error": "No enabled model supports this service request, check Model Pool configuration."}
+                return error_payload
+        logger.info("Model Selector: " + str(pick))
+        MODEL_PICKS.inc(model=pick)
+        stages.mark("select")
+
+        # Route to selected Model from the Model Pool
+        subgraphs = []
+        try:
+            if pick == "incremental":
+                logger.info("Repair model: " + str(repair))
+                subgraphs = registry.run_model(repair, serviceGraph, substrate, domains, pinned=pinned)
+                if subgraphs == -1:
+                    logger.info("Incremental repair does not fit, optimising from scratch.")
+                    subgraphs = registry.run_model(repair, serviceGraph, substrate, domains)
+            elif pick == "portfolio":
+                winner, subgraphs = portfolio.race(context, serviceGraph, substrate, domains)
+                if winner is None and subgraphs is None:
+                    logger.info("Error: No enabled model supports %d functions on %d domains, check Model Pool configuration.", len(serviceGraph), domains)
+                    error_payload = {"Error": "No enabled model supports this service request, check Model Pool configuration."}
+                    return error_payload
+                if winner is None:
+                    logger.info("Error: No portfolio model returned a placement within the deadline.")
+                    error_payload = {"Error": "No model returned a placement within the optimization deadline."}
+                    return error_payload
+                logger.info("Portfolio winner: " + str(winner))
+            else:
+                subgraphs = registry.run_model(pick, serviceGraph, substrate, domains)
+        except Exception as e:
+            logger.error("Internal error occurred in selected model: " + str(e))
+            if pick not in ("incremental", "portfolio"):
+                registry.observe(pick, context, time.perf_counter() - stages.last, objective.INFEASIBLE)
+            error_payload = {"Error": "Internal error occurred in selected model: " + str(e)}
+            return error_payload
+        if subgraphs != -1 or sites is site_sets[-1]:
+            break
+        logger.info("The functions do not fit on the admitted sites, placing the service on every reachable site.")
+        if pick not in ("incremental", "portfolio"):
+            registry.observe(pick, context, time.perf_counter() - stages.last, objective.INFEASIBLE)
+        stages.mark("partition")
+
+    model_seconds = time.perf_counter() - stages.last
+    MODEL_SECONDS.observe(model_seconds, model=pick)
+    stages.mark("partition")
+    # Tell the selector how the picked model did on this request (portfolio races report every model themselves)
+    if pick not in ("incremental", "portfolio"):
+        registry.observe(pick, context, model_seconds, objective.evaluate(serviceGraph, subgraphs, substrate))
+
     # Verify if partitioning was successfull
     if subgraphs is None or subgraphs == []:
         logger.info("Error: Unknown partitioning error.")
     elif subgraphs == -1:
         logger.info("Service partitioning has failed, not enough resources to allocate.")
         error_payload = {"Failed": "Service partitioning has failed, not enough resources to allocate."}
-        return json.dumps(error_payload).encode('utf-8')
+        return error_payload
     else:
         logger.info("Partitioning executed successfully. Count: " + str(len(subgraphs)) + " subgraphs: " + str(subgraphs))
 
-    # Translate internal structure to YAML for SO
-    encoded_subgraphs = []
-    for subgraph in subgraphs:
-        encoded_subgraph = translator.graph2request(subgraph, data)
-        if encoded_subgraph is None:
-            logger.info("Error: Failed to encode subgraph, check syntax: " + str(subgraph))
-            error_payload = {"Error": "Failed to encode subgraph, check syntax: " + str(subgraph)}
-            return json.dumps(error_payload).encode('utf-8')
-        else:
-            encoded_subgraphs.append(encoded_subgraph)
-            logger.info("Subgraph encoded successfully.")
+    # Translate internal structure to YAML for SO, all subgraphs in one pass
+    encoded_subgraphs = translator.graphs2requests(subgraphs, envelope)
+    if encoded_subgraphs is None:
+        logger.info("Error: Failed to encode subgraphs, check syntax: " + str(subgraphs))
+        error_payload = {"Error": "Failed to encode subgraphs, check syntax: " + str(subgraphs)}
+        return error_payload
     logger.info("Combined subgraphs encoded successfully.")
+    stages.mark("graph2request")
 
     # Combine Response
     try:
         combined_response = []
-        for domain in range(0, domains-1):
-            combined_response.append({f"s{domain+1}e": encoded_subgraphs[domain], "site_id": f"SITEID{domain+1}"})
+        site_ids = []
+        for domain, encoded_subgraph in enumerate(encoded_subgraphs):
+            site_id = subgraphs[domain].graph.get("site_id") or (sites[domain] if domain < len(sites) else f"SITEID{domain+1}")
+            combined_response.append({f"s{domain+1}e": encoded_subgraph, "site_id": site_id})
+            site_ids.append(site_id)
         logger.info("Combined response ready.")
     except Exception as e:
         logger.exception("An error occurred while combining the response: %s", e)
         error_payload = {"Error": "An error occurred while combining the response: " + str(e)}
-        return json.dumps(error_payload).encode('utf-8')
+        return error_payload
+
+    # Keep the placement for the next submission of the same service
+    placements.remember(envelope.instance_id, serviceGraph, subgraphs, site_ids, topology_version, d6g_site)
 
     # Return Partitioned Request
     logger.info("Returning optimized service request.")
-    return json.dumps(combined_response).encode('utf-8')
\ No newline at end of file
+    return combined_response
\ No newline at end of file
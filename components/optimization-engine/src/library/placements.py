@@ -0,0 +1,117 @@
+# Placement store for incremental re-optimisation
+#
+# The last placement of every service is kept under its ns-instance-id together with a
+# canonical hash of the service graph and the topology version it was computed on. When the
+# same service is submitted again on an unchanged topology, the new graph is diffed against
+# the stored one: unchanged functions are pinned to their previous site and only the added,
+# changed or re-linked functions are placed again (see capacityaware's pinned argument).
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+import library.config as config
+import library.metrics as metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PLACEMENT_LOOKUPS = metrics.REGISTRY.counter("oe_placement_store_lookups_total", "Placement store lookups by result.", ["result"])
+
+class PlacementRecord:
+    __slots__ = ("graph_hash", "topology_version", "site", "assignment", "signatures", "edges")
+
+    def __init__(self, graph_hash, topology_version, site, assignment, signatures, edges):
+        self.graph_hash = graph_hash
+        self.topology_version = topology_version
+        self.site = site
+        self.assignment = assignment
+        self.signatures = signatures
+        self.edges = edges
+
+class PlacementStore:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, instance_id):
+        with self._lock:
+            record = self._entries.get(instance_id)
+            if record is not None:
+                self._entries.move_to_end(instance_id)
+        return record
+
+    def put(self, instance_id, record):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[instance_id] = record
+            self._entries.move_to_end(instance_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, instance_id=None):
+        with self._lock:
+            if instance_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(instance_id, None)
+
+placement_store = PlacementStore(max_entries=config.PLACEMENT_STORE_MAX_ENTRIES)
+
+# Canonical form
+
+def graph_signature(graph):
+    # Per function (kind, demand) and the set of function pairs that are linked
+    signatures = {record.name: (record.kind, tuple(row)) for record, row in zip(graph.records, graph.demand.tolist())}
+    names = [record.name for record in graph.records]
+    edges = {(names[u], names[v]) if names[u] <= names[v] else (names[v], names[u])
+             for u, v in zip(graph.edge_u.tolist(), graph.edge_v.tolist())}
+    return signatures, edges
+
+def graph_hash(signatures, edges):
+    canonical = json.dumps([sorted(signatures.items()), sorted(edges)], separators=(",", ":"))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+# Pipeline hooks
+
+def repair_plan(instance_id, graph, topology_version, site):
+    # The previous assignment of the functions that did not change, or None for a full optimisation
+    if instance_id is None or placement_store.max_entries <= 0:
+        return None
+    record = placement_store.get(instance_id)
+    if record is None:
+        PLACEMENT_LOOKUPS.inc(result="miss")
+        return None
+    if record.topology_version != topology_version or record.site != site:
+        PLACEMENT_LOOKUPS.inc(result="stale")
+        logger.info("Stored placement of %s was computed on another topology, optimising from scratch.", instance_id)
+        return None
+
+    signatures, edges = graph_signature(graph)
+    if graph_hash(signatures, edges) == record.graph_hash:
+        PLACEMENT_LOOKUPS.inc(result="unchanged")
+        logger.info("Service %s is unchanged, reusing its stored placement.", instance_id)
+        return dict(record.assignment)
+
+    # Functions that are new, changed their demand or gained/lost a link are placed again
+    free = {name for name, signature in signatures.items() if record.signatures.get(name) != signature}
+    for u, v in edges.symmetric_difference(record.edges):
+        free.add(u)
+        free.add(v)
+    pinned = {name: site_id for name, site_id in record.assignment.items() if name in signatures and name not in free}
+    PLACEMENT_LOOKUPS.inc(result="repair")
+    logger.info("Service %s changed: repairing the placement of %d of %d functions.", instance_id, len(signatures) - len(pinned), len(signatures))
+    return pinned
+
+def remember(instance_id, graph, subgraphs, site_ids, topology_version, site):
+    if instance_id is None or placement_store.max_entries <= 0:
+        return
+    assignment = {}
+    for subgraph, site_id in zip(subgraphs, site_ids):
+        for node in subgraph.nodes():
+            assignment[node] = site_id
+    signatures, edges = graph_signature(graph)
+    placement_store.put(instance_id, PlacementRecord(graph_hash(signatures, edges), topology_version, site, assignment, signatures, edges))
@@ -0,0 +1,230 @@
+# Model portfolio racing
+#
+# Instead of a single selected model, several enabled Model Pool algorithms run at once, each
+# in a worker process of a small persistent pool, under a per-request deadline. Every finished
+# result is scored with the common objective (objective.py) and the best feasible placement
+# found before the deadline is returned. Workers still running at the deadline are terminated
+# and replaced, so a slow model cannot hold on to a core. If no feasible placement is found
+# before the deadline, the first feasible result within PORTFOLIO_GRACE seconds after it is
+# used. Past that hard cap every model still running is terminated and the race has no winner.
+#
+# Workers are spawned (the OE runs an event loop and broker I/O threads) and import the enabled
+# models once when they start. With WORKER_MODE=process every pipeline process has its own pool,
+# PORTFOLIO_WORKERS is split between them so the number of racing processes stays bounded.
+# Concurrent races share the idle workers, a race that gets fewer workers than it has candidate
+# models only races the first ones (logged and counted as skipped). Subgraphs travel back as node lists and are rebuilt from the
+# parent's service graph, so only the request is pickled per race.
+
+import logging
+import multiprocessing
+import pickle
+import threading
+import time
+from multiprocessing.connection import wait
+import library.config as config
+import library.metrics as metrics
+import library.objective as objective
+import library.registry as registry
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PORTFOLIO_RESULTS = metrics.REGISTRY.counter("oe_portfolio_results_total", "Portfolio model runs by model and result.", ["model", "result"])
+
+# Worker side
+
+def _serve(conn):
+    for name in registry.enabled_models:
+        registry.models.plugins[name].load()
+    while True:
+        try:
+            name, payload = conn.recv_bytes(), conn.recv_bytes()
+        except EOFError:
+            return
+        graph, substrate, domains = pickle.loads(payload)
+        start = time.perf_counter()
+        try:
+            subgraphs = registry.run_model(name.decode(), graph, substrate, domains)
+            if isinstance(subgraphs, list):
+                subgraphs = [(list(subgraph.nodes()), dict(subgraph.graph)) for subgraph in subgraphs]
+            conn.send(("ok", subgraphs, time.perf_counter() - start))
+        except Exception as e:
+            conn.send(("error", str(e), time.perf_counter() - start))
+
+# Parent side
+
+class _Worker:
+    __slots__ = ("process", "conn")
+
+    def __init__(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child,), daemon=True, name="oe-portfolio")
+        self.process.start()
+        child.close()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def terminate(self):
+        self.process.terminate()
+        self.conn.close()
+
+class Pool:
+    def __init__(self, size):
+        self.size = size
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._started = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            while self._started < self.size:
+                self._idle.append(_Worker(self._context))
+                self._started += 1
+        logger.info("Started portfolio pool with %d workers.", self.size)
+
+    def acquire(self, count):
+        # Up to count idle workers, concurrent races share the pool
+        with self._lock:
+            alive = [worker for worker in self._idle if worker.alive()]
+            self._started -= len(self._idle) - len(alive)
+            while self._started < self.size:
+                alive.append(_Worker(self._context))
+                self._started += 1
+            workers, self._idle = alive[:count], alive[count:]
+        return workers
+
+    def release(self, worker):
+        with self._lock:
+            self._idle.append(worker)
+
+    def cancel(self, worker):
+        # A worker that is still running is terminated and replaced by a fresh one right away,
+        # the replacement imports the models while it waits for its first race
+        worker.terminate()
+        with self._lock:
+            self._idle.append(_Worker(self._context))
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._idle:
+                worker.terminate()
+            self._idle = []
+            self._started = 0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def pool_size():
+    if config.worker_mode == "process":
+        return max(1, config.PORTFOLIO_WORKERS // config.worker_count)
+    return config.PORTFOLIO_WORKERS
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = Pool(pool_size())
+        return _pool
+
+def enabled():
+    return config.PORTFOLIO_DEADLINE > 0
+
+def race(context, graph, substrate, domains, deadline=None):
+    # Returns (model, subgraphs) of the best placement, subgraphs is -1 when no model found one
+    # (model is None when no model returned any placement before the hard cap)
+    candidates = list(registry.eligible_models(domains, len(graph)))[:config.PORTFOLIO_MAX_MODELS]
+    if not candidates:
+        return None, None
+    deadline = config.PORTFOLIO_DEADLINE if deadline is None else deadline
+    pool = get_pool()
+    workers = pool.acquire(len(candidates))
+    if not workers:
+        # Every worker is busy with other races, run the selected model in this thread
+        name = registry.select_model(context)
+        logger.info("Portfolio pool is busy, running %s only.", name)
+        for skipped in candidates:
+            if skipped != name:
+                PORTFOLIO_RESULTS.inc(model=skipped, result="skipped")
+        return name, registry.run_model(name, graph, substrate, domains)
+
+    if len(workers) < len(candidates):
+        logger.info("Portfolio pool has %d idle workers, racing %s and skipping %s.",
+                    len(workers), candidates[:len(workers)], candidates[len(workers):])
+        for skipped in candidates[len(workers):]:
+            PORTFOLIO_RESULTS.inc(model=skipped, result="skipped")
+
+    payload = pickle.dumps((graph, substrate, domains), protocol=pickle.HIGHEST_PROTOCOL)
+    running = {}
+    for name, worker in zip(candidates, workers):
+        worker.conn.send_bytes(name.encode())
+        worker.conn.send_bytes(payload)
+        running[worker.conn] = (name, worker)
+
+    start = time.perf_counter()
+    best = None
+    infeasible = None
+    while running:
+        now = time.perf_counter()
+        remaining = start + deadline - now
+        # Past the deadline only a first feasible placement is waited for, until the hard cap
+        if remaining <= 0:
+            remaining = start + deadline + config.PORTFOLIO_GRACE - now
+            if best is not None or remaining <= 0:
+                break
+        for conn in wait(list(running), timeout=remaining):
+            name, worker = running.pop(conn)
+            try:
+                status, result, seconds = conn.recv()
+            except (EOFError, OSError):
+                status, result, seconds = "error", "worker exited", time.perf_counter() - start
+                pool.cancel(worker)
+            else:
+                pool.release(worker)
+            if status != "ok":
+                logger.error("Internal error occurred in portfolio model %s: %s", name, result)
+                PORTFOLIO_RESULTS.inc(model=name, result="error")
+                registry.observe(name, context, seconds, objective.INFEASIBLE)
+                continue
+            subgraphs = _rebuild(graph, result)
+            quality = objective.evaluate(graph, subgraphs, substrate)
+            registry.observe(name, context, seconds, quality)
+            if not quality.feasible:
+                PORTFOLIO_RESULTS.inc(model=name, result="infeasible")
+                infeasible = infeasible or name
+                continue
+            PORTFOLIO_RESULTS.inc(model=name, result="feasible")
+            logger.info("Portfolio model %s finished in %.3fs: %s", name, seconds, quality)
+            if best is None or quality.cost < best[2].cost:
+                best = (name, subgraphs, quality)
+
+    # Cancel the models that are still running
+    elapsed = time.perf_counter() - start
+    if running and best is None:
+        logger.info("Portfolio race found no feasible placement within %.3fs, cancelling %d models.", elapsed, len(running))
+    for name, worker in running.values():
+        pool.cancel(worker)
+        PORTFOLIO_RESULTS.inc(model=name, result="cancelled")
+        registry.observe(name, context, elapsed, objective.INFEASIBLE)
+
+    if best is not None:
+        return best[0], best[1]
+    return infeasible, -1
+
+def _rebuild(graph, result):
+    if not isinstance(result, list):
+        return result
+    subgraphs = []
+    for nodes, attrs in result:
+        subgraph = graph.subgraph(nodes)
+        subgraph.graph.update(attrs)
+        subgraphs.append(subgraph)
+    return subgraphs
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
@@ -2,14 +2,11 @@
 
 import asyncio
 import os
-import yaml
+import time
 import logging
 from aio_pika import connect, IncomingMessage, ExchangeType, Message
-from .config import rabbitmq_host, input_topic, output_topic, d6g_site
-import base64
-
-# Functionality
-import library.optimization_engine as optimization_engine
+from .config import rabbitmq_host, input_topic, output_topic, prefetch_count
+from .messaging import process_request
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -19,36 +16,16 @@ def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
 async def process_message(message: IncomingMessage, message_counter):
+    # Publish time from the sent-at header (the AMQP timestamp only has whole seconds) or the
+    # timestamp property when the publisher set one, otherwise the delivery time
+    sent_at = (message.headers or {}).get("sent-at")
+    if sent_at is not None:
+        enqueued_at = float(sent_at)
+    else:
+        enqueued_at = message.timestamp.timestamp() if message.timestamp else time.time()
     try:
-        body = message.body.decode('utf-8')
-        body = base64.b64decode(body).decode('utf-8')
-        parsed_yaml = yaml.safe_load(body)
         # clear_screen()
-        # logger.info(f"Processing message {message_counter}...")
-        logger.info("Received service optimization request number:" + str(message_counter) + ", with ns instance id:" + parsed_yaml["lnsd"]["ns-instance-id"]) # parsed_yaml["local-nsd"]["info"]["ns"]["id"])
-        # logger.info(parsed_yaml)
-
-        #modified_message = f"Processed: {base64.b64decode(message.body).decode()}"
-        # modified_message = message.body
-
-        # logger.info(f"Message {message_counter} processing complete.")
-
-        # ----- Service Request -----
-
-        modified_message = optimization_engine.optimization_engine(message.body, d6g_site)
-        logger.info("Optimization Engine returned a modified service request.")
-        if modified_message == -1:
-            logger.error(f"Optimization Engine returned an error. Error during optimization pipeline.")
-            # return yaml.dumps({"Error": "Error during optimization pipeline"})
-            # modified_message = message.body
-        
-        # ----- Optimized Service Request -----
-        
-        # Manually acknowledge the message
-        await message.ack()
-
-        logger.info("Optimized request ready for dispatch.")
-        return modified_message
+        return await process_request(message.body, message.content_type, message.content_encoding, enqueued_at, message_counter)
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}")
         
@@ -62,6 +39,8 @@ async def consume_messages():
         # Connect to RabbitMQ
         connection = await connect(f"amqp://{rabbitmq_host}/")
         channel = await connection.channel()
+        # Bound the number of in-flight requests handed to the worker pool
+        await channel.set_qos(prefetch_count=prefetch_count)
 
         # Declare queues and get the default exchange
         input_queue = await channel.declare_queue(input_topic)
@@ -75,10 +54,19 @@ async def consume_messages():
             message_counter += 1
             modified_message = await process_message(message, message_counter)
             if modified_message:
-                await default_exchange.publish(
-                    Message(modified_message),
-                    routing_key=output_topic  # Provide the routing_key here
-                )
+                body, content_type, content_encoding = modified_message
+                try:
+                    # Replies go to the queue the requester asked for, tagged with its correlation id
+                    await default_exchange.publish(
+                        Message(body, content_type=content_type, content_encoding=content_encoding,
+                                correlation_id=message.correlation_id),
+                        routing_key=message.reply_to or output_topic
+                    )
+                    # Acknowledge only once the result has been handed to the broker
+                    await message.ack()
+                except Exception as e:
+                    logger.error(f"Error publishing optimized request: {str(e)}")
+                    await message.reject(requeue=False)
                 # logger.info(f"Processed message {message_counter}: {message.body.decode()}")
 
         await input_queue.consume(on_message)
@@ -0,0 +1,219 @@
+# Model and selector plugin registry
+#
+# Model Pool algorithms and Model Selectors are registered by name with a "module:function"
+# target and the capabilities they declare, and are only imported the first time they are
+# used. Besides the built-in plugins below, plugins come from Python entry points (groups
+# "d6g.optimization_engine.models" / "d6g.optimization_engine.selectors") or from the
+# configuration, where OE_MODELS / OE_SELECTOR list the enabled plugins by name and may
+# register new ones as "name=module:function".
+#
+# Plugins registered without capabilities (entry points, "name=module:function" in the
+# configuration) may declare them as a `capabilities` dict on the callable, such plugins are
+# imported at their first eligibility check so that the declaration applies from the start.
+#
+# Model capabilities:
+#   domains       (min, max) number of domains the model partitions into, max None for any
+#   functions     (min, max) number of service functions the model can handle, max None for any
+#   part_size     (min, max) number of functions per domain the model needs, max None for any
+#   resource_aware  whether the model respects site capacities (and may return -1)
+#   repair        whether the model can keep functions on the site of a previous placement (pinned={name: site})
+#   cost          relative expected run time, 1.0 is linear in the service size
+#   graph         "servicegraph" or "networkx", the graph type the model takes
+# Selectors take a {name: details} mapping of the eligible models and return a name. Selectors
+# declaring contextual=True are also given the request context (functions, links, domains),
+# selectors with an observe(model, context, seconds, quality) attribute are told how the
+# picked model performed.
+
+import importlib
+import logging
+import threading
+from importlib.metadata import entry_points
+import library.config as config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_GROUP = "d6g.optimization_engine.models"
+SELECTOR_GROUP = "d6g.optimization_engine.selectors"
+
+MODEL_DEFAULTS = {"domains": (1, None), "functions": (1, None), "part_size": (0, None), "resource_aware": False, "repair": False,
+                  "cost": 1.0, "graph": "servicegraph"}
+SELECTOR_DEFAULTS = {"contextual": False}
+
+class Plugin:
+    __slots__ = ("name", "target", "capabilities", "declared", "_loader", "_func", "_lock")
+
+    def __init__(self, name, target, capabilities, loader=None, declared=True):
+        self.name = name
+        self.target = target
+        self.capabilities = capabilities
+        # False when the capabilities are only known once the callable is imported
+        self.declared = declared
+        self._loader = loader
+        self._func = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._func is not None
+
+    def load(self):
+        if self._func is None:
+            with self._lock:
+                if self._func is None:
+                    if self._loader is not None:
+                        func = self._loader()
+                    else:
+                        module, _, attr = self.target.partition(":")
+                        func = getattr(importlib.import_module(module), attr)
+                    # Third party plugins may declare their capabilities on the callable itself
+                    self.capabilities.update(getattr(func, "capabilities", {}))
+                    logger.info("Loaded plugin %s from %s.", self.name, self.target)
+                    self._func = func
+        return self._func
+
+    def resolve(self):
+        # Imports plugins with undeclared capabilities, False when the plugin cannot be loaded
+        if self.declared or self.loaded:
+            return True
+        try:
+            self.load()
+        except Exception as e:
+            logger.error("Failed to load plugin %s from %s: %s", self.name, self.target, e)
+            return False
+        return True
+
+    def supports(self, domains, functions):
+        if not self.resolve():
+            return False
+        low, high = self.capabilities["domains"]
+        if domains < low or high is not None and domains > high:
+            return False
+        low, high = self.capabilities["functions"]
+        if functions < low or high is not None and functions > high:
+            return False
+        low, high = self.capabilities["part_size"]
+        return functions >= domains * low and (high is None or functions <= domains * high)
+
+    def details(self):
+        return {"enabled": True, **self.capabilities}
+
+    def __repr__(self):
+        return f"Plugin({self.name!r}, {self.target!r})"
+
+# Built-in plugins
+
+BUILTIN_MODELS = {
+    "autologic": ("library.model_pool.autologic:autologic", {"domains": (3, 3), "functions": (3, None), "cost": 1.0}),
+    "greedysplit": ("library.model_pool.greedysplit:greedysplit", {"domains": (3, 3), "functions": (3, None), "cost": 1.0}),
+    "partition": ("library.model_pool.partition:partition", {"part_size": (config.PARTITION_MIN_SIZE, config.PARTITION_MAX_SIZE or None), "cost": 1.0}),
+    "capacityaware": ("library.model_pool.capacityaware:capacityaware", {"resource_aware": True, "repair": True, "cost": 4.0}),
+    "multilevel": ("library.model_pool.multilevel:multilevel", {"cost": 3.0}),
+}
+
+BUILTIN_SELECTORS = {
+    "spinwheel": ("library.selector_pool.random_selection:spinwheel", {}),
+    "intelligence": ("library.selector_pool.intelligence:intelligence", {"contextual": True}),
+}
+
+def normalize(name):
+    # Accept the historical "autologic.py" / "spinwheel.py (Default)" spellings
+    name = name.strip()
+    if name.endswith(" (Default)"):
+        name = name[:-len(" (Default)")]
+    return name[:-3] if name.endswith(".py") else name
+
+class Registry:
+    def __init__(self, group, builtins, defaults):
+        self.group = group
+        self.defaults = defaults
+        self.plugins = {name: Plugin(name, target, {**defaults, **capabilities}) for name, (target, capabilities) in builtins.items()}
+        self._discovered = False
+
+    def register(self, name, target, loader=None, **capabilities):
+        plugin = Plugin(normalize(name), target, {**self.defaults, **capabilities}, loader, declared=bool(capabilities))
+        self.plugins[plugin.name] = plugin
+        return plugin
+
+    def discover(self):
+        # Entry points are only listed here, their modules are imported on first use
+        if self._discovered:
+            return
+        self._discovered = True
+        for entry_point in entry_points(group=self.group):
+            if entry_point.name not in self.plugins:
+                self.register(entry_point.name, entry_point.value, loader=entry_point.load)
+
+    def configure(self, spec):
+        # Enabled plugins from a "name,name=module:function,..." list, in order
+        enabled = []
+        for item in spec.split(","):
+            name, _, target = item.partition("=")
+            name = normalize(name)
+            if not name:
+                continue
+            if target:
+                self.register(name, target.strip())
+            elif name not in self.plugins:
+                self.discover()
+            if name not in self.plugins:
+                logger.warning("Unknown plugin %s in %s, ignoring it.", name, self.group)
+                continue
+            enabled.append(name)
+        return enabled
+
+    def get(self, name):
+        name = normalize(name)
+        if name not in self.plugins:
+            self.discover()
+        return self.plugins.get(name)
+
+models = Registry(MODEL_GROUP, BUILTIN_MODELS, MODEL_DEFAULTS)
+selectors = Registry(SELECTOR_GROUP, BUILTIN_SELECTORS, SELECTOR_DEFAULTS)
+
+enabled_models = models.configure(config.OE_MODELS)
+enabled_selectors = selectors.configure(config.OE_SELECTOR)
+
+# Pipeline hooks
+
+def eligible_models(domains, functions):
+    # Enabled models that support the number of domains and the size of the service
+    return {name: models.plugins[name].details() for name in enabled_models if models.plugins[name].supports(domains, functions)}
+
+def repair_model(domains, functions):
+    # First enabled model that supports the request and can repair a previous placement, or None
+    return next((name for name, details in eligible_models(domains, functions).items() if details["repair"]), None)
+
+def request_context(domains, functions, links=0):
+    return {"functions": functions, "links": links, "domains": domains}
+
+def _selector():
+    if not enabled_selectors:
+        raise ValueError("No model selector is enabled.")
+    return selectors.plugins[enabled_selectors[0]]
+
+def select_model(context):
+    # Name of the model to run, or None when no enabled model supports the request
+    candidates = eligible_models(context["domains"], context["functions"])
+    if not candidates:
+        return None
+    selector = _selector()
+    choose = selector.load()
+    if selector.capabilities["contextual"]:
+        return choose(candidates, context)
+    return choose(candidates)
+
+def observe(model, context, seconds, quality):
+    # Feedback for learning selectors on the run of the picked model
+    observe = getattr(_selector().load(), "observe", None)
+    if observe is not None:
+        observe(model, context, seconds, quality)
+
+def run_model(name, graph, substrate, domains, **kwargs):
+    plugin = models.get(name)
+    if plugin is None:
+        raise ValueError(f"Unknown model {name}, check Model Pool configuration.")
+    model = plugin.load()
+    if plugin.capabilities["graph"] == "networkx":
+        graph = graph.to_networkx()
+    return model(graph, substrate, domains, **kwargs)
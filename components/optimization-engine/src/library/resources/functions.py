@@ -1,29 +1,141 @@
 # Mock Demo2 Service Catalog for development
 import time
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 import requests
 import yaml
 import json
 import library.config as config
+import library.metrics as metrics
+import library.translator as translator
+import library.resources.upstream as upstream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def fetch_service_catalog_info(funtions_graph_name = "apps", data = None):
-    try:
-        url = f'http://{config.SERVICE_CATALOG_HOST}:{config.SERVICE_CATALOG_PORT}/retrieve/{funtions_graph_name}'
+# hit: served within the TTL, miss: not cached yet, revalidated: unchanged after the TTL,
+# refreshed: changed after the TTL, stale: kept because the Service Catalog could not be reached
+CACHE_LOOKUPS = metrics.REGISTRY.counter("oe_function_catalog_cache_total", "Function catalog cache lookups by result.", ["result"])
+
+# Function descriptor cache
+#
+# The parsed descriptors are kept per catalog file and revalidated against the Service
+# Catalog once their TTL expires (ETag, falling back to a content hash when no ETag is sent).
+# The Service Catalog does not notify uploads, a new catalog is picked up by the first
+# revalidation after the TTL. A single request revalidates an expired entry, concurrent
+# requests keep using it in the meantime.
+
+class FunctionCatalog:
+    def __init__(self, name, content, etag=None, digest=None):
+        self.name = name
+        self.etag = etag
+        self.digest = digest or hashlib.sha256(content.encode('utf-8')).hexdigest()
+        self.size = len(content)
+        functions = yaml.load(content, Loader=translator.YAML_LOADER)
+        self.functions = functions if isinstance(functions, dict) else {}
+        self.validated_at = time.monotonic()
+        # id -> descriptor lookup handed to request2graph
+        self.by_id = translator.index_functions(self.functions)
+
+class FunctionCatalogCache:
+    def __init__(self, ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Per catalog file, held by the request that revalidates it
+        self._refreshing = {}
+
+    def get(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+            refreshing = self._refreshing.setdefault(name, threading.Lock())
+        if entry is not None and time.monotonic() - entry.validated_at < self.ttl:
+            CACHE_LOOKUPS.inc(result="hit")
+            return entry
+        # A single caller revalidates, concurrent requests keep using the expired entry
+        if not refreshing.acquire(blocking=entry is None):
+            CACHE_LOOKUPS.inc(result="hit")
+            return entry
+        try:
+            with self._lock:
+                current = self._entries.get(name)
+            if current is not None and time.monotonic() - current.validated_at < self.ttl:
+                # Revalidated by the caller this one waited for
+                CACHE_LOOKUPS.inc(result="hit")
+                return current
+            if current is None:
+                CACHE_LOOKUPS.inc(result="miss")
+            return self._revalidate(name, current)
+        finally:
+            refreshing.release()
+
+    def invalidate(self, name=None):
+        # Drops cached catalogs, the benchmarks use it to measure cold fetches
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+        logger.info("Function catalog cache invalidated: %s", name or "all entries")
+
+    def _revalidate(self, name, entry):
+        url = f'http://{config.SERVICE_CATALOG_HOST}:{config.SERVICE_CATALOG_PORT}/retrieve/{name}'
         headers = {'accept': 'application/json'}
-        
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        # Parse the JSON response into dictionary
-        functions_info = response.json()
-        logger.info(f"Received from SC -> {functions_info}")
-        return functions_info["file_content"] if "file_content" in functions_info else None
-    except requests.RequestException as e:
-        logger.error(f"Error making request to service catalog: {e}")
-        return None
-    except yaml.YAMLError as e:
-        logger.error(f"Error parsing YAML response: {e}")
-        return None
\ No newline at end of file
+        if entry is not None and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        try:
+            response = upstream.get(url, headers=headers, upstream="catalog")
+            if response.status_code == 304 and entry is not None:
+                entry.validated_at = time.monotonic()
+                CACHE_LOOKUPS.inc(result="revalidated")
+                return entry
+            functions_info = response.json()
+            content = functions_info.get("file_content")
+            if content is None:
+                return None
+            digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            if entry is not None and entry.digest == digest:
+                entry.etag = response.headers.get('ETag')
+                entry.validated_at = time.monotonic()
+                CACHE_LOOKUPS.inc(result="revalidated")
+                return entry
+            if entry is not None:
+                CACHE_LOOKUPS.inc(result="refreshed")
+            entry = FunctionCatalog(name, content, response.headers.get('ETag'), digest)
+        except requests.RequestException as e:
+            logger.error(f"Error making request to service catalog: {e}")
+            # Serve the stale descriptors rather than failing the request
+            if entry is not None:
+                CACHE_LOOKUPS.inc(result="stale")
+            return entry
+        except yaml.YAMLError as e:
+            logger.error(f"Error parsing YAML response: {e}")
+            return None
+
+        logger.info("Function catalog %s refreshed (%d descriptors).", name, len(entry.by_id))
+        self._store(entry)
+        return entry
+
+    def _store(self, entry):
+        with self._lock:
+            self._entries[entry.name] = entry
+            self._entries.move_to_end(entry.name)
+            # Bound memory by entry count and by the size of the cached catalog files
+            while len(self._entries) > self.max_entries or (
+                    len(self._entries) > 1 and sum(e.size for e in self._entries.values()) > self.max_bytes):
+                self._entries.popitem(last=False)
+
+function_catalog_cache = FunctionCatalogCache(
+    ttl=config.FUNCTION_CATALOG_TTL,
+    max_entries=config.FUNCTION_CATALOG_MAX_ENTRIES,
+    max_bytes=config.FUNCTION_CATALOG_MAX_BYTES,
+)
+
+def get_function_catalog(funtions_graph_name = "apps.nf.yaml"):
+    return function_catalog_cache.get(funtions_graph_name)
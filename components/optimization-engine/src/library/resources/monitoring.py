@@ -2,27 +2,128 @@
 import time
 import logging
 import json
+import numpy as np
+import library.config as config
+from library.servicegraph import ServiceGraph
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def check_resources(merged_functions, site_resources):
+SITE_FIELDS = ["site-available-vcpu", "site-available-ram", "site-available-storage"]
+DEMAND_FIELDS = ["nf-vcpu", "nf-memory", "nf-storage"]
+
+def check_resources(merged_functions, site_resources, required=None):
+    # True if the service fits on any candidate site or subset of sites
+    placements = rank_placements(merged_functions, site_resources, required)
+    return bool(placements)
+
+def rank_placements(merged_functions, site_resources, required=None, limit=None):
     logger.info("Starting resource check with site_resources type: %s", type(site_resources))
-    logger.info("site_resources content: %s", site_resources)
 
     # Handle both formats: single site dict or wrapped in site-resources
     if isinstance(site_resources, dict):
         if "site-resources" in site_resources:
             # Original format: wrapped in site-resources
-            site_data = site_resources["site-resources"][0]
+            sites = site_resources["site-resources"]
         else:
             # New format: single site dictionary
-            site_data = site_resources
+            sites = [site_resources]
     else:
         logger.error("site_resources is not a dictionary: %s", type(site_resources))
-        return False
+        return []
+
+    # Calculate total required resources from all functions, unless the catalog cache already did.
+    if required is None:
+        required = dict(zip(DEMAND_FIELDS, _sum_demand(merged_functions)))
+    demand = np.array([required.get(field, 0) for field in DEMAND_FIELDS], dtype=float)
+
+    try:
+        # Validate required fields in the site data
+        for site_data in sites:
+            for field in SITE_FIELDS:
+                if field not in site_data:
+                    logger.error("Required field '%s' not found in site data. Available fields: %s", field, list(site_data.keys()))
+                    return []
+                if not isinstance(site_data[field], (int, float)):
+                    logger.error("Field '%s' is not a number: %s", field, type(site_data[field]))
+                    return []
+        site_ids = [site_data.get("site-id-ref") for site_data in sites]
+        capacity = np.array([[site_data[field] for field in SITE_FIELDS] for site_data in sites], dtype=float).reshape(-1, len(SITE_FIELDS))
+    except Exception as e:
+        logger.error("Error accessing site resources data: %s. Full site_resources: %s", str(e), site_resources)
+        return []
+
+    logger.info("Total required vCPU/RAM/Storage: %s", demand.tolist())
+    logger.info("Candidate sites: %d", len(site_ids))
+
+    placements = admit(demand, capacity, limit=limit)
+    ranked = [{"sites": [site_ids[i] for i in members], "headroom": headroom} for members, headroom in placements]
+    if ranked:
+        logger.info("Feasible placements: %d, best: %s", len(ranked), ranked[0])
+    else:
+        logger.info("No site or subset of sites can host the service.")
+    return ranked
+
+def admit(demand, capacity, limit=None, max_exhaustive_sites=None):
+    # Vectorised admission check.
+    # demand: (3,) required vcpu/ram/storage, capacity: (S, 3) available per site, ordered by preference
+    # (local site first). Returns [(site indices, headroom)], best first: fewest sites, then the
+    # nearest sites, then most headroom.
+    if limit is None:
+        limit = config.ADMISSION_MAX_PLACEMENTS
+    if max_exhaustive_sites is None:
+        max_exhaustive_sites = config.ADMISSION_MAX_EXHAUSTIVE_SITES
+    S = capacity.shape[0]
+    if S == 0:
+        return []
 
-    # Calculate total required resources from all functions.
+    if S <= max_exhaustive_sites:
+        # Every non-empty subset of sites as a bitmask row, aggregated in a single matrix product
+        masks = ((np.arange(1, 1 << S)[:, None] >> np.arange(S)) & 1).astype(bool)
+    else:
+        # Too many sites to enumerate: single sites plus the nearest-first and largest-first prefixes
+        step = np.arange(S)
+        rank = np.empty(S, dtype=np.int64)
+        rank[np.argsort(-(capacity / np.maximum(capacity.max(axis=0), 1e-9)).min(axis=1), kind="stable")] = step
+        single = np.eye(S, dtype=bool)
+        nearest = step[None, :] <= step[:, None]
+        largest = rank[None, :] <= step[:, None]
+        masks = np.concatenate([single, nearest, largest])
+
+    aggregated = masks @ capacity
+    feasible = (aggregated >= demand).all(axis=1)
+    if not feasible.any():
+        return []
+    masks, aggregated = masks[feasible], aggregated[feasible]
+
+    # Headroom: the tightest remaining fraction over all resources
+    headroom = ((aggregated - demand) / np.maximum(aggregated, 1e-9)).min(axis=1)
+    size = masks.sum(axis=1)
+    # Prefer fewer sites, then subsets with the local/nearest sites, then more headroom
+    preference = masks @ (0.5 ** np.arange(S))
+    ranked = []
+    seen = set()
+    for i in np.lexsort((-headroom, -preference, size)):
+        members = tuple(np.flatnonzero(masks[i]).tolist())
+        if members in seen:
+            continue
+        seen.add(members)
+        ranked.append((list(members), float(headroom[i])))
+        if len(ranked) >= limit:
+            break
+    return ranked
+
+def request_demand(graph):
+    # Exact demand of the requested functions, from the enriched service graph nodes
+    if isinstance(graph, ServiceGraph):
+        return graph.total_demand()
+    required = dict.fromkeys(DEMAND_FIELDS, 0.0)
+    for _, attrs in graph.nodes(data=True):
+        for field in DEMAND_FIELDS:
+            required[field] += float(attrs.get(field, 0) or 0)
+    return required
+
+def _sum_demand(merged_functions):
     total_required_vcpu = 0
     total_required_ram = 0
     total_required_storage = 0
@@ -40,53 +141,4 @@ def check_resources(merged_functions, site_resources):
             total_required_vcpu += int(func.get("nf-vcpu", 0))
             total_required_ram += int(func.get("nf-memory", 0))
             total_required_storage += int(func.get("nf-storage", 0))
-    logger.info("TODO: Remove this log")
-    # Calculate total available resources from site resources.
-    # total_available_vcpu = 0
-    # total_available_ram = 0
-    # total_available_storage = 0
-
-    # site_resources_list = site_resources.get("site-resources", [])
-    # for site in site_resources_list:
-    #     if not isinstance(site, dict):
-    #         # Log error and skip if the item is not a dictionary.
-    #         logger.error("Expected site to be a dictionary but got %s: %s", type(site), site)
-    #         continue
-    #     total_available_vcpu += int(site.get("site-available-vcpu", 0))
-    #     total_available_ram += int(site.get("site-available-ram", 0))
-    #     total_available_storage += int(site.get("site-available-storage", 0))
-
-    try:
-        logger.info("Using site data: %s", site_data)
-        
-        # Validate required fields in site_data
-        required_fields = ["site-available-vcpu", "site-available-ram", "site-available-storage"]
-        for field in required_fields:
-            if field not in site_data:
-                logger.error("Required field '%s' not found in site data. Available fields: %s", field, list(site_data.keys()))
-                return False
-            if not isinstance(site_data[field], (int, float)):
-                logger.error("Field '%s' is not a number: %s", field, type(site_data[field]))
-                return False
-
-        total_available_vcpu = site_data["site-available-vcpu"]
-        total_available_ram = site_data["site-available-ram"]
-        total_available_storage = site_data["site-available-storage"]
-    except Exception as e:
-        logger.error("Error accessing site resources data: %s. Full site_resources: %s", str(e), site_resources)
-        return False
-
-    logger.info("Total required vCPU: %s", total_required_vcpu)
-    logger.info("Total available vCPU: %s", total_available_vcpu)
-    logger.info("Total required RAM: %s", total_required_ram)
-    logger.info("Total available RAM: %s", total_available_ram)
-    logger.info("Total required Storage: %s", total_required_storage)
-    logger.info("Total available Storage: %s", total_available_storage)
-
-    # Check if available resources cover the required resources.
-    if (total_required_vcpu <= total_available_vcpu and
-        total_required_ram <= total_available_ram and
-        total_required_storage <= total_available_storage):
-        return True
-    else:
-        return False
\ No newline at end of file
+    return total_required_vcpu, total_required_ram, total_required_storage
@@ -3,40 +3,182 @@
 import networkx as nx
 import requests
 import logging
-import numpy
-import subprocess
+import threading
+import time
 import json
 import library.config as config
+import library.metrics as metrics
+import library.resources.upstream as upstream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def fetch_d6g_site_info(d6g_site):
+# hit: served within the refresh interval (or while another request refreshes), miss: first build,
+# revalidated: unchanged after the interval, refreshed: new version, stale: kept because the refresh failed
+CACHE_LOOKUPS = metrics.REGISTRY.counter("oe_topology_cache_total", "Topology snapshot cache lookups by result.", ["result"])
+
+# Topology snapshot
+#
+# The multi-site topology graph is built from the Topology module's /nodes/ and /links/
+# endpoints and kept as an immutable, versioned snapshot. Once the refresh interval
+# expires both endpoints are fetched again in full (the Topology module has no change
+# feed) and diffed against the snapshot. An unchanged topology keeps the snapshot, its
+# version and its cached site views; otherwise the changes are applied to a copy of the
+# graph, since requests in flight may still use the old snapshot, and the version is bumped.
+
+class TopologySnapshot:
+    def __init__(self, graph, version):
+        self.graph = graph
+        self.version = version
+        self.refreshed_at = time.monotonic()
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def site_view(self, d6g_site):
+        # Sites reachable from d6g_site, local site first and the rest by increasing latency
+        with self._lock:
+            view = self._views.get(d6g_site)
+        if view is None:
+            distances = nx.single_source_dijkstra_path_length(self.graph, d6g_site, weight="latency_ms")
+            sites = sorted(distances, key=lambda site: (distances[site], site != d6g_site))
+            view = (ordered_subgraph(self.graph, sites), sites)
+            with self._lock:
+                self._views[d6g_site] = view
+        return view
+
+class TopologyCache:
+    def __init__(self, refresh_interval):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.refreshed_at < self.refresh_interval:
+            CACHE_LOOKUPS.inc(result="hit")
+            return snapshot
+        # A single caller refreshes, concurrent requests keep using the current snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            CACHE_LOOKUPS.inc(result="hit")
+            return snapshot
+        try:
+            if self._snapshot is not snapshot:
+                CACHE_LOOKUPS.inc(result="hit")
+                return self._snapshot
+            try:
+                self._snapshot = self._refresh(snapshot)
+            except requests.RequestException as e:
+                if snapshot is None:
+                    raise
+                logger.error(f"Error refreshing topology, keeping version {snapshot.version}: {e}")
+                CACHE_LOOKUPS.inc(result="stale")
+                return snapshot
+            if snapshot is None:
+                CACHE_LOOKUPS.inc(result="miss")
+            else:
+                CACHE_LOOKUPS.inc(result="revalidated" if self._snapshot is snapshot else "refreshed")
+            return self._snapshot
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _refresh(self, snapshot):
+        base_url = f'http://{config.TOPOLOGY_MODULE_HOST}:{config.TOPOLOGY_MODULE_PORT}'
+        nodes = upstream.get_json(f'{base_url}/nodes/', upstream="topology").get("nodes", [])
+        links = upstream.get_json(f'{base_url}/links/', upstream="topology").get("links", [])
+
+        node_attrs = {}
+        for node in nodes:
+            node_attrs[node["site_id"]] = {
+                "cpu": node.get("cpu", 0),
+                "mem": node.get("mem", 0),
+                "storage": node.get("storage", 0),
+                "iml_endpoint": node.get("iml_endpoint"),
+            }
+        edge_attrs = {}
+        for link in links:
+            u, v = link["source"], link["destination"]
+            if u not in node_attrs or v not in node_attrs or u == v:
+                continue
+            key = (u, v) if u <= v else (v, u)
+            # Links are directional in the Topology module, keep the best direction
+            latency = float(link.get("latency_ms", 0))
+            if key not in edge_attrs or latency < edge_attrs[key]["latency_ms"]:
+                edge_attrs[key] = {"latency_ms": latency}
+
+        if snapshot is None:
+            graph = nx.Graph()
+            graph.add_nodes_from(node_attrs.items())
+            graph.add_edges_from((u, v, attrs) for (u, v), attrs in edge_attrs.items())
+            logger.info("Topology snapshot built: %d sites, %d links.", graph.number_of_nodes(), graph.number_of_edges())
+            graph.graph["version"] = 1
+            return TopologySnapshot(nx.freeze(graph), 1)
+
+        # Diff against the current snapshot, the new snapshot is a copy with the changes applied
+        old = snapshot.graph
+        removed_nodes = [n for n in old.nodes if n not in node_attrs]
+        changed_nodes = [(n, attrs) for n, attrs in node_attrs.items() if n not in old.nodes or old.nodes[n] != attrs]
+        old_edges = {(u, v) if u <= v else (v, u): attrs for u, v, attrs in old.edges(data=True)}
+        removed_edges = [key for key in old_edges if key not in edge_attrs]
+        changed_edges = [(key, attrs) for key, attrs in edge_attrs.items() if old_edges.get(key) != attrs]
 
-    # Create an empty topology graph to be populated
-    G = nx.Graph()
+        if not (removed_nodes or changed_nodes or removed_edges or changed_edges):
+            snapshot.refreshed_at = time.monotonic()
+            return snapshot
+
+        graph = nx.Graph(old)
+        graph.remove_nodes_from(removed_nodes)
+        graph.remove_edges_from(removed_edges)
+        for n, attrs in changed_nodes:
+            graph.add_node(n)
+            graph.nodes[n].clear()
+            graph.nodes[n].update(attrs)
+        for (u, v), attrs in changed_edges:
+            graph.add_edge(u, v, **attrs)
+        graph.graph["version"] = snapshot.version + 1
+        logger.info("Topology snapshot updated to version %d: %d sites and %d links changed.",
+                    snapshot.version + 1, len(removed_nodes) + len(changed_nodes), len(removed_edges) + len(changed_edges))
+        return TopologySnapshot(nx.freeze(graph), snapshot.version + 1)
+
+def ordered_subgraph(graph, sites):
+    # Subgraph of the given sites in their order (graph.subgraph() keeps the order of the graph),
+    # the models take the first sites as the preferred ones
+    view = nx.Graph()
+    view.graph.update(graph.graph)
+    view.add_nodes_from((site, graph.nodes[site]) for site in sites)
+    view.add_edges_from(graph.subgraph(sites).edges(data=True))
+    return nx.freeze(view)
+
+topology_cache = TopologyCache(refresh_interval=config.TOPOLOGY_REFRESH_INTERVAL)
+
+def get_topology_snapshot():
+    return topology_cache.get()
+
+def fetch_d6g_site_info(d6g_site):
 
     try:
-        url = f'http://{config.TOPOLOGY_MODULE_HOST}:{config.TOPOLOGY_MODULE_PORT}/nodes/{d6g_site}'
-        headers = {'accept': 'application/json'}
-        
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        
-        # Parse the JSON response into dictionary
-        site_info = response.json()
-        
-        # Store the values in a dictionary for later processing
+        snapshot = topology_cache.get()
+        if d6g_site not in snapshot.graph:
+            logger.error(f"Site {d6g_site} is not part of the topology.")
+            return None, None, None
+
+        # Only the sites reachable from the local site can take part in the placement
+        G, sites = snapshot.site_view(d6g_site)
+
+        # Store the values in a dictionary for later processing, the local site comes first
         site_data = { "site-resources": [{
-            "site-id-ref": d6g_site,
-            "site-available-vcpu": site_info.get('cpu', 0),
-            "site-available-ram": site_info.get('mem', 0),
-            "site-available-storage": site_info.get('storage', 0)
-        },]}
-        
-        logger.info(f"Successfully retrieved site info for {d6g_site}: {site_data}")
-        return G, 1, site_data
-        
+            "site-id-ref": site,
+            "site-available-vcpu": G.nodes[site].get('cpu', 0),
+            "site-available-ram": G.nodes[site].get('mem', 0),
+            "site-available-storage": G.nodes[site].get('storage', 0)
+        } for site in sites]}
+
+        logger.info(f"Successfully retrieved site info for {d6g_site}: {len(sites)} sites, topology version {snapshot.version}")
+        return G, len(sites), site_data
+
     except requests.RequestException as e:
         logger.error(f"Error making request for site {d6g_site}: {e}")
         return None, None, None
@@ -45,4 +187,4 @@ def fetch_d6g_site_info(d6g_site):
         return None, None, None
     except Exception as e:
         logger.error(f"Unexpected error getting site info for {d6g_site}: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None
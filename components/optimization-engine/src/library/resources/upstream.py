@@ -0,0 +1,102 @@
+# Pooled HTTP client for the upstream modules (Service Catalog, Topology)
+#
+# The pipeline runs synchronously in the worker pool, so the concurrent fetches use a small
+# thread pool rather than an async client. Calls made under fetch_parallel are bounded by its
+# deadline: the remaining time caps the timeouts of every request they send.
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import library.config as config
+import library.metrics as metrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPSTREAM_SECONDS = metrics.REGISTRY.histogram("oe_upstream_seconds", "Latency of upstream HTTP calls.", ["upstream"])
+UPSTREAM_ERRORS = metrics.REGISTRY.counter("oe_upstream_errors_total", "Failed upstream HTTP calls.", ["upstream"])
+
+_session = None
+_fetch_pool = None
+# Requests are handled by several threads, only one of them creates the session and the pool
+_lock = threading.Lock()
+# Deadline (time.monotonic()) of the fetch_parallel call the current pool thread runs
+_context = threading.local()
+
+def get_session():
+    # One keep-alive session shared by every request handled by this process
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                retries = Retry(total=config.UPSTREAM_RETRIES, backoff_factor=0.1, allowed_methods=["GET"], status_forcelist=[502, 503, 504])
+                adapter = HTTPAdapter(pool_connections=config.UPSTREAM_POOL_SIZE, pool_maxsize=config.UPSTREAM_POOL_SIZE, max_retries=retries)
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+def get(url, headers=None, timeout=None, upstream="other"):
+    if timeout is None:
+        timeout = (config.UPSTREAM_CONNECT_TIMEOUT, config.UPSTREAM_READ_TIMEOUT)
+    deadline = getattr(_context, "deadline", None)
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            UPSTREAM_ERRORS.inc(upstream=upstream)
+            raise requests.Timeout(f"Upstream deadline exceeded before requesting {url}")
+        timeout = tuple(min(value, remaining) for value in timeout) if isinstance(timeout, tuple) else min(timeout, remaining)
+    start = time.perf_counter()
+    try:
+        response = get_session().get(url, headers=headers or {'accept': 'application/json'}, timeout=timeout)
+        response.raise_for_status()  # Raise an exception for bad status codes
+    except requests.RequestException:
+        UPSTREAM_ERRORS.inc(upstream=upstream)
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=upstream)
+    return response
+
+def get_json(url, headers=None, timeout=None, upstream="other"):
+    return get(url, headers=headers, timeout=timeout, upstream=upstream).json()
+
+def fetch_parallel(*calls, deadline=None):
+    # Run blocking fetches concurrently and return their results in call order.
+    # A call that fails or misses the deadline yields None, like the fetchers themselves do on error.
+    global _fetch_pool
+    if _fetch_pool is None:
+        with _lock:
+            if _fetch_pool is None:
+                _fetch_pool = ThreadPoolExecutor(max_workers=config.UPSTREAM_POOL_SIZE, thread_name_prefix="oe-upstream")
+    if deadline is None:
+        deadline = config.UPSTREAM_DEADLINE
+
+    start = time.monotonic()
+    futures = [_fetch_pool.submit(_call_before, start + deadline, call) for call in calls]
+    _, pending = wait(futures, timeout=deadline)
+    results = []
+    for future in futures:
+        if future in pending:
+            # A running call stops at its next request, whose timeout ends at the deadline
+            future.cancel()
+            logger.error("Upstream call did not complete within the %.1fs deadline.", deadline)
+            results.append(None)
+        elif future.exception() is not None:
+            logger.error("Upstream call failed: %s", future.exception())
+            results.append(None)
+        else:
+            results.append(future.result())
+    logger.info("Upstream fetches completed in %.1f ms.", (time.monotonic() - start) * 1000)
+    return results
+
+def _call_before(deadline, call):
+    _context.deadline = deadline
+    try:
+        return call()
+    finally:
+        _context.deadline = None
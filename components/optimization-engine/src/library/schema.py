@@ -0,0 +1,168 @@
+# NSD schema validation
+#
+# The local-nsd/lnsd request structure is described once below and compiled into a validator
+# function at import time, so checking a request is a single walk over the document without
+# any schema interpretation. The consumer runs it before any upstream I/O and answers
+# malformed or oversized requests straight away with structured errors:
+#   [{"path": "lnsd.ns.forwarding_graphs[0].links[3]", "message": "..."}]
+
+import library.config as config
+import library.translator as translator
+
+# Stop collecting after this many errors, abusive payloads must not cost more than valid ones
+MAX_ERRORS = 20
+
+class ValidationError(Exception):
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{error['path']}: {error['message']}" for error in errors))
+        self.errors = errors
+
+class _Errors(list):
+    def add(self, path, message):
+        if len(self) >= MAX_ERRORS:
+            raise ValidationError(self)
+        self.append({"path": _render(path), "message": message})
+
+# Paths are (parent, key) chains and only rendered for errors, valid requests never format them
+def _render(path):
+    parts = []
+    while path is not None:
+        path, key = path
+        parts.append(f"[{key}]" if isinstance(key, int) else f".{key}" if parts or path is not None else key)
+    return "".join(reversed(parts)).lstrip(".")
+
+# Schema description
+
+def String(min_length=1):
+    return ("string", min_length)
+
+def Number(minimum=0):
+    return ("number", minimum)
+
+def Sequence(item, max_items=None, min_items=0):
+    return ("sequence", item, max_items, min_items)
+
+def Mapping(required=None, optional=None):
+    return ("mapping", required or {}, optional or {})
+
+RESOURCES = {"nf-vcpu": Number(), "nf-memory": Number(), "nf-storage": Number()}
+
+def _function(id_field):
+    return Mapping(required={id_field: String()}, optional=RESOURCES)
+
+CONNECTION_POINT = Mapping(required={"member-if-id-ref": String()})
+LINK = Mapping(optional={"link-id": String(), "connection-points": Sequence(CONNECTION_POINT, min_items=2),
+                         "bandwidth": Number(), "latency": Number()})
+
+def nsd_schema():
+    return Mapping(optional={
+        "network-functions": Sequence(_function("nf-instance-id"), config.NSD_MAX_FUNCTIONS),
+        "application-functions": Sequence(_function("af-instance-id"), config.NSD_MAX_FUNCTIONS),
+        "forwarding_graphs": Sequence(Mapping(optional={"links": Sequence(LINK, config.NSD_MAX_LINKS)}), config.NSD_MAX_LINKS),
+    })
+
+# Compiler
+#
+# The schema is turned into the source of one Python function with inline loops and type
+# checks (no call per element) and compiled with exec. Error paths are (parent, key) chains
+# built from the loop indices only when an error is reported.
+
+def _emit(schema, var, path, lines, depth, names):
+    pad = "    " * depth
+    kind = schema[0]
+    if kind == "string":
+        lines.append(f"{pad}if not isinstance({var}, str):")
+        lines.append(f"{pad}    errors.add({path}, 'expected a string, got ' + type({var}).__name__)")
+        lines.append(f"{pad}elif len({var}) < {schema[1]}:")
+        lines.append(f"{pad}    errors.add({path}, 'must not be empty')")
+    elif kind == "number":
+        lines.append(f"{pad}if isinstance({var}, bool) or not isinstance({var}, (int, float)):")
+        lines.append(f"{pad}    errors.add({path}, 'expected a number, got ' + type({var}).__name__)")
+        lines.append(f"{pad}elif {var} < {schema[1]!r}:")
+        lines.append(f"{pad}    errors.add({path}, 'must be at least {schema[1]}')")
+    elif kind == "sequence":
+        item, max_items, min_items = schema[1], schema[2], schema[3]
+        index, element = f"i{len(names)}", f"e{len(names)}"
+        names.append(index)
+        lines.append(f"{pad}if not isinstance({var}, list):")
+        lines.append(f"{pad}    errors.add({path}, 'expected a list, got ' + type({var}).__name__)")
+        if max_items is not None:
+            lines.append(f"{pad}elif len({var}) > {max_items}:")
+            lines.append(f"{pad}    errors.add({path}, 'has %d items, at most {max_items} are allowed' % len({var}))")
+        lines.append(f"{pad}else:")
+        if min_items:
+            lines.append(f"{pad}    if len({var}) < {min_items}:")
+            lines.append(f"{pad}        errors.add({path}, 'needs at least {min_items} items')")
+        lines.append(f"{pad}    for {index}, {element} in enumerate({var}):")
+        _emit(item, element, f"({path}, {index})", lines, depth + 2, names)
+    elif kind == "mapping":
+        lines.append(f"{pad}if not isinstance({var}, dict):")
+        lines.append(f"{pad}    errors.add({path}, 'expected a mapping, got ' + type({var}).__name__)")
+        lines.append(f"{pad}else:")
+        lines.append(f"{pad}    pass")
+        for key, sub in schema[1].items():
+            value = f"v{len(names)}"
+            names.append(value)
+            lines.append(f"{pad}    if {key!r} not in {var}:")
+            lines.append(f"{pad}        errors.add(({path}, {key!r}), 'is required')")
+            lines.append(f"{pad}    else:")
+            lines.append(f"{pad}        {value} = {var}[{key!r}]")
+            _emit(sub, value, f"({path}, {key!r})", lines, depth + 2, names)
+        for key, sub in schema[2].items():
+            value = f"v{len(names)}"
+            names.append(value)
+            # Missing and null sections are treated as empty, as the translator does
+            lines.append(f"{pad}    {value} = {var}.get({key!r})")
+            lines.append(f"{pad}    if {value} is not None:")
+            _emit(sub, value, f"({path}, {key!r})", lines, depth + 2, names)
+    else:
+        raise ValueError(f"Unknown schema kind: {kind}")
+
+def compile_schema(schema):
+    lines = ["def validate(value, path, errors):"]
+    _emit(schema, "value", "path", lines, 1, [])
+    namespace = {}
+    exec(compile("\n".join(lines), "<nsd schema>", "exec"), namespace)
+    return namespace["validate"]
+
+_validate_nsd = compile_schema(nsd_schema())
+
+# Entry points
+
+def check_size(body):
+    if len(body) > config.REQUEST_MAX_BYTES:
+        return [{"path": "", "message": f"request is {len(body)} bytes, at most {config.REQUEST_MAX_BYTES} are allowed"}]
+    return []
+
+def validate_request(service):
+    # Structured errors of a parsed service request, empty if it is valid. Malformed shapes of
+    # any kind are reported, never raised, so the requester always gets an answer.
+    errors = _Errors()
+    try:
+        if not isinstance(service, dict):
+            errors.add(None, f"expected a mapping, got {type(service).__name__}")
+            return errors
+        # The wrapper is checked before the translator walks into it
+        for key in ("local-nsd", "lnsd"):
+            if key in service:
+                if not isinstance(service[key], dict):
+                    errors.add((None, key), f"expected a mapping, got {type(service[key]).__name__}")
+                    return errors
+                ns = service[key].get("ns")
+                if ns is not None and not isinstance(ns, dict):
+                    errors.add(((None, key), "ns"), f"expected a mapping, got {type(ns).__name__}")
+                    return errors
+                break
+        path = translator.nsd_path(service)
+        nsd = translator.find_nsd(service)
+        _validate_nsd(nsd, (None, ".".join(path) or "nsd"), errors)
+        # Repeated function ids are allowed, the translator merges them into one function
+        # (the later entry updates the earlier one)
+    except ValidationError:
+        pass
+    return errors
+
+def error_payload(errors):
+    summary = "; ".join(f"{error['path']}: {error['message']}" if error["path"] else error["message"] for error in errors[:3])
+    return {"Error": "Invalid service request: " + summary,
+            "errors": list(errors)}
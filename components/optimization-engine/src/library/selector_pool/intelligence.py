@@ -0,0 +1,138 @@
+# Performance-learning model selection
+# v1.0
+
+# Explanation:
+# - Size Classes: Requests are bucketed by their number of functions (<=16, <=128, <=1024, larger), models behave very differently across sizes.
+# - Observe: After every run the wall-clock time and the placement quality (objective.py: feasibility, cut weight, balance) of the picked model are recorded for the size class.
+# - Reward: (1 - w) * quality score + w * latency score, with the latency score 1 / (1 + seconds / SELECTOR_LATENCY_TARGET) and w = SELECTOR_LATENCY_WEIGHT. Infeasible placements score 0.
+# - Pick (UCB1): Models not tried yet in the class first, then the model with the highest mean reward plus an exploration bonus that shrinks as the model is tried more often.
+# - Persist: Statistics are kept as sums (count, reward, seconds, cut, imbalance, feasible), so updating is O(1) and the deltas of several worker processes merge by addition. They are flushed to SELECTOR_STATS_PATH at most every SELECTOR_STATS_FLUSH_INTERVAL seconds and at exit, under an exclusive lock on SELECTOR_STATS_PATH.lock so the read-merge-write of concurrent processes does not lose deltas.
+
+# Modules
+import atexit
+import fcntl
+import json
+import logging
+import math
+import os
+import threading
+import time
+import library.config as config
+
+logger = logging.getLogger(__name__)
+
+SIZE_CLASSES = (16, 128, 1024)
+FIELDS = ("count", "reward", "seconds", "cut", "imbalance", "feasible")
+
+_lock = threading.Lock()
+_stats = None
+_pending = {}
+_last_flush = 0.0
+
+def size_class(functions):
+    for bound in SIZE_CLASSES:
+        if functions <= bound:
+            return f"<={bound}"
+    return f">{SIZE_CLASSES[-1]}"
+
+def reward(seconds, quality):
+    latency_score = 1.0 / (1.0 + seconds / config.SELECTOR_LATENCY_TARGET)
+    w = config.SELECTOR_LATENCY_WEIGHT
+    return (1.0 - w) * quality.score + w * latency_score if quality.feasible else 0.0
+
+# Statistics
+
+def _load():
+    path = config.SELECTOR_STATS_PATH
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Failed to load model selector statistics from %s: %s", path, e)
+        return {}
+
+def _statistics():
+    global _stats
+    if _stats is None:
+        _stats = _load()
+    return _stats
+
+def _add(table, cls, model, delta):
+    row = table.setdefault(cls, {}).setdefault(model, dict.fromkeys(FIELDS, 0.0))
+    for field in FIELDS:
+        row[field] = row.get(field, 0.0) + delta[field]
+
+def flush():
+    # Merge this process' deltas into the statistics file (written atomically)
+    global _pending, _last_flush
+    path = config.SELECTOR_STATS_PATH
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.monotonic()
+    if not path or not pending:
+        return
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # flock locks the open file, so threads of this process exclude each other as well
+        with open(f"{path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stored = _load()
+            for cls, rows in pending.items():
+                for model, delta in rows.items():
+                    _add(stored, cls, model, delta)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(stored, f, separators=(",", ":"))
+            os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Failed to persist model selector statistics to %s: %s", path, e)
+
+atexit.register(flush)
+
+def observe(model, context, seconds, quality):
+    cls = size_class(context["functions"])
+    delta = {"count": 1.0, "reward": reward(seconds, quality), "seconds": seconds,
+             "cut": quality.cut_fraction, "imbalance": quality.imbalance, "feasible": 1.0 if quality.feasible else 0.0}
+    with _lock:
+        _add(_statistics(), cls, model, delta)
+        _add(_pending, cls, model, delta)
+        due = time.monotonic() - _last_flush >= config.SELECTOR_STATS_FLUSH_INTERVAL
+    if due:
+        flush()
+
+def summary():
+    # Mean values per size class and model, e.g. for logs and debugging
+    with _lock:
+        return {cls: {model: {field: row[field] / row["count"] for field in FIELDS if field != "count"} | {"count": row["count"]}
+                      for model, row in rows.items() if row["count"]}
+                for cls, rows in _statistics().items()}
+
+# MAIN
+def intelligence(models, context):
+
+    # Filter the enabled algorithms
+    enabled_models = [name for name, details in models.items() if details["enabled"]]
+
+    if not enabled_models:
+        raise ValueError("No algorithms are enabled.")
+
+    with _lock:
+        rows = _statistics().get(size_class(context["functions"]), {})
+        counts = {name: rows[name]["count"] if name in rows else 0.0 for name in enabled_models}
+
+        # Try every model once in this size class
+        untried = [name for name in enabled_models if counts[name] == 0]
+        if untried:
+            return untried[0]
+
+        # UCB1 over the mean rewards
+        total = sum(counts.values())
+        return max(enabled_models, key=lambda name: rows[name]["reward"] / counts[name]
+                   + config.SELECTOR_EXPLORATION * math.sqrt(2.0 * math.log(total) / counts[name]))
+
+intelligence.capabilities = {"contextual": True}
+intelligence.observe = observe
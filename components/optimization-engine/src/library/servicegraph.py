@@ -0,0 +1,180 @@
+# Compact Service Graph
+#
+# Array backed representation of a service request for the translator and the model pool.
+# Functions get integer ids in request order, each keeps a __slots__ record that references
+# the NSD entry and the catalog descriptor instead of copying them, the resource demands are
+# NumPy columns and the adjacency is kept in CSR arrays (indptr/indices). The node data of
+# nodes(data=True) and to_networkx() is the NSD entry alone, catalog descriptor fields only
+# reach the demand columns and never the encoded reply.
+#
+# The class mimics the parts of the networkx API the pipeline relies on (nodes(), edges(),
+# subgraph(), .graph) and converts to and from networkx for models that need the full API.
+
+import networkx as nx
+import numpy as np
+
+DEMAND_FIELDS = ("nf-vcpu", "nf-memory", "nf-storage")
+
+class FunctionRecord:
+    __slots__ = ("name", "kind", "function", "descriptor")
+
+    def __init__(self, name, kind, function, descriptor=None):
+        self.name = name
+        self.kind = kind
+        self.function = function
+        self.descriptor = descriptor
+
+    def get(self, key, default=None):
+        if key in self.function:
+            return self.function[key]
+        if self.descriptor and key in self.descriptor:
+            return self.descriptor[key]
+        return default
+
+class ServiceGraph:
+    __slots__ = ("records", "index", "demand", "edge_u", "edge_v", "edge_weight", "edge_ids",
+                 "indptr", "indices", "edge_of", "graph")
+
+    def __init__(self, records, demand, edge_u, edge_v, edge_weight=None, edge_ids=None, graph=None):
+        n = len(records)
+        self.records = records
+        self.index = {record.name: i for i, record in enumerate(records)}
+        self.demand = np.asarray(demand, dtype=float).reshape(n, len(DEMAND_FIELDS))
+        # 32-bit ids halve the adjacency footprint, services stay far below 2**31 functions
+        self.edge_u = np.asarray(edge_u, dtype=np.int32)
+        self.edge_v = np.asarray(edge_v, dtype=np.int32)
+        m = len(self.edge_u)
+        self.edge_weight = np.ones(m) if edge_weight is None else np.asarray(edge_weight, dtype=float)
+        self.edge_ids = [None] * m if edge_ids is None else edge_ids
+        self.graph = {} if graph is None else graph
+
+        # Symmetric CSR adjacency, self loops are edges but not neighbours
+        loop = self.edge_u == self.edge_v
+        eid = np.flatnonzero(~loop).astype(np.int32)
+        src = np.concatenate([self.edge_u[eid], self.edge_v[eid]])
+        dst = np.concatenate([self.edge_v[eid], self.edge_u[eid]])
+        eid = np.concatenate([eid, eid])
+        order = np.argsort(src, kind="stable")
+        self.indices = dst[order]
+        self.edge_of = eid[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=self.indptr[1:])
+
+    # Builders
+
+    @classmethod
+    def from_edges(cls, records, demand, edges, graph=None):
+        # edges: iterable of (u, v, link id, weight) with integer endpoints. Repeated pairs are
+        # merged and the last link id kept, like nx.Graph.add_edge does, their weights add up.
+        pairs = {}
+        weights = {}
+        for u, v, link_id, weight in edges:
+            pair = (u, v) if u <= v else (v, u)
+            pairs[pair] = link_id
+            weights[pair] = weights.get(pair, 0.0) + weight
+        edge_u = np.fromiter((u for u, _ in pairs), dtype=np.int32, count=len(pairs))
+        edge_v = np.fromiter((v for _, v in pairs), dtype=np.int32, count=len(pairs))
+        edge_weight = np.fromiter(weights.values(), dtype=float, count=len(weights))
+        return cls(records, demand, edge_u, edge_v, edge_weight, list(pairs.values()), graph)
+
+    @classmethod
+    def from_networkx(cls, G):
+        if isinstance(G, cls):
+            return G
+        records = []
+        demand = np.zeros((G.number_of_nodes(), len(DEMAND_FIELDS)))
+        for i, (node, attrs) in enumerate(G.nodes(data=True)):
+            kind = "nf" if "nf-instance-id" in attrs else "af" if "af-instance-id" in attrs else None
+            records.append(FunctionRecord(node, kind, attrs))
+            demand[i] = [float(attrs.get(field, 0) or 0) for field in DEMAND_FIELDS]
+        index = {record.name: i for i, record in enumerate(records)}
+        edges = list(G.edges(data=True))
+        edge_u = [index[u] for u, _, _ in edges]
+        edge_v = [index[v] for _, v, _ in edges]
+        edge_weight = [float(attrs.get("weight", attrs.get("bandwidth", 1.0))) for _, _, attrs in edges]
+        edge_ids = [attrs.get("link_id") for _, _, attrs in edges]
+        return cls(records, demand, edge_u, edge_v, edge_weight, edge_ids, dict(G.graph))
+
+    def to_networkx(self):
+        G = nx.Graph()
+        G.graph.update(self.graph)
+        G.add_nodes_from((record.name, record.function) for record in self.records)
+        for u, v, w, link_id in zip(self.edge_u.tolist(), self.edge_v.tolist(), self.edge_weight.tolist(), self.edge_ids):
+            attrs = {} if link_id is None else {"link_id": link_id}
+            if w != 1.0:
+                attrs["weight"] = w
+            G.add_edge(self.records[u].name, self.records[v].name, **attrs)
+        return G
+
+    # networkx compatible accessors
+
+    def number_of_nodes(self):
+        return len(self.records)
+
+    def number_of_edges(self):
+        return len(self.edge_u)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return (record.name for record in self.records)
+
+    def __contains__(self, node):
+        return node in self.index
+
+    def nodes(self, data=False):
+        if data:
+            # The NSD entries themselves, catalog fields only reach the demand columns
+            return [(record.name, record.function) for record in self.records]
+        return [record.name for record in self.records]
+
+    def edges(self, data=False):
+        names = [record.name for record in self.records]
+        pairs = zip(self.edge_u.tolist(), self.edge_v.tolist())
+        if data:
+            return [(names[u], names[v], {"link_id": link_id} if link_id is not None else {})
+                    for (u, v), link_id in zip(pairs, self.edge_ids)]
+        return [(names[u], names[v]) for u, v in pairs]
+
+    def neighbors(self, i):
+        # Integer ids of the neighbours of function i
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def bfs_order(self, starts=None):
+        # Integer ids in breadth-first order, every component from its first function in starts
+        n = len(self.records)
+        indptr, indices = self.indptr, self.indices
+        order = []
+        seen = np.zeros(n, dtype=bool)
+        for start in (range(n) if starts is None else starts):
+            if seen[start]:
+                continue
+            seen[start] = True
+            queue = [start]
+            for i in queue:
+                for j in indices[indptr[i]:indptr[i + 1]].tolist():
+                    if not seen[j]:
+                        seen[j] = True
+                        queue.append(j)
+            order.extend(queue)
+        return order
+
+    def subgraph(self, nodes):
+        return self.take([self.index[node] for node in nodes if node in self.index])
+
+    def take(self, ids):
+        # Induced subgraph on the given integer ids, renumbered in the given order
+        ids = np.asarray(ids, dtype=np.int64)
+        mapping = np.full(len(self.records), -1, dtype=np.int64)
+        mapping[ids] = np.arange(len(ids))
+        keep = np.flatnonzero((mapping[self.edge_u] >= 0) & (mapping[self.edge_v] >= 0))
+        return ServiceGraph([self.records[i] for i in ids.tolist()], self.demand[ids],
+                            mapping[self.edge_u[keep]], mapping[self.edge_v[keep]], self.edge_weight[keep],
+                            [self.edge_ids[e] for e in keep.tolist()], dict(self.graph))
+
+    def total_demand(self):
+        return dict(zip(DEMAND_FIELDS, self.demand.sum(axis=0).tolist()))
+
+    def __repr__(self):
+        return f"ServiceGraph with {len(self.records)} nodes and {len(self.edge_u)} edges"
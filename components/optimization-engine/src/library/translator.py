@@ -2,93 +2,188 @@
 # Port from Dr. Anestis Dalgkitsis work
 # v2.1
 
-import networkx as nx
+import numpy as np
 import yaml
 import json
 import logging
 import base64
 import binascii
+import datetime
+import re
+from types import MappingProxyType
+from library.servicegraph import ServiceGraph, FunctionRecord, DEMAND_FIELDS
+import library.config as config
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def service2dict(service: bytes | str):
-    data = ""
-    if isinstance(service, bytes):
-        data = service.decode('utf-8')
-    elif isinstance(service, str):
-        data = service
-    try:
-        data = base64.b64decode(data).decode('utf-8')
-    except (binascii.Error, UnicodeDecodeError):
-        logger.info("Data is not base64 encoded")
-    if data == "":
+# libyaml is several times faster on large descriptors, fall back to the pure Python loader
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+FUNCTION_KEYS = ("network-functions", "application-functions", "forwarding_graphs")
+
+BASE64_RE = re.compile(rb"[A-Za-z0-9+/]+={0,2}")
+
+class DemandError(ValueError):
+    # Resource demands that are not numbers, as [{"path": "<function id>.<field>", "message": "..."}]
+    def __init__(self, errors):
+        super().__init__("; ".join(f"{error['path']}: {error['message']}" for error in errors))
+        self.errors = errors
+
+class RequestEnvelope:
+    # A service request decoded once at the consumer and handed through every stage.
+    # raw keeps the body as received (the single-site shortcut relays it untouched),
+    # encoding/format record what was detected and service holds the parsed document.
+    # Plain attributes only, so the envelope pickles into process pool workers.
+    __slots__ = ("raw", "encoding", "format", "service")
+
+    def __init__(self, raw, encoding, format, service):
+        self.raw = raw
+        self.encoding = encoding
+        self.format = format
+        self.service = service
+
+    def __getstate__(self):
+        return (self.raw, self.encoding, self.format, self.service)
+
+    def __setstate__(self, state):
+        self.raw, self.encoding, self.format, self.service = state
+
+    @property
+    def instance_id(self):
+        if not isinstance(self.service, dict):
+            return None
+        wrapper = self.service.get("local-nsd", self.service.get("lnsd", self.service))
+        return wrapper.get("ns-instance-id") if isinstance(wrapper, dict) else None
+
+def parse_request(service: bytes | str | RequestEnvelope):
+    if isinstance(service, RequestEnvelope):
+        return service
+    if isinstance(service, str):
+        raw = service.encode('utf-8')
+    elif isinstance(service, (bytes, bytearray)):
+        raw = bytes(service)
+    else:
         raise ValueError("service variable is not str or bytes type.")
+
+    # Detect the encoding and the format from the content instead of trying every parser
+    payload = raw.strip()
+    if not payload:
+        raise ValueError("service variable is empty.")
+    encoding = "plain"
+    text = None
+    # Wrapped base64 (e.g. 76 character lines) is still base64
+    compact = b"".join(payload.split()) if payload[:1] not in (b"{", b"[") else b""
+    if compact and len(compact) % 4 == 0 and BASE64_RE.fullmatch(compact):
+        try:
+            text = base64.b64decode(compact, validate=True).decode('utf-8').strip()
+            encoding = "base64"
+        except (binascii.Error, UnicodeDecodeError):
+            logger.info("Data is not base64 encoded")
+    if text is None:
+        try:
+            text = payload.decode('utf-8')
+        except UnicodeDecodeError:
+            raise ValueError("Data is not valid UTF-8.")
+
+    if text[:1] in ("{", "["):
+        try:
+            return RequestEnvelope(raw, encoding, "json", json.loads(text))
+        except json.JSONDecodeError:
+            # Flow style YAML also starts with a bracket
+            pass
     try:
-        return json.loads(data)
-    except (json.JSONDecodeError, UnicodeDecodeError):
-        pass
-    try:
-        return yaml.safe_load(data)
-    except (yaml.YAMLError, UnicodeDecodeError):
+        return RequestEnvelope(raw, encoding, "yaml", yaml.load(text, Loader=YAML_LOADER))
+    except yaml.YAMLError:
         pass
     raise ValueError("Data is not valid JSON or YAML format.")
-    
-def request2graph(service, functions):       
+
+def service2dict(service: bytes | str | RequestEnvelope):
+    return parse_request(service).service
+
+def nsd_path(service):
+    # Keys leading from the service document to the NSD that lists the functions
+    path = []
+    # If the service is wrapped under a key (like "local-nsd" or "lnsd"), extract it.
+    for key in ("local-nsd", "lnsd"):
+        if key in service:
+            path.append(key)
+            break
+    nsd = service[path[0]] if path else service
+    # lnsd descriptors nest the functions under their "ns" section
+    if "network-functions" not in nsd and "application-functions" not in nsd and isinstance(nsd.get("ns"), dict):
+        path.append("ns")
+    return tuple(path)
+
+def find_nsd(service):
+    nsd = service
+    for key in nsd_path(service):
+        nsd = nsd[key]
+    return nsd
+
+def index_functions(functions):
+    # Function info lookup keyed by nf-instance-id/af-instance-id
+    index = {}
+    for nf in functions.get("network-functions", []) or []:
+        if isinstance(nf, dict) and nf.get("nf-instance-id"):
+            index[nf["nf-instance-id"]] = nf
+    for af in functions.get("application-functions", []) or []:
+        if isinstance(af, dict) and af.get("af-instance-id"):
+            index[af["af-instance-id"]] = af
+    return index
+
+def request2graph(service, functions, index=None):
+    # Returns the compact ServiceGraph of the request (see library/servicegraph.py), use
+    # to_networkx() where the full networkx API is needed. Raises DemandError when the demand
+    # of a requested function (from the request or its catalog descriptor) is not a number.
     try:
         service = service2dict(service)
-        # If the service is wrapped under a key (like "lnsd"), extract it.
-        logger.info("Service content: %s", service)
-        
-        nsd = service.get("local-nsd", service)
+        logger.debug("Service content: %s", service)
         
-        # Create an empty undirected graph.
-        G = nx.Graph()
+        nsd = find_nsd(service)
         
         # Extract nodes from network-functions and application-functions.
-        network_functions = nsd.get("network-functions", [])
-        application_functions = nsd.get("application-functions", [])
-
-        # Function info Lookups.
-        # additional_nf = {
-        #     nf.get("nf-instance-id"): nf 
-        #     for nf in functions.get("network-functions", []) if nf.get("nf-instance-id")
-        # }
-        # additional_af = {
-        #     af.get("af-instance-id"): af 
-        #     for af in functions.get("application-functions", []) if af.get("af-instance-id")
-        # }
-        
-        # Add network function nodes.
-        for nf in network_functions:
-            node_id = nf.get("nf-instance-id")
-            if node_id:
-                # node_data = nf.copy()
-                # if node_id in additional_nf:
-                #     node_data = merge_missing(node_data, additional_nf[node_id])
-                # G.add_node(node_id, **node_data)
-                G.add_node(node_id, **nf)
-                logger.info("nf node added in graph:': %s", node_id)
-                # logger.info("nf node added in graph:': %s: %s", node_id, node_data)
-            else:
-                logger.info("Network function missing 'nf-instance-id': %s", nf)
-        
-        # Add application function nodes.
-        for af in application_functions:
-            node_id = af.get("af-instance-id")
-            if node_id:
-                # node_data = af.copy()
-                # if node_id in additional_af:
-                #     node_data = merge_missing(node_data, additional_af[node_id])
-                # G.add_node(node_id, **node_data)
-                G.add_node(node_id, **af)
-                logger.info("af node added in graph:': %s", node_id)
-                # logger.info("af node added in graph:': %s: %s", node_id, node_data)
-            else:
-                logger.info("Application function missing 'af-instance-id': %s", af)
+        network_functions = nsd.get("network-functions", []) or []
+        application_functions = nsd.get("application-functions", []) or []
+
+        # Function info Lookups, the function catalog cache keeps this index prebuilt.
+        if index is None:
+            index = index_functions(functions or {})
+
+        # Function records reference the NSD entry and the catalog descriptor of the same id, nothing is copied.
+        records = []
+        positions = {}
+        for kind, id_field, entries in (("nf", "nf-instance-id", network_functions), ("af", "af-instance-id", application_functions)):
+            for entry in entries:
+                node_id = entry.get(id_field)
+                if not node_id:
+                    logger.info("%s function missing '%s': %s", "Network" if kind == "nf" else "Application", id_field, entry)
+                    continue
+                if node_id in positions:
+                    # A repeated id updates the function, as adding the same node twice to a graph does
+                    record = records[positions[node_id]]
+                    record.function = {**record.function, **entry}
+                    continue
+                positions[node_id] = len(records)
+                records.append(FunctionRecord(node_id, kind, entry, index.get(node_id)))
+                logger.debug("%s node added in graph:': %s", kind, node_id)
+
+        # Demand columns, the NSD values take precedence over the catalog descriptor.
+        demand = np.zeros((len(records), len(DEMAND_FIELDS)))
+        errors = []
+        for i, record in enumerate(records):
+            for j, field in enumerate(DEMAND_FIELDS):
+                value = record.get(field, 0) or 0
+                try:
+                    demand[i, j] = float(value)
+                except (TypeError, ValueError):
+                    errors.append({"path": f"{record.name}.{field}", "message": f"{value!r} is not a number"})
+        if errors:
+            raise DemandError(errors)
         
         # Process forwarding_graphs to add edges between nodes.
-        forwarding_graphs = nsd.get("forwarding_graphs", [])
+        edges = []
+        forwarding_graphs = nsd.get("forwarding_graphs", []) or []
         for fg in forwarding_graphs:
             links = fg.get("links", [])
             for link in links:
@@ -96,96 +191,144 @@ def request2graph(service, functions):
                 if len(connection_points) < 2:
                     logger.info("Link '%s' has less than 2 connection points.", link.get("link-id", "unknown"))
                     continue
-                # Extract the first two connection points.
-                cp1 = connection_points[0]
-                cp2 = connection_points[1]
-                # Extract node identifiers by splitting on ':'.
-                ref1 = cp1.get("member-if-id-ref", "")
-                ref2 = cp2.get("member-if-id-ref", "")
-                node1_id = ref1.split(":")[0] if ref1 else None
-                node2_id = ref2.split(":")[0] if ref2 else None
+                # Extract node identifiers from the first two connection points by splitting on ':'.
+                ref1 = connection_points[0].get("member-if-id-ref", "")
+                ref2 = connection_points[1].get("member-if-id-ref", "")
+                node1 = positions.get(ref1.split(":")[0]) if ref1 else None
+                node2 = positions.get(ref2.split(":")[0]) if ref2 else None
                 
                 # Check if both nodes exist in the graph before adding the edge.
-                if node1_id in G.nodes and node2_id in G.nodes:
-                    G.add_edge(node1_id, node2_id, link_id=link.get("link-id"))
+                if node1 is not None and node2 is not None:
+                    edges.append((node1, node2, link.get("link-id"), link_weight(link)))
                 else:
-                    logger.info("Skipping edge for link '%s': Node '%s' or '%s' not found in functions.", link.get("link-id", "unknown"), node1_id, node2_id)
+                    logger.info("Skipping edge for link '%s': Node '%s' or '%s' not found in functions.", link.get("link-id", "unknown"), ref1, ref2)
+
+        G = ServiceGraph.from_edges(records, demand, edges)
         
         # Store the rest of the information as decorations.
-        decorations = {key: value for key, value in nsd.items() if key not in ["network-functions", "application-functions", "forwarding_graphs"]}
+        decorations = {key: value for key, value in nsd.items() if key not in FUNCTION_KEYS}
 
         return G, decorations
     
+    except DemandError:
+        raise
     except Exception as e:
         logger.info("Error in request2graph: %s", e)
         return None, None
     
+def link_weight(link):
+    # Traffic weight of a link for the partitioners: its bandwidth (1 if not annotated), scaled up
+    # for latency bounds tighter than LINK_LATENCY_REFERENCE_MS so such links are rarely cut
+    weight = float(link.get("bandwidth") or 1.0)
+    latency = float(link.get("latency") or 0.0)
+    if latency > 0:
+        weight *= max(1.0, config.LINK_LATENCY_REFERENCE_MS / latency)
+    return weight
+
 def graph2request(graph, data={}):
-    nsd = None
+    requests = graphs2requests([graph], data)
+    return requests[0] if requests else None
+
+def graphs2requests(subgraphs, data):
+    # Encode every subgraph of a partitioned service in one pass. The request is parsed once and
+    # everything but the function lists and forwarding graphs is frozen and shared by all the
+    # per-site NSDs, which keep the wrapping of the original request (local-nsd, lnsd or lnsd.ns).
     try:
         # If data is bytes, decode and convert it to a dictionary.
-        if isinstance(data, bytes):
+        if isinstance(data, (bytes, str, RequestEnvelope)):
             try:
-                # Assuming the bytes object contains JSON data:
-                data = json.loads(data.decode("utf-8"))
-            except json.JSONDecodeError as json_err:
-                logger.info("Data provided is not valid JSON: %s", json_err)
+                # The raw request may be base64 encoded JSON or YAML, as in request2graph
+                data = service2dict(data)
+            except ValueError as err:
+                logger.info("Data provided is not valid JSON or YAML: %s", err)
                 return None
 
-        if "local-nsd" in data:
-            service = data.copy()
-        else:
-            service = {"local-nsd": {}}
-            service["local-nsd"].update(data)
-
-        nsd = service["local-nsd"]
-
-        # Initialize lists for network-functions and application-functions.
-        nsd["network-functions"] = []
-        nsd["application-functions"] = []
-
-        # Process each node in the graph.
-        for node, attrs in graph.nodes(data=True):
-            if "nf-instance-id" in attrs:
-                # Append the full attribute dict for network functions.
-                nsd["network-functions"].append(attrs)
-            elif "af-instance-id" in attrs:
-                # Append the full attribute dict for application functions.
-                nsd["application-functions"].append(attrs)
-            else:
-                logger.info("Node '%s' does not have a valid function identifier.", node)
-
-        # Process graph edges into a single forwarding graph.
-        links = []
-        for u, v, edge_attrs in graph.edges(data=True):
-            # Use the provided link_id or generate a default one.
-            link_id = edge_attrs.get("link_id", f"{u}-{v}")
-            # Build a link with two connection points.
-            link = {
-                "link-id": link_id,
-                "connection-points": [
-                    {"member-connection-point-index": 1, "member-if-id-ref": u},
-                    {"member-connection-point-index": 2, "member-if-id-ref": v}
-                ]
-            }
-            links.append(link)
-
-        # Create a default forwarding graph segment.
-        nsd["forwarding_graphs"] = [{
-            "member-graph-index": 1,
-            "graph-name": "default",
-            "links": links,
-            "site-delay-budget": "0ms"
-        }]
+        path = nsd_path(data)
+        if not path:
+            # A bare NSD is returned under local-nsd
+            data, path = {"local-nsd": data}, ("local-nsd",)
+        # Shared, read-only decorations of every level from the document down to the NSD
+        levels = []
+        level = data
+        for key in path:
+            # The path key stays in place (as None) to keep the original key order
+            levels.append((freeze({k: (None if k == key else v) for k, v in level.items()}), key))
+            level = level[key]
+        decorations = freeze({k: v for k, v in level.items() if k not in FUNCTION_KEYS})
 
-        return service
+        requests = []
+        for subgraph in subgraphs:
+            network_functions = []
+            application_functions = []
+            # Process each node in the subgraph, the node attributes are shared and not copied.
+            for node, attrs in subgraph.nodes(data=True):
+                if "nf-instance-id" in attrs:
+                    network_functions.append(attrs)
+                elif "af-instance-id" in attrs:
+                    application_functions.append(attrs)
+                else:
+                    logger.info("Node '%s' does not have a valid function identifier.", node)
+
+            # Process subgraph edges into a single forwarding graph.
+            links = []
+            for u, v, edge_attrs in subgraph.edges(data=True):
+                # Use the provided link_id or generate a default one.
+                links.append({
+                    "link-id": edge_attrs.get("link_id", f"{u}-{v}"),
+                    "connection-points": [
+                        {"member-connection-point-index": 1, "member-if-id-ref": u},
+                        {"member-connection-point-index": 2, "member-if-id-ref": v}
+                    ]
+                })
+
+            nsd = dict(decorations)
+            nsd["network-functions"] = network_functions
+            nsd["application-functions"] = application_functions
+            # Create a default forwarding graph segment.
+            nsd["forwarding_graphs"] = [{
+                "member-graph-index": 1,
+                "graph-name": "default",
+                "links": links,
+                "site-delay-budget": "0ms"
+            }]
+
+            # Re-wrap the NSD, only the containers on the path are new objects
+            service = nsd
+            for shared, key in reversed(levels):
+                service = {k: (service if k == key else shared[k]) for k in shared}
+            requests.append(service)
+
+        return requests
 
     except Exception as e:
-        logger.info("Error in graph2request: %s", e)
-        if nsd is not None  :
-            logger.info("nsd content: %s", nsd)
+        logger.info("Error in graphs2requests: %s", e)
         return None
 
+# Response encoding
+#
+# Frozen decorations are MappingProxyType/tuple objects, the encoders below serialise them as
+# plain JSON objects/arrays and YAML timestamps of legacy requests as ISO 8601 strings.
+# encode_response uses the C encoder, iterencode_response yields the document in chunks so it
+# can be written to a stream without building it in memory first.
+
+def json_default(value):
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+RESPONSE_ENCODER = json.JSONEncoder(default=json_default)
+
+def encode_response(value):
+    return RESPONSE_ENCODER.encode(value).encode('utf-8')
+
+def iterencode_response(value):
+    for chunk in RESPONSE_ENCODER.iterencode(value):
+        yield chunk.encode('utf-8')
+
 #  Helper Function
 
 # Merge extra details into base dictionary only if keys are missing.
@@ -193,4 +336,12 @@ def merge_missing(base, extra):
     for key, value in extra.items():
         if key not in base:
             base[key] = value
-    return base
\ No newline at end of file
+    return base
+
+# Read-only view of a parsed document, shared between requests without copying
+def freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
\ No newline at end of file
@@ -1,13 +1,27 @@
 # processor.py
 
 import asyncio
-from library.rabbitmq import consume_messages
+from library.executor import shutdown_executor
+from library.config import METRICS_PORT, worker_mode, messaging_system
+import library.metrics as metrics
+import library.portfolio as portfolio
 import logging
 import time
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    time.sleep(3) # Allow time for the RabbitMQ to initialize
+    time.sleep(3) # Allow time for the broker to initialize
+    if METRICS_PORT:
+        metrics.start_http_server(METRICS_PORT)
+    # Warm up the racing workers while waiting for requests (process workers start their own pool)
+    if portfolio.enabled() and worker_mode == "thread":
+        portfolio.get_pool().start()
+    if messaging_system == "kafka":
+        from library.kafka import consume_messages
+    elif messaging_system == "rabbitmq":
+        from library.rabbitmq import consume_messages
+    else:
+        raise ValueError(f"Invalid messaging system specified: {messaging_system}")
     loop = asyncio.get_event_loop()
     connection = loop.run_until_complete(consume_messages())
 
@@ -18,3 +32,5 @@ if __name__ == "__main__":
         exit(0)
     finally:
         loop.run_until_complete(connection.close())
+        shutdown_executor()
+        portfolio.shutdown()
@@ -0,0 +1,8 @@
+# Tests import the OE sources the way processor.py does (src on the path)
+
+import os
+import sys
+
+# No selector statistics are written by the test run
+os.environ.setdefault("SELECTOR_STATS_PATH", "")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
@@ -0,0 +1,54 @@
+import networkx as nx
+from library.model_pool.capacityaware import capacityaware
+from library.servicegraph import ServiceGraph
+
+
+def service(n=4, cpu=2):
+    # Chain f0 - f1 - ... of functions asking for cpu vCPUs each
+    G = nx.path_graph([f"f{i}" for i in range(n)])
+    for node in G:
+        G.nodes[node].update({"nf-instance-id": node, "nf-vcpu": cpu})
+    return ServiceGraph.from_networkx(G)
+
+
+def substrate(*cpus):
+    S = nx.Graph()
+    for i, cpu in enumerate(cpus):
+        S.add_node(f"site{i + 1}", cpu=cpu, mem=0, storage=0)
+    for i in range(1, len(cpus)):
+        S.add_edge(f"site{i}", f"site{i + 1}", latency_ms=5.0)
+    return S
+
+
+def sites(subgraphs):
+    return {node: subgraph.graph["site_id"] for subgraph in subgraphs for node in subgraph.nodes()}
+
+
+def test_functions_stay_together_on_the_first_site_that_fits():
+    assert set(sites(capacityaware(service(), substrate(8, 8), 2)).values()) == {"site1"}
+
+
+def test_functions_spill_over_when_a_site_is_full():
+    placement = sites(capacityaware(service(), substrate(4, 8), 2))
+    assert sorted(placement.values()).count("site1") == 2
+    # The chain is cut once
+    assert placement["f0"] == placement["f1"] and placement["f2"] == placement["f3"]
+
+
+def test_service_that_does_not_fit_returns_minus_one():
+    assert capacityaware(service(), substrate(2, 2), 2) == -1
+
+
+def test_pinned_functions_keep_their_site():
+    pinned = {"f0": "site1", "f1": "site2", "f2": "site2"}
+    placement = sites(capacityaware(service(), substrate(8, 8), 2, pinned=pinned))
+    # f0 is not moved to its neighbour's site by the refinement, the new f3 joins its neighbour f2
+    assert placement == {"f0": "site1", "f1": "site2", "f2": "site2", "f3": "site2"}
+
+
+def test_pins_that_no_longer_fit_or_name_unknown_sites_are_placed_again():
+    pinned = {"f0": "site2", "f1": "site2", "f2": "site2", "f3": "gone"}
+    # site2 only has room for two of the pinned functions now
+    placement = sites(capacityaware(service(), substrate(8, 4), 2, pinned=pinned))
+    assert list(placement.values()).count("site2") == 2
+    assert sorted(placement) == ["f0", "f1", "f2", "f3"]
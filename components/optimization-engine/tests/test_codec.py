@@ -0,0 +1,69 @@
+import base64
+import datetime
+import json
+import pytest
+import zstandard
+import library.codec as codec
+import library.config as config
+import library.translator as translator
+
+LEGACY_YAML = b"lnsd:\n  created: 2024-05-01\n  ns: {}\n"
+
+
+def test_yaml_dates_are_encoded_in_replies():
+    service = codec.decode_request(LEGACY_YAML).service
+    assert service["lnsd"]["created"] == datetime.date(2024, 5, 1)
+    payload = [{"s1e": translator.freeze(service), "site_id": "site1"}]
+    body, content_type, content_encoding = codec.encode_reply(payload)
+    assert content_type is None and content_encoding is None
+    assert json.loads(body)[0]["s1e"]["lnsd"]["created"] == "2024-05-01"
+    for content_type in (codec.MSGPACK, codec.JSON):
+        body, _, content_encoding = codec.encode_reply(payload, content_type)
+        assert codec.decode(body, content_type, content_encoding)[0]["s1e"]["lnsd"]["created"] == "2024-05-01"
+
+
+def test_legacy_requests_are_sniffed():
+    envelope = codec.decode_request(base64.b64encode(LEGACY_YAML))
+    assert (envelope.encoding, envelope.format) == ("base64", "yaml")
+    assert envelope.raw == base64.b64encode(LEGACY_YAML)
+    envelope = codec.decode_request(b'{"lnsd": {"ns": {}}}')
+    assert (envelope.encoding, envelope.format, envelope.service) == ("plain", "json", {"lnsd": {"ns": {}}})
+
+
+@pytest.mark.parametrize("content_type", [codec.MSGPACK, codec.JSON])
+@pytest.mark.parametrize("threshold", [0, 1])
+def test_requests_round_trip(content_type, threshold):
+    service = {"lnsd": {"ns-instance-id": "ns1", "ns": {"network-functions": [{"nf-instance-id": "a", "nf-vcpu": 2}]}}}
+    body, content_encoding = codec.encode(service, content_type, compress_threshold=threshold)
+    assert content_encoding == (codec.ZSTD if threshold else None)
+    envelope = codec.decode_request(body, content_type, content_encoding)
+    assert envelope.service == service
+    assert envelope.raw is None
+    assert envelope.instance_id == "ns1"
+
+
+def test_reply_keeps_the_request_format():
+    payload = [{"s1e": translator.freeze({"lnsd": {"ns": {"functions": [1, 2]}}}), "site_id": "site1"}]
+    body, content_type, content_encoding = codec.encode_reply(payload, codec.MSGPACK)
+    assert content_type == codec.MSGPACK
+    assert codec.decode(body, content_type, content_encoding) == [{"s1e": {"lnsd": {"ns": {"functions": [1, 2]}}}, "site_id": "site1"}]
+    # Unknown content types get the legacy JSON reply
+    body, content_type, content_encoding = codec.encode_reply(payload, "application/xml")
+    assert (content_type, content_encoding) == (None, None)
+    assert json.loads(body) == [{"s1e": {"lnsd": {"ns": {"functions": [1, 2]}}}, "site_id": "site1"}]
+
+
+def test_decompressed_size_is_bounded(monkeypatch):
+    body = zstandard.ZstdCompressor().compress(json.dumps({"padding": "x" * 4096}).encode())
+    monkeypatch.setattr(config, "REQUEST_MAX_BYTES", 1024)
+    with pytest.raises(ValueError):
+        codec.decode_request(body, codec.JSON, codec.ZSTD)
+
+
+def test_unsupported_formats_are_rejected():
+    with pytest.raises(ValueError):
+        codec.decode(b"{}", "application/xml")
+    with pytest.raises(ValueError):
+        codec.decode(b"{}", codec.JSON, "gzip")
+    with pytest.raises(ValueError):
+        codec.decode(b"not zstd", codec.JSON, codec.ZSTD)
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+import pytest
+import library.executor as executor
+import library.metrics as metrics
+
+WORK = metrics.REGISTRY.counter("oe_test_work_total", "Work items run by the executor tests.")
+
+
+class Gauge:
+    # Highest number of calls running at the same time
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, seconds):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(seconds)
+        with self.lock:
+            self.running -= 1
+
+
+def work(value):
+    WORK.inc()
+    return value * 2
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    def start(mode, count):
+        monkeypatch.setattr(executor, "worker_mode", mode)
+        monkeypatch.setattr(executor, "worker_count", count)
+        monkeypatch.setattr(executor, "_executor", None)
+    yield start
+    executor.shutdown_executor()
+
+
+def test_thread_workers_are_bounded(pool):
+    pool("thread", 2)
+    gauge = Gauge()
+    async def run():
+        await asyncio.gather(*(executor.run_in_worker(gauge, 0.05) for _ in range(6)))
+    asyncio.run(run())
+    assert gauge.peak == 2
+    assert executor.get_executor() is executor.get_executor()
+
+
+def test_spawned_workers_hand_back_their_metrics(pool):
+    pool("process", 2)
+    WORK.drain()
+    async def run():
+        return await asyncio.gather(*(executor.run_in_worker(work, value) for value in range(3)))
+    assert asyncio.run(run()) == [0, 2, 4]
+    # Counted in the workers, merged into this process
+    assert sum(WORK.drain().values()) == 3
+
+
+def test_unknown_worker_mode_is_rejected(pool):
+    pool("fiber", 1)
+    with pytest.raises(ValueError):
+        executor.get_executor()
@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+import requests
+import library.resources.functions as functions
+from library.resources.functions import FunctionCatalog
+
+CATALOG = """
+network-functions:
+  - nf-instance-id: upf-i01
+    nf-vcpu: 2
+    nf-memory: 4Gi
+application-functions:
+  - af-instance-id: twin-i01
+  - not a descriptor
+"""
+
+
+def test_catalog_is_indexed_by_instance_id():
+    catalog = FunctionCatalog("apps.nf.yaml", CATALOG)
+    assert sorted(catalog.by_id) == ["twin-i01", "upf-i01"]
+    # Demand values are only read when a request uses the function
+    assert catalog.by_id["upf-i01"]["nf-memory"] == "4Gi"
+
+
+def test_catalog_that_is_not_a_mapping_is_empty():
+    catalog = FunctionCatalog("apps.nf.yaml", "- just\n- a list\n")
+    assert catalog.functions == {} and catalog.by_id == {}
+
+
+class Catalog:
+    # Service Catalog stub, counts the retrieve calls
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, upstream=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(0.1)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"file_content": CATALOG}).encode()
+        return response
+
+
+def lookups(cache, count=5):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("apps.nf.yaml"))) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_a_single_request_fetches_a_missing_catalog(monkeypatch):
+    catalog = Catalog()
+    monkeypatch.setattr(functions.upstream, "get", catalog.get)
+    cache = functions.FunctionCatalogCache(ttl=60, max_entries=2, max_bytes=1 << 20)
+    results = lookups(cache)
+    assert catalog.calls == 1
+    assert len({id(entry) for entry in results}) == 1
+
+
+def test_expired_catalog_is_served_while_one_request_revalidates(monkeypatch):
+    catalog = Catalog()
+    monkeypatch.setattr(functions.upstream, "get", catalog.get)
+    cache = functions.FunctionCatalogCache(ttl=60, max_entries=2, max_bytes=1 << 20)
+    entry = cache.get("apps.nf.yaml")
+    entry.validated_at -= 120
+    results = lookups(cache)
+    assert catalog.calls == 2
+    assert all(result is entry for result in results)
+    assert time.monotonic() - entry.validated_at < 1
@@ -0,0 +1,47 @@
+import json
+import multiprocessing
+import pytest
+import library.config as config
+import library.objective as objective
+from library.selector_pool import intelligence
+
+CONTEXT = {"functions": 10, "links": 9, "domains": 3}
+GOOD = objective.Quality(True, 1.0, 0.1, 0.0, 3)
+
+
+@pytest.fixture
+def stats_path(tmp_path, monkeypatch):
+    path = tmp_path / "state" / "selector-stats.json"
+    monkeypatch.setattr(config, "SELECTOR_STATS_PATH", str(path))
+    monkeypatch.setattr(config, "SELECTOR_STATS_FLUSH_INTERVAL", 0.0)
+    monkeypatch.setattr(intelligence, "_stats", {})
+    monkeypatch.setattr(intelligence, "_pending", {})
+    return path
+
+
+def test_reward_prefers_fast_feasible_placements():
+    assert intelligence.reward(0.01, GOOD) > intelligence.reward(1.0, GOOD) > 0
+    assert intelligence.reward(0.01, objective.INFEASIBLE) == 0.0
+
+
+def test_untried_models_are_picked_first(stats_path):
+    models = {"autologic": {"enabled": True}, "multilevel": {"enabled": True}}
+    intelligence.observe("autologic", CONTEXT, 0.01, GOOD)
+    assert intelligence.intelligence(models, CONTEXT) == "multilevel"
+
+
+def _observe_many(count):
+    for _ in range(count):
+        intelligence.observe("multilevel", CONTEXT, 0.01, GOOD)
+    intelligence.flush()
+
+
+def test_concurrent_processes_do_not_lose_statistics(stats_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_observe_many, args=(50,)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stored = json.loads(stats_path.read_text())
+    assert stored["<=16"]["multilevel"]["count"] == 200
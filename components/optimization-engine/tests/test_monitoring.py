@@ -0,0 +1,60 @@
+import numpy as np
+import library.resources.monitoring as monitoring
+
+
+def sites(*cpus):
+    # Same capacity for every resource, sites in preference order
+    return np.array([[cpu] * 3 for cpu in cpus], dtype=float)
+
+
+def demand(cpu):
+    return np.array([cpu] * 3, dtype=float)
+
+
+def members(ranked):
+    return [members for members, _ in ranked]
+
+
+def test_local_site_alone_comes_first():
+    assert members(monitoring.admit(demand(4), sites(4, 8, 8)))[0] == [0]
+
+
+def test_fewest_then_nearest_sites():
+    ranked = members(monitoring.admit(demand(10), sites(4, 4, 8)))
+    assert ranked[:3] == [[0, 2], [1, 2], [0, 1, 2]]
+
+
+def test_more_headroom_breaks_ties_between_equally_near_sites():
+    ranked = monitoring.admit(demand(2), sites(0, 4, 8))
+    assert members(ranked)[:2] == [[1], [2]]
+    assert ranked[0][1] == 0.5
+
+
+def test_heuristic_finds_the_largest_sites_past_the_exhaustive_limit():
+    capacity, required = sites(1, 1, 6, 6), demand(10)
+    exhaustive = members(monitoring.admit(required, capacity, max_exhaustive_sites=12))
+    heuristic = members(monitoring.admit(required, capacity, max_exhaustive_sites=2))
+    assert exhaustive[0] == heuristic[0] == [2, 3]
+    # Only single sites and prefixes are tried
+    assert len(heuristic) < len(exhaustive)
+
+
+def test_many_sites_are_not_enumerated():
+    capacity = sites(*([1] * 39 + [5]))
+    ranked = monitoring.admit(demand(5), capacity, limit=3)
+    assert members(ranked)[0] == [39]
+    assert len(ranked) == 3
+
+
+def test_no_placement_when_all_sites_together_are_too_small():
+    assert monitoring.admit(demand(10), sites(3, 3, 3)) == []
+    assert monitoring.admit(demand(1), sites()) == []
+
+
+def test_rank_placements_reports_site_ids():
+    site_resources = {"site-resources": [
+        {"site-id-ref": site, "site-available-vcpu": cpu, "site-available-ram": 8, "site-available-storage": 8}
+        for site, cpu in (("local", 1), ("near", 2), ("far", 4))]}
+    ranked = monitoring.rank_placements(None, site_resources, required={"nf-vcpu": 3, "nf-memory": 1, "nf-storage": 0})
+    assert ranked[0]["sites"] == ["far"]
+    assert ranked[1]["sites"] == ["local", "near"]
@@ -0,0 +1,36 @@
+import networkx as nx
+from library.model_pool.multilevel import multilevel
+
+
+def sizes(subgraphs):
+    return sorted(len(subgraph) for subgraph in subgraphs)
+
+
+def test_edgeless_graph_is_split_evenly():
+    # e.g. demo/demo_nsd1.sg.yaml: 15 functions, no links
+    G = nx.Graph()
+    G.add_nodes_from(range(15))
+    assert sizes(multilevel(G, None, 6)) == [2, 2, 2, 3, 3, 3]
+
+
+def test_fewer_functions_than_domains():
+    G = nx.Graph()
+    G.add_nodes_from(range(2))
+    assert sizes(multilevel(G, None, 3)) == [1, 1]
+
+
+def test_every_function_placed_once():
+    G = nx.gnm_random_graph(300, 900, seed=1)
+    subgraphs = multilevel(G, None, 3)
+    placed = [node for subgraph in subgraphs for node in subgraph.nodes()]
+    assert sorted(placed) == sorted(G.nodes())
+    assert max(sizes(subgraphs)) <= 1.03 * 300 / 3 + 1
+
+
+def test_cut_is_lower_than_a_balanced_split():
+    # Two dense clusters joined by one link end up in separate parts
+    G = nx.disjoint_union(nx.complete_graph(20), nx.complete_graph(20))
+    G.add_edge(0, 20)
+    subgraphs = multilevel(G, None, 2)
+    assert sizes(subgraphs) == [20, 20]
+    assert {frozenset(subgraph.nodes()) for subgraph in subgraphs} == {frozenset(range(20)), frozenset(range(20, 40))}
@@ -0,0 +1,66 @@
+import networkx as nx
+import library.objective as objective
+from library.servicegraph import ServiceGraph
+
+
+def service():
+    # a - b - c - d, every function asks for 2 vCPUs, 1 GB and no storage
+    G = nx.path_graph(["a", "b", "c", "d"])
+    for node in G:
+        G.nodes[node].update({"nf-instance-id": node, "nf-vcpu": 2, "nf-memory": 1})
+    return ServiceGraph.from_networkx(G)
+
+
+def substrate(cpu):
+    S = nx.Graph()
+    S.add_node("site1", cpu=cpu, mem=8, storage=0)
+    S.add_node("site2", cpu=cpu, mem=8, storage=0)
+    S.add_edge("site1", "site2", latency_ms=1.0)
+    return S
+
+
+def test_cut_and_imbalance():
+    graph = service()
+    quality = objective.evaluate(graph, [graph.subgraph(["a", "b", "c"]), graph.subgraph(["d"])])
+    assert quality.feasible
+    assert quality.cut_fraction == 1 / 3
+    assert quality.imbalance == 0.5
+    assert 0 < quality.score < 1
+
+
+def test_missing_or_repeated_functions_are_infeasible():
+    graph = service()
+    assert not objective.evaluate(graph, [graph.subgraph(["a", "b"])]).feasible
+    assert not objective.evaluate(graph, [graph.subgraph(["a", "b", "c"]), graph.subgraph(["c", "d"])]).feasible
+    assert not objective.evaluate(graph, -1).feasible
+    assert objective.evaluate(graph, None).score == 0.0
+
+
+def test_sites_within_capacity_are_feasible():
+    graph = service()
+    subgraphs = [graph.subgraph(["a", "b"]), graph.subgraph(["c", "d"])]
+    assert objective.evaluate(graph, subgraphs, substrate(4)).feasible
+
+
+def test_overloaded_site_is_infeasible():
+    graph = service()
+    subgraphs = [graph.subgraph(["a", "b", "c"]), graph.subgraph(["d"])]
+    # site1 would need 6 vCPUs
+    assert not objective.evaluate(graph, subgraphs, substrate(4)).feasible
+    assert objective.evaluate(graph, subgraphs, substrate(6)).feasible
+
+
+def test_site_ids_of_the_subgraphs_are_used():
+    graph = service()
+    first, second = graph.subgraph(["a", "b"]), graph.subgraph(["c", "d"])
+    first.graph = {"site_id": "site2"}
+    second.graph = {"site_id": "site2"}
+    # Both parts on site2: 8 vCPUs
+    assert not objective.evaluate(graph, [first, second], substrate(4)).feasible
+    assert objective.evaluate(graph, [first, second], substrate(8)).feasible
+
+
+def test_more_parts_than_sites_is_infeasible():
+    graph = service()
+    subgraphs = [graph.subgraph([node]) for node in "abc"] + [graph.subgraph(["d"])]
+    assert not objective.evaluate(graph, subgraphs, substrate(100)).feasible
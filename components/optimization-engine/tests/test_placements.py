@@ -0,0 +1,62 @@
+import networkx as nx
+import pytest
+import library.placements as placements
+from library.servicegraph import ServiceGraph
+
+
+def service(cpus, links):
+    G = nx.Graph()
+    for name, cpu in cpus.items():
+        G.add_node(name, **{"nf-instance-id": name, "nf-vcpu": cpu})
+    G.add_edges_from(links)
+    return ServiceGraph.from_networkx(G)
+
+
+BASE = service({"a": 1, "b": 1, "c": 1, "d": 1}, [("a", "b"), ("b", "c"), ("c", "d")])
+ASSIGNMENT = {"a": "site1", "b": "site1", "c": "site2", "d": "site2"}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = placements.PlacementStore(max_entries=8)
+    monkeypatch.setattr(placements, "placement_store", store)
+    placements.PLACEMENT_LOOKUPS.drain()
+    subgraphs = [BASE.subgraph(["a", "b"]), BASE.subgraph(["c", "d"])]
+    placements.remember("ns1", BASE, subgraphs, ["site1", "site2"], 7, "site1")
+    return store
+
+
+def test_unknown_service_is_optimised_from_scratch(store):
+    assert placements.repair_plan("ns2", BASE, 7, "site1") is None
+    assert placements.repair_plan(None, BASE, 7, "site1") is None
+
+
+def test_unchanged_service_reuses_its_placement(store):
+    assert placements.repair_plan("ns1", service({"a": 1, "b": 1, "c": 1, "d": 1}, [("c", "d"), ("b", "a"), ("c", "b")]), 7, "site1") == ASSIGNMENT
+
+
+def test_placement_of_another_topology_or_site_is_not_reused(store):
+    assert placements.repair_plan("ns1", BASE, 8, "site1") is None
+    assert placements.repair_plan("ns1", BASE, 7, "site2") is None
+    assert placements.PLACEMENT_LOOKUPS.drain() == {("stale",): 2}
+
+
+def test_changed_functions_and_their_links_are_placed_again(store):
+    # c asks for more, e is new and linked to d
+    changed = service({"a": 1, "b": 1, "c": 2, "d": 1, "e": 1}, [("a", "b"), ("b", "c"), ("c", "d"), ("d", "e")])
+    assert placements.repair_plan("ns1", changed, 7, "site1") == {"a": "site1", "b": "site1"}
+    # a is gone, b lost its link to it
+    removed = service({"b": 1, "c": 1, "d": 1}, [("b", "c"), ("c", "d")])
+    assert placements.repair_plan("ns1", removed, 7, "site1") == {"c": "site2", "d": "site2"}
+    relinked = service({"a": 1, "b": 1, "c": 1, "d": 1}, [("a", "b"), ("b", "c"), ("c", "d"), ("a", "d")])
+    assert placements.repair_plan("ns1", relinked, 7, "site1") == {"b": "site1", "c": "site2"}
+    assert placements.PLACEMENT_LOOKUPS.drain() == {("repair",): 3}
+
+
+def test_store_keeps_the_most_recent_services(store):
+    store.max_entries = 2
+    for instance_id in ("ns2", "ns3"):
+        placements.remember(instance_id, BASE, [BASE], ["site1"], 7, "site1")
+    assert store.get("ns1") is None and store.get("ns3") is not None
+    store.max_entries = 0
+    assert placements.repair_plan("ns3", BASE, 7, "site1") is None
@@ -0,0 +1,73 @@
+import time
+import networkx as nx
+import pytest
+import library.config as config
+import library.portfolio as portfolio
+import library.registry as registry
+from library.servicegraph import ServiceGraph
+
+MODELS = "slow=test_portfolio:slow,fast=test_portfolio:fast"
+
+
+def slow(graph, substrate, domains):
+    time.sleep(60)
+
+
+def fast(graph, substrate, domains):
+    return [graph.subgraph(graph.nodes())]
+
+
+@pytest.fixture
+def models(monkeypatch):
+    # The spawned workers read the enabled models from the environment
+    monkeypatch.setenv("OE_MODELS", MODELS)
+    monkeypatch.setattr(registry, "enabled_models", registry.models.configure(MODELS))
+    monkeypatch.setattr(portfolio, "_pool", portfolio.Pool(2))
+    monkeypatch.setattr(config, "PORTFOLIO_GRACE", 0.5)
+    yield
+    portfolio.shutdown()
+
+
+def service():
+    G = nx.path_graph(4)
+    return ServiceGraph.from_networkx(G)
+
+
+def race(graph, deadline):
+    context = registry.request_context(1, len(graph), graph.number_of_edges())
+    start = time.perf_counter()
+    winner, subgraphs = portfolio.race(context, graph, None, 1, deadline=deadline)
+    return winner, subgraphs, time.perf_counter() - start
+
+
+def test_feasible_model_wins_and_slow_model_is_cancelled(models):
+    # The deadline covers starting the workers
+    winner, subgraphs, elapsed = race(service(), 3.0)
+    assert winner == "fast"
+    assert sorted(subgraphs[0].nodes()) == [0, 1, 2, 3]
+    assert elapsed < 3.0 + 1.0
+
+
+def test_race_gives_up_at_the_hard_cap(models, monkeypatch):
+    monkeypatch.setattr(registry, "enabled_models", ["slow"])
+    winner, subgraphs, elapsed = race(service(), 0.2)
+    assert (winner, subgraphs) == (None, -1)
+    # Deadline plus grace, not the 60 seconds of the model
+    assert elapsed < 0.2 + 0.5 + 1.0
+
+
+def test_models_without_an_idle_worker_are_skipped_and_counted(models, monkeypatch):
+    monkeypatch.setattr(registry, "enabled_models", ["fast", "slow"])
+    monkeypatch.setattr(portfolio, "_pool", portfolio.Pool(1))
+    portfolio.PORTFOLIO_RESULTS.drain()
+    winner, _, elapsed = race(service(), 3.0)
+    assert winner == "fast"
+    assert portfolio.PORTFOLIO_RESULTS.drain() == {("fast", "feasible"): 1, ("slow", "skipped"): 1}
+
+
+@pytest.mark.parametrize("mode, count, size", [("thread", 8, 4), ("process", 2, 2), ("process", 8, 1)])
+def test_process_workers_split_the_racing_workers(monkeypatch, mode, count, size):
+    monkeypatch.setattr(config, "PORTFOLIO_WORKERS", 4)
+    monkeypatch.setattr(config, "worker_mode", mode)
+    monkeypatch.setattr(config, "worker_count", count)
+    assert portfolio.pool_size() == size
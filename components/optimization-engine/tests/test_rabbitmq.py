@@ -0,0 +1,147 @@
+import asyncio
+import datetime
+import time
+import pytest
+import library.executor as executor
+import library.rabbitmq as rabbitmq
+from test_executor import Gauge
+
+
+class FakeMessage:
+    def __init__(self, body):
+        self.body = body
+        self.content_type = "application/json"
+        self.content_encoding = None
+        self.timestamp = None
+        self.headers = {}
+        self.correlation_id = body.decode()
+        self.reply_to = "final_topic.client"
+        self.acked = False
+        self.rejected = False
+
+    async def ack(self):
+        self.acked = True
+
+    async def reject(self, requeue=False):
+        self.rejected = True
+
+
+class FakeExchange:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        if self.fail:
+            raise ConnectionError("channel closed")
+        self.published.append((message, routing_key))
+
+
+class FakeChannel:
+    def __init__(self, exchange):
+        self.default_exchange = exchange
+        self.prefetch_count = None
+        self.on_message = None
+
+    async def set_qos(self, prefetch_count):
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(self, name):
+        return self
+
+    async def consume(self, callback):
+        self.on_message = callback
+
+    async def channel(self):
+        return self
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    def start(exchange, process_request):
+        channel = FakeChannel(exchange)
+        async def connect(url):
+            return channel
+        monkeypatch.setattr(rabbitmq, "connect", connect)
+        monkeypatch.setattr(rabbitmq, "process_request", process_request)
+        return channel
+    return start
+
+
+async def reply(body, content_type, content_encoding, enqueued_at, counter):
+    return body, content_type, content_encoding
+
+
+def deliver(channel, messages):
+    async def run():
+        await rabbitmq.consume_messages()
+        await asyncio.gather(*(channel.on_message(message) for message in messages))
+    asyncio.run(run())
+
+
+def test_prefetch_bounds_the_channel(broker, monkeypatch):
+    monkeypatch.setattr(rabbitmq, "prefetch_count", 7)
+    channel = broker(FakeExchange(), reply)
+    deliver(channel, [])
+    assert channel.prefetch_count == 7
+
+
+def test_reply_is_published_before_the_ack(broker):
+    exchange = FakeExchange()
+    channel = broker(exchange, reply)
+    message = FakeMessage(b"ns1")
+    deliver(channel, [message])
+    assert message.acked and not message.rejected
+    published, routing_key = exchange.published[0]
+    assert (published.body, published.correlation_id, routing_key) == (b"ns1", "ns1", "final_topic.client")
+
+
+def test_failed_publish_is_rejected_not_acked(broker):
+    channel = broker(FakeExchange(fail=True), reply)
+    message = FakeMessage(b"ns1")
+    deliver(channel, [message])
+    assert message.rejected and not message.acked
+
+
+def test_failed_processing_is_rejected(broker):
+    async def fail(*args):
+        raise RuntimeError("pipeline failed")
+    exchange = FakeExchange()
+    channel = broker(exchange, fail)
+    message = FakeMessage(b"ns1")
+    deliver(channel, [message])
+    assert message.rejected and not message.acked
+    assert exchange.published == []
+
+
+def test_deliveries_run_concurrently_up_to_the_worker_count(broker, monkeypatch):
+    monkeypatch.setattr(executor, "worker_mode", "thread")
+    monkeypatch.setattr(executor, "worker_count", 2)
+    monkeypatch.setattr(executor, "_executor", None)
+    gauge = Gauge()
+    async def process(body, content_type, content_encoding, enqueued_at, counter):
+        await executor.run_in_worker(gauge, 0.05)
+        return body, content_type, content_encoding
+    channel = broker(FakeExchange(), process)
+    messages = [FakeMessage(str(i).encode()) for i in range(6)]
+    try:
+        deliver(channel, messages)
+    finally:
+        executor.shutdown_executor()
+    assert gauge.peak == 2
+    assert all(message.acked for message in messages)
+
+
+def test_queue_wait_starts_at_the_publish_time(broker):
+    received = []
+    async def process(body, content_type, content_encoding, enqueued_at, counter):
+        received.append(enqueued_at)
+        return body, content_type, content_encoding
+    channel = broker(FakeExchange(), process)
+    precise, whole, missing = FakeMessage(b"1"), FakeMessage(b"2"), FakeMessage(b"3")
+    precise.headers = {"sent-at": 1700000000.25}
+    precise.timestamp = whole.timestamp = datetime.datetime.fromtimestamp(1700000000, datetime.timezone.utc)
+    before = time.time()
+    deliver(channel, [precise, whole, missing])
+    assert received[:2] == [1700000000.25, 1700000000.0]
+    assert received[2] >= before
@@ -0,0 +1,47 @@
+import pytest
+import library.registry as registry
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    def enable(*names):
+        monkeypatch.setattr(registry, "enabled_models", list(names))
+    return enable
+
+
+def test_repair_model_is_an_enabled_model_that_can_repair(enabled):
+    enabled("multilevel", "capacityaware")
+    assert registry.repair_model(3, 10) == "capacityaware"
+
+
+def test_no_repair_model_when_none_is_enabled(enabled):
+    enabled("autologic", "multilevel")
+    assert registry.repair_model(3, 10) is None
+
+
+def test_repair_model_must_support_the_request(enabled, monkeypatch):
+    enabled("capacityaware")
+    monkeypatch.setitem(registry.models.plugins["capacityaware"].capabilities, "functions", (1, 5))
+    assert registry.repair_model(3, 10) is None
+
+
+def narrow(graph, substrate, domains, **kwargs):
+    return []
+
+narrow.capabilities = {"functions": (1, 5), "graph": "networkx"}
+
+
+def test_capabilities_declared_on_the_callable_apply_before_the_first_run(enabled, monkeypatch):
+    monkeypatch.setattr(registry.models, "plugins", dict(registry.models.plugins))
+    enabled(*registry.models.configure("narrow=test_registry:narrow"))
+    plugin = registry.models.plugins["narrow"]
+    assert not plugin.loaded
+    assert registry.eligible_models(3, 10) == {}
+    assert plugin.loaded and plugin.capabilities["graph"] == "networkx"
+    assert list(registry.eligible_models(3, 4)) == ["narrow"]
+
+
+def test_plugins_that_fail_to_load_are_not_eligible(enabled, monkeypatch):
+    monkeypatch.setattr(registry.models, "plugins", dict(registry.models.plugins))
+    enabled(*registry.models.configure("broken=test_registry:missing,multilevel"))
+    assert list(registry.eligible_models(3, 10)) == ["multilevel"]
@@ -0,0 +1,43 @@
+import pytest
+import library.schema as schema
+
+
+@pytest.mark.parametrize("service, path", [
+    ([1], ""),
+    ({"local-nsd": [1, 2]}, "local-nsd"),
+    ({"lnsd": "x"}, "lnsd"),
+    ({"local-nsd": None}, "local-nsd"),
+    ({"lnsd": {"ns": 5}}, "lnsd.ns"),
+    ({"network-functions": "x"}, "nsd.network-functions"),
+    ({"local-nsd": {"network-functions": [{"nf-vcpu": 1}]}}, "local-nsd.network-functions[0].nf-instance-id"),
+    ({"lnsd": {"ns": {"forwarding_graphs": [{"links": [{"connection-points": [{"member-if-id-ref": "a"}]}]}]}}},
+     "lnsd.ns.forwarding_graphs[0].links[0].connection-points"),
+])
+def test_malformed_requests_are_reported(service, path):
+    errors = schema.validate_request(service)
+    assert errors and errors[0]["path"] == path
+
+
+def test_valid_request():
+    service = {"lnsd": {"ns": {
+        "network-functions": [{"nf-instance-id": "a", "nf-vcpu": 2}],
+        "application-functions": [{"af-instance-id": "b"}],
+        "forwarding_graphs": [{"links": [{"link-id": "l", "connection-points": [{"member-if-id-ref": "a"}, {"member-if-id-ref": "b"}]}]}],
+    }}}
+    assert schema.validate_request(service) == []
+
+
+def test_repeated_function_ids_are_merged_not_rejected():
+    service = {"network-functions": [{"nf-instance-id": "a"}, {"nf-instance-id": "a", "nf-vcpu": 1}]}
+    assert schema.validate_request(service) == []
+
+
+def test_errors_are_capped():
+    service = {"network-functions": [{}] * 100}
+    assert len(schema.validate_request(service)) == schema.MAX_ERRORS
+
+
+def test_error_payload():
+    payload = schema.error_payload(schema.validate_request({"lnsd": "x"}))
+    assert payload["Error"].startswith("Invalid service request: lnsd: expected a mapping")
+    assert payload["errors"][0]["path"] == "lnsd"
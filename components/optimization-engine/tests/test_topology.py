@@ -0,0 +1,73 @@
+import networkx as nx
+import pytest
+import library.resources.topology as topology
+
+NODES = [{"site_id": site, "cpu": 8, "mem": 16, "storage": 100} for site in ("A", "B", "C", "D")]
+# B is far from A, D is reached through C
+LINKS = [{"source": "A", "destination": "B", "latency_ms": 9.0},
+         {"source": "A", "destination": "C", "latency_ms": 1.0},
+         {"source": "C", "destination": "D", "latency_ms": 2.0}]
+
+
+@pytest.fixture
+def module(monkeypatch):
+    state = {"nodes": [dict(node) for node in NODES], "links": [dict(link) for link in LINKS]}
+
+    def get_json(url, **kwargs):
+        key = "nodes" if url.endswith("/nodes/") else "links"
+        return {key: state[key]}
+
+    monkeypatch.setattr(topology.upstream, "get_json", get_json)
+    return state
+
+
+def test_site_view_keeps_the_latency_order(module):
+    snapshot = topology.TopologyCache(refresh_interval=60).get()
+    graph, sites = snapshot.site_view("A")
+    assert sites == ["A", "C", "D", "B"]
+    assert list(graph.nodes()) == sites
+    assert graph.has_edge("C", "D") and not graph.has_edge("B", "C")
+
+
+def test_ordered_subgraph():
+    G = nx.path_graph(["a", "b", "c"])
+    G.nodes["c"]["cpu"] = 4
+    view = topology.ordered_subgraph(G, ["c", "a", "b"])
+    assert list(view.nodes()) == ["c", "a", "b"]
+    assert view.nodes["c"]["cpu"] == 4
+    assert sorted(map(sorted, view.edges())) == [["a", "b"], ["b", "c"]]
+
+
+def test_refresh_keeps_an_unchanged_snapshot(module):
+    cache = topology.TopologyCache(refresh_interval=0)
+    first = cache.get()
+    assert cache.get() is first
+    assert first.version == 1
+
+
+def test_refresh_applies_changes_to_a_new_version(module):
+    cache = topology.TopologyCache(refresh_interval=0)
+    first = cache.get()
+    module["nodes"][1]["cpu"] = 2
+    module["links"].pop()
+    second = cache.get()
+    assert second.version == 2 and second.graph.graph["version"] == 2
+    assert second.graph.nodes["B"]["cpu"] == 2 and not second.graph.has_edge("C", "D")
+    # The old snapshot is left as it was for the requests still using it
+    assert first.graph.nodes["B"]["cpu"] == 8 and first.graph.has_edge("C", "D")
+
+
+def test_cache_lookups_are_counted(module):
+    def count(result):
+        line = f'oe_topology_cache_total{{result="{result}"}}'
+        return next((float(sample.split()[-1]) for sample in topology.CACHE_LOOKUPS.render() if sample.startswith(line)), 0)
+
+    before = {result: count(result) for result in ("hit", "miss", "revalidated", "refreshed")}
+    cache = topology.TopologyCache(refresh_interval=0)
+    cache.get()
+    cache.get()
+    module["nodes"][0]["cpu"] = 1
+    cache.get()
+    cache.refresh_interval = 60
+    cache.get()
+    assert {result: count(result) - before[result] for result in before} == {"hit": 1, "miss": 1, "revalidated": 1, "refreshed": 1}
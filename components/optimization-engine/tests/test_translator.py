@@ -0,0 +1,93 @@
+import json
+import pytest
+import library.translator as translator
+import library.resources.monitoring as monitoring
+
+CATALOG = {"network-functions": [{"nf-instance-id": "a", "nf-vcpu": 4, "nf-image": "registry/a:1"}],
+           "application-functions": [{"af-instance-id": "b", "af-memory": 1}]}
+
+
+def request():
+    return {"lnsd": {"ns-instance-id": "ns1", "ns": {
+        "network-functions": [{"nf-instance-id": "a", "nf-memory": 2}],
+        "application-functions": [{"af-instance-id": "b"}],
+        "forwarding_graphs": [{"links": [{"link-id": "l1", "connection-points": [
+            {"member-if-id-ref": "a:eth0"}, {"member-if-id-ref": "b:eth0"}]}]}],
+    }}}
+
+
+def test_catalog_fields_only_reach_the_demand():
+    service = request()
+    graph, _ = translator.request2graph(translator.encode_response(service), CATALOG)
+    assert graph.demand.tolist() == [[4.0, 2.0, 0.0], [0.0, 0.0, 0.0]]
+    encoded, = translator.graphs2requests([graph], service)
+    functions = encoded["lnsd"]["ns"]["network-functions"]
+    assert functions == [{"nf-instance-id": "a", "nf-memory": 2}]
+    # The NSD entry of the graph is emitted as is, not a merged copy
+    assert functions[0] is graph.records[0].function
+    assert graph.to_networkx().nodes["a"] == {"nf-instance-id": "a", "nf-memory": 2}
+
+
+def test_fractional_demands_are_kept():
+    service = request()
+    service["lnsd"]["ns"]["network-functions"][0]["nf-vcpu"] = 0.5
+    graph, _ = translator.request2graph(translator.encode_response(service), CATALOG)
+    assert graph.demand[0].tolist() == [0.5, 2.0, 0.0]
+    assert monitoring.request_demand(graph)["nf-vcpu"] == 0.5
+
+
+def test_unparsable_catalog_demands_are_reported_per_function():
+    catalog = {"network-functions": [{"nf-instance-id": "a", "nf-vcpu": "2 cores", "nf-storage": "4Gi"},
+                                     {"nf-instance-id": "unused", "nf-vcpu": "many"}]}
+    with pytest.raises(translator.DemandError) as error:
+        translator.request2graph(translator.encode_response(request()), catalog)
+    assert [e["path"] for e in error.value.errors] == ["a.nf-vcpu", "a.nf-storage"]
+
+
+def partitioned():
+    service = request()
+    service["lnsd"]["ns"]["vendor"] = {"name": "d6g", "tags": ["a", "b"]}
+    service["lnsd"]["ns"]["network-functions"].append({"nf-instance-id": "c"})
+    service["lnsd"]["ns"]["forwarding_graphs"][0]["links"].append(
+        {"link-id": "l2", "connection-points": [{"member-if-id-ref": "a"}, {"member-if-id-ref": "c"}]})
+    graph, _ = translator.request2graph(translator.encode_response(service), CATALOG)
+    return service, graph, [graph.subgraph(["a", "b"]), graph.subgraph(["c"])]
+
+
+def test_per_site_requests_share_the_frozen_decorations():
+    service, graph, subgraphs = partitioned()
+    first, second = translator.graphs2requests(subgraphs, service)
+    # Same wrapping and key order as the request
+    assert list(first) == ["lnsd"] and list(first["lnsd"]) == ["ns-instance-id", "ns"]
+    assert first["lnsd"]["ns-instance-id"] == "ns1"
+    vendor = first["lnsd"]["ns"]["vendor"]
+    assert vendor is second["lnsd"]["ns"]["vendor"]
+    with pytest.raises(TypeError):
+        vendor["name"] = "changed"
+    assert vendor["tags"] == ("a", "b")
+    # The containers on the path are per site
+    assert first["lnsd"] is not second["lnsd"] and first["lnsd"]["ns"] is not second["lnsd"]["ns"]
+    first["lnsd"]["ns"]["extra"] = 1
+    assert "extra" not in second["lnsd"]["ns"]
+    # The request itself is left untouched
+    assert service["lnsd"]["ns"]["vendor"] == {"name": "d6g", "tags": ["a", "b"]}
+
+
+def test_per_site_requests_only_list_their_functions_and_links():
+    service, graph, subgraphs = partitioned()
+    first, second = translator.graphs2requests(subgraphs, service)
+    assert [f["nf-instance-id"] for f in first["lnsd"]["ns"]["network-functions"]] == ["a"]
+    assert [f["af-instance-id"] for f in first["lnsd"]["ns"]["application-functions"]] == ["b"]
+    assert [link["link-id"] for link in first["lnsd"]["ns"]["forwarding_graphs"][0]["links"]] == ["l1"]
+    assert second["lnsd"]["ns"]["forwarding_graphs"][0]["links"] == []
+    # Frozen parts encode like plain JSON
+    decoded = json.loads(translator.encode_response([first, second]))
+    assert decoded[0]["lnsd"]["ns"]["vendor"] == {"name": "d6g", "tags": ["a", "b"]}
+
+
+def test_bare_nsd_is_wrapped_under_local_nsd():
+    nsd = request()["lnsd"]["ns"]
+    graph, _ = translator.request2graph(translator.encode_response(nsd), CATALOG)
+    encoded, = translator.graphs2requests([graph], nsd)
+    assert list(encoded) == ["local-nsd"]
+    assert len(encoded["local-nsd"]["network-functions"]) == 1
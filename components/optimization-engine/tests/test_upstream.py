@@ -0,0 +1,56 @@
+import time
+import pytest
+import requests
+import library.resources.upstream as upstream
+
+
+class Response:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {}
+
+
+class Session:
+    def __init__(self):
+        self.timeouts = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.timeouts.append(timeout)
+        return Response()
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = Session()
+    monkeypatch.setattr(upstream, "get_session", lambda: session)
+    return session
+
+
+def test_calls_outside_fetch_parallel_use_the_configured_timeouts(session):
+    upstream.get_json("http://catalog/")
+    assert session.timeouts == [(upstream.config.UPSTREAM_CONNECT_TIMEOUT, upstream.config.UPSTREAM_READ_TIMEOUT)]
+
+
+def test_timeouts_are_cut_to_the_remaining_deadline(session):
+    def fetch():
+        time.sleep(0.1)
+        return upstream.get_json("http://catalog/")
+    assert upstream.fetch_parallel(fetch, deadline=0.5) == [{}]
+    connect, read = session.timeouts[0]
+    assert connect <= 0.4 and read <= 0.4
+
+
+def test_no_request_is_sent_past_the_deadline(session):
+    errors = []
+    def fetch():
+        time.sleep(0.2)
+        try:
+            return upstream.get_json("http://topology/")
+        except requests.Timeout as e:
+            errors.append(e)
+            raise
+    assert upstream.fetch_parallel(fetch, deadline=0.1) == [None]
+    time.sleep(0.2)
+    assert session.timeouts == [] and len(errors) == 1
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Response
+from fastapi.responses import JSONResponse
+import hashlib
 import os
 from library.catalog import get_catalog, FileType, SERVICE_GRAPH_FOLDER, NETWORK_FUNCTION_FOLDER
 
@@ -41,7 +43,7 @@ async def upload_file(file: UploadFile = File(...)):
 
 
 @app.get("/retrieve/{file_name}", tags=["catalog"])
-async def get_file(file_name: str):
+async def get_file(file_name: str, if_none_match: str | None = Header(default=None)):
     if file_name.endswith('.sg.yaml') or file_name.endswith('.sg.yml'):
         folder = SERVICE_GRAPH_FOLDER
     elif file_name.endswith('.nf.yaml') or file_name.endswith('.nf.yml'):
@@ -50,7 +52,12 @@ async def get_file(file_name: str):
         raise HTTPException(status_code=400, detail="Unsupported file type")
     file_path = os.path.join(folder, file_name)
     file_content = ghCatalog.download_file(file_path)
-    return {"file_name": file_name, "file_content": file_content.decode()}
+    # Content hash as ETag so that clients caching the file can revalidate cheaply
+    etag = f'"{hashlib.sha256(file_content).hexdigest()}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content={"file_name": file_name, "file_content": file_content.decode()},
+                        headers={"ETag": etag})
 
 
 @app.delete("/catalog/{file_name}", tags=["catalog"])
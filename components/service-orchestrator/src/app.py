@@ -1,12 +1,18 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Body, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from io import BytesIO
-import requests
+import httpx
+import asyncio
 import base64
+import itertools
 import os
 import re
+import time
 from library.messaging import get_message_client
+from library.metrics import REGISTRY
+from library import codec, upstream
 import json
 import yaml
 
@@ -21,7 +27,20 @@ tags_metadata = [
         "description": "Request management endpoints",
     },
 ]
-app = FastAPI(openapi_tags=tags_metadata)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    for worker in deploy_workers:
+        worker.cancel()
+    await upstream.close()
+
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
+
+# Metrics
+DEPLOYS = REGISTRY.counter("so_deploy_requests_total", "Service deployment requests by outcome", ("outcome",))
+OE_ROUND_TRIP_SECONDS = REGISTRY.histogram("so_oe_round_trip_seconds", "Time from publishing a request to the Optimization Engine until its response is received")
 
 
 class ServiceRequest(BaseModel):
@@ -30,36 +49,191 @@ class ServiceRequest(BaseModel):
     # json_data: dict
 
 
+class ServiceBatchRequest(BaseModel):
+    services: list[ServiceRequest]
+
+
+class ServiceBatchDeleteRequest(BaseModel):
+    service_ids: list[int]
+
+
 # In-memory state storage
 request_states = {}
 deployed_services = {}
 
+# Deployment jobs are queued and run by a pool of background workers, the POST either waits for
+# the result or returns 202 right away (?wait=false). Stage transitions of a request are recorded
+# in its state and pushed to the watchers of GET /requests/{id}/events. Requests that ended are
+# kept for REQUEST_STATE_TTL seconds, and at most REQUEST_STATE_MAX of them.
+DEPLOY_WORKERS = int(os.getenv("DEPLOY_WORKERS", "256"))
+DEPLOY_QUEUE_SIZE = int(os.getenv("DEPLOY_QUEUE_SIZE", "10000"))
+REQUEST_STATE_TTL = float(os.getenv("REQUEST_STATE_TTL", "3600"))
+REQUEST_STATE_MAX = int(os.getenv("REQUEST_STATE_MAX", "10000"))
+TERMINAL_STAGES = ("deployed", "failed")
+# Concurrent IML calls per endpoint within a batch
+IML_ENDPOINT_CONCURRENCY = int(os.getenv("IML_ENDPOINT_CONCURRENCY", "8"))
+deploy_queue = asyncio.Queue(maxsize=DEPLOY_QUEUE_SIZE)
+deploy_workers = []
+request_watchers = {}
+request_ids = itertools.count(1)
+# Ended requests in the order they ended, with the time they did
+finished_requests = {}
+
 TOPOLOGY_MODULE_URL = f"http://{os.getenv("TOPOLOGY_MODULE_HOST", "localhost")}:{os.getenv("TOPOLOGY_MODULE_PORT", "8000")}"
 SERVICE_CATALOG_URL = f"http://{os.getenv("SERVICE_CATALOG_HOST", "localhost")}:{os.getenv("SERVICE_CATALOG_PORT", "8003")}"
 
 
-@app.post("/services", tags=["services"])
-async def deploy_service(service_request: ServiceRequest = Body(...)):
-    request_id = len(request_states) + 1
+class DeploymentLookups:
+    # Catalog downloads and site lookups of a deployment. The requests of a batch share one, so
+    # every NSD and every site is fetched once and the IML calls are grouped by endpoint.
+    def __init__(self, shared: bool = False):
+        self.shared = shared
+        self.files = {}
+        self.sites = {}
+        self.iml_slots = {}
+
+    def file(self, name: str) -> asyncio.Task:
+        if name not in self.files:
+            self.files[name] = asyncio.create_task(download_file_from_catalog(name))
+        return self.files[name]
+
+    def site(self, site_id: str) -> asyncio.Task:
+        if site_id not in self.sites:
+            self.sites[site_id] = asyncio.create_task(upstream.topology.request("GET", f"{TOPOLOGY_MODULE_URL}/nodes/{site_id}"))
+        return self.sites[site_id]
+
+    def discard(self, task: asyncio.Task):
+        # A lookup nobody else waits for is not needed anymore
+        if not self.shared:
+            task.cancel()
+
+    def iml_slot(self, iml_endpoint: str) -> asyncio.Semaphore:
+        if iml_endpoint not in self.iml_slots:
+            self.iml_slots[iml_endpoint] = asyncio.Semaphore(IML_ENDPOINT_CONCURRENCY)
+        return self.iml_slots[iml_endpoint]
+
+
+def set_stage(request_id: int, stage: str, **details):
+    state = request_states[request_id]
+    event = {"request": request_id, "stage": stage, "status": state["status"], "at": time.time(), **details}
+    state["stage"] = stage
+    state["stages"].append(event)
+    for watcher in request_watchers.get(request_id, ()):
+        watcher.put_nowait(event)
+    if stage in TERMINAL_STAGES:
+        finished_requests[request_id] = time.monotonic()
+
+
+def evict_finished_requests():
+    now = time.monotonic()
+    while finished_requests:
+        request_id, finished_at = next(iter(finished_requests.items()))
+        if now - finished_at < REQUEST_STATE_TTL and len(finished_requests) <= REQUEST_STATE_MAX:
+            break
+        del finished_requests[request_id]
+        request_states.pop(request_id, None)
+        request_watchers.pop(request_id, None)
+
+
+def start_deploy_workers():
+    if not deploy_workers:
+        deploy_workers.extend(asyncio.create_task(deploy_worker()) for _ in range(DEPLOY_WORKERS))
+
+
+async def deploy_worker():
+    while True:
+        request_id, service_request, lookups, done = await deploy_queue.get()
+        try:
+            response = await run_deployment(request_id, service_request, lookups)
+        except HTTPException as e:
+            response = e
+            request_states[request_id]["status"] = "failed"
+            request_states[request_id]["result"] = {"detail": e.detail}
+            set_stage(request_id, "failed", code=e.status_code)
+        except Exception as e:
+            print(f"Error deploying request {request_id}: {e}")
+            response = HTTPException(status_code=500, detail="Internal error during deployment")
+            request_states[request_id]["status"] = "failed"
+            request_states[request_id]["result"] = {"detail": response.detail}
+            set_stage(request_id, "failed", code=500)
+        else:
+            result = json.loads(response.body)
+            request_states[request_id]["result"] = result
+            set_stage(request_id, "deployed" if result.get("status") == "deployed" else "failed", code=response.status_code)
+        finally:
+            deploy_queue.task_done()
+        # Waiting callers get the response of the synchronous API
+        if done is not None and not done.done():
+            if isinstance(response, Exception):
+                done.set_exception(response)
+            else:
+                done.set_result(response)
+
+
+def create_request(service_request: ServiceRequest) -> int:
+    evict_finished_requests()
+    request_id = next(request_ids)
     request_states[request_id] = {
-        "status": "processing", "input": {"name": service_request.name, "site_id": service_request.site_id}, "output": None}
+        "status": "processing", "input": {"name": service_request.name, "site_id": service_request.site_id}, "output": None,
+        "stage": None, "stages": [], "result": None}
+    return request_id
 
-    file_name = service_request.name
+
+def enqueue_deployment(request_id: int, service_request: ServiceRequest, wait: bool, lookups: DeploymentLookups | None = None):
+    # Returns the future of the response when waiting. Raises HTTPException 503 when the queue is full.
+    done = asyncio.get_running_loop().create_future() if wait else None
     try:
-        file_content = download_file_from_catalog(file_name)
-        if file_content is None:
-            raise HTTPException(
-                status_code=404, detail=f"File {file_name} not found in the service catalog")
-    except:
+        deploy_queue.put_nowait((request_id, service_request, lookups or DeploymentLookups(), done))
+    except asyncio.QueueFull:
+        request_states[request_id]["status"] = "failed"
+        set_stage(request_id, "failed", code=503)
+        DEPLOYS.inc(outcome="queue_full")
+        raise HTTPException(status_code=503, detail="Deployment queue is full")
+    set_stage(request_id, "queued")
+    start_deploy_workers()
+    return done
+
+
+@app.post("/services", tags=["services"])
+async def deploy_service(service_request: ServiceRequest = Body(...), wait: bool = True):
+    request_id = create_request(service_request)
+    done = enqueue_deployment(request_id, service_request, wait)
+    if not wait:
+        return JSONResponse(status_code=202, headers={"Location": f"/requests/{request_id}"},
+                            content={"request": request_id, "status": "processing", "stage": "queued",
+                                     "events": f"/requests/{request_id}/events"})
+    return await done
+
+
+async def run_deployment(request_id: int, service_request: ServiceRequest, lookups: DeploymentLookups):
+    file_name = service_request.name
+    site_id = service_request.site_id
+    set_stage(request_id, "fetching")
+    # The catalog download and the site lookup run concurrently
+    site_lookup = lookups.site(site_id)
+    file_content = await lookups.file(file_name)
+    if file_content is None:
+        lookups.discard(site_lookup)
+        DEPLOYS.inc(outcome="catalog_error")
         raise HTTPException(
             status_code=500, detail=f"Error downloading file from catalog")
 
-    await client.send_message(base64.b64encode(file_content.encode()))
+    sent_at = time.perf_counter()
+    set_stage(request_id, "optimizing")
+    # The OE works on the request while the site is checked, its reply is matched by correlation id
+    reply = asyncio.create_task(client.request(*codec.encode_request(file_content)))
 
-    site_id = service_request.site_id
     # Check if the site exists in the topology component
-    response = requests.get(f"{TOPOLOGY_MODULE_URL}/nodes/{site_id}")
+    try:
+        response = await site_lookup
+    except httpx.HTTPError as e:
+        print(f"Error looking up site {site_id}: {e}")
+        reply.cancel()
+        DEPLOYS.inc(outcome="topology_error")
+        raise HTTPException(status_code=502, detail="Topology module unavailable")
     if response.status_code != 200:
+        reply.cancel()
+        DEPLOYS.inc(outcome="unknown_site")
         raise HTTPException(status_code=response.status_code,
                             detail="Site not found")
     site_dict = response.json()
@@ -69,7 +243,9 @@ async def deploy_service(service_request: ServiceRequest = Body(...)):
         print("IML endpoint not found in the site dictionary, using default.")
         iml_endpoint = "http://localhost:5000"  # Default value if not found
 
-    response_content = await client.receive_message()
+    response_content = await reply
+    if response_content is not None:
+        OE_ROUND_TRIP_SECONDS.observe(time.perf_counter() - sent_at)
     response_content=interpret_message(response_content)
     if response_content:
         print(f"Received final message: {response_content}")
@@ -77,10 +253,12 @@ async def deploy_service(service_request: ServiceRequest = Body(...)):
         request_states[request_id]["output"] = response_content
         if "Error" in response_content:
             request_states[request_id]["status"] = "failed"
+            DEPLOYS.inc(outcome="oe_error")
             return JSONResponse(content={"message": "Error in Optimization Engine", "status": "failed",
                                          "error": f"Optimization Engine error: {response_content["Error"]}"})
         if "Failed" in response_content:
             request_states[request_id]["status"] = "failed"
+            DEPLOYS.inc(outcome="oe_failed")
             return JSONResponse(content={"message": "Failure in Optimization Engine", "status": "failed",
                                          "error": f"Optimization Engine failure: {response_content["Failed"]}"})
         yaml_file_content = yaml.dump(response_content).encode('utf-8')
@@ -93,11 +271,13 @@ async def deploy_service(service_request: ServiceRequest = Body(...)):
         file_like_object = BytesIO(yaml_file_content)
         
         files = {'file': ('demo_nsd.yml', file_like_object)}
+        set_stage(request_id, "deploying", iml_endpoint=iml_endpoint)
         
         try:
-            # The timeout tuple is set to (0.5, 10) seconds for connection and read timeouts respectively.
+            # Connection and read timeouts are IML_CONNECT_TIMEOUT and IML_READ_TIMEOUT (0.5 and 10 seconds).
             # TODO: When integrating with IML, we need to increase the connection timeout.
-            iml_response = requests.post(f"{iml_endpoint}", files=files, timeout=(0.5, 10))
+            async with lookups.iml_slot(iml_endpoint):
+                iml_response = await upstream.iml.request("POST", f"{iml_endpoint}", files=files)
             # print(iml_response.json())
             # import pdb;pdb.set_trace()
 
@@ -113,12 +293,14 @@ async def deploy_service(service_request: ServiceRequest = Body(...)):
             service_name = structured_dict["Deployed"]
             deployed_services[service_id] = {
                 "status": "deployed", "service_name": service_name, "file_name": file_name, "site_id": site_id, "iml_endpoint": iml_endpoint}
+            DEPLOYS.inc(outcome="deployed")
 
             # return JSONResponse(content={"message": "Received", "data": iml_response.json(), "file": base64.b64decode(response_content).decode(), "site_id": site_id, "service_id": service_id })
             return JSONResponse(content={"message": "Received", "status": "deployed", "service_name": service_name,
                                          "file_name": file_name, "site_id": site_id, "iml_endpoint": iml_endpoint})
         except:
             request_states[request_id]["status"] = "failed"
+        DEPLOYS.inc(outcome="iml_failed")
         return JSONResponse(content={"message": "Failed to deploy service to IML", "status": "failed",
                                      "service_name": service_request.name, "site_id": site_id,
                                      "iml_endpoint": iml_endpoint,
@@ -126,33 +308,93 @@ async def deploy_service(service_request: ServiceRequest = Body(...)):
     else:
         print("No final message received.")
         request_states[request_id]["status"] = "failed"
+        DEPLOYS.inc(outcome="no_response")
         return JSONResponse(content={"message": "No Message"})
 
 
+@app.post("/services/batch", tags=["services"])
+async def deploy_service_batch(batch: ServiceBatchRequest = Body(...)):
+    # All items start at once: every NSD and site is fetched once, each OE request is sent as soon
+    # as its NSD is there, and the IML calls of the batch are limited per endpoint
+    lookups = DeploymentLookups(shared=True)
+    jobs = []
+    for service_request in batch.services:
+        request_id = create_request(service_request)
+        try:
+            jobs.append((request_id, enqueue_deployment(request_id, service_request, True, lookups)))
+        except HTTPException as e:
+            jobs.append((request_id, e))
+    results = []
+    for (request_id, done), service_request in zip(jobs, batch.services):
+        item = {"request": request_id, "name": service_request.name, "site_id": service_request.site_id}
+        try:
+            response = await done if isinstance(done, asyncio.Future) else done
+            if isinstance(response, HTTPException):
+                raise response
+            results.append({**item, "code": response.status_code, **json.loads(response.body)})
+        except HTTPException as e:
+            results.append({**item, "code": e.status_code, "status": "failed", "detail": e.detail})
+    deployed = sum(1 for result in results if result.get("status") == "deployed")
+    return JSONResponse(content={"deployed": deployed, "failed": len(results) - deployed, "results": results})
+
+
+@app.delete("/services/batch", tags=["services"])
+async def delete_service_batch(batch: ServiceBatchDeleteRequest = Body(...)):
+    # Services are torn down concurrently, limited per IML endpoint
+    iml_slots = {}
+
+    async def teardown(service_id):
+        if service_id not in deployed_services:
+            return {"service_id": service_id, "code": 404, "status": "not_found"}
+        iml_endpoint = deployed_services[service_id]["iml_endpoint"]
+        slot = iml_slots.setdefault(iml_endpoint, asyncio.Semaphore(IML_ENDPOINT_CONCURRENCY))
+        async with slot:
+            error = await delete_from_iml(service_id)
+        result = {"service_id": service_id, "code": 200, "status": "deleted", "iml_endpoint": iml_endpoint}
+        if error:
+            result["iml_error"] = error
+        return result
+
+    results = await asyncio.gather(*(teardown(service_id) for service_id in dict.fromkeys(batch.service_ids)))
+    deleted = sum(1 for result in results if result["status"] == "deleted")
+    return JSONResponse(content={"deleted": deleted, "not_found": len(results) - deleted, "results": list(results)})
+
+
 @app.get("/services", tags=["services"])
 async def get_services():
     return JSONResponse(content={"deployed_services": list(deployed_services.keys())})
 
 
 @app.get("/services/{service_id}", tags=["services"])
-async def get_service_by_id(service_id: str):
+async def get_service_by_id(service_id: int):
     if service_id not in deployed_services:
         raise HTTPException(status_code=404, detail="Service not found")
     return JSONResponse(content={"service_name": service_id, "details": deployed_services[service_id]})
 
 
 @app.delete("/services/{service_id}", tags=["services"])
-async def delete_service(service_id: str):
+async def delete_service(service_id: int):
     if service_id not in deployed_services:
         raise HTTPException(status_code=404, detail="Service not found")
+    await delete_from_iml(service_id)
+    return JSONResponse(content={"message": "Service deleted", "service_id": service_id})
+
+
+async def delete_from_iml(service_id) -> str | None:
+    # Returns the error of the IML call, if any
     iml_endpoint = deployed_services[service_id]["iml_endpoint"]
+    error = None
 
     # TODO: Check if the deletion was successful
-    response = requests.delete(f"{iml_endpoint}/{service_id}")
+    try:
+        response = await upstream.iml.request("DELETE", f"{iml_endpoint}/{service_id}")
+    except httpx.HTTPError as e:
+        print(f"Error deleting service {service_id} from IML: {e}")
+        error = str(e) or type(e).__name__
 
     # Remove the service from the deployed_services dictionary
-    del deployed_services[service_id]
-    return JSONResponse(content={"message": "Service deleted", "service_id": service_id})
+    deployed_services.pop(service_id, None)
+    return error
 
 
 @app.get("/requests", tags=["requests"])
@@ -167,16 +409,49 @@ async def get_request_by_id(request_id: int):
     return JSONResponse(content={"request": request_id, "details": request_states[request_id]})
 
 
-def download_file_from_catalog(file_name: str) -> str | None:
+@app.get("/requests/{request_id}/events", tags=["requests"])
+async def stream_request_events(request_id: int):
+    # Server-sent events: the stages reached so far, then every transition until the request ends
+    if request_id not in request_states:
+        raise HTTPException(status_code=404, detail="Request not found")
+    history = list(request_states[request_id]["stages"])
+    watcher = asyncio.Queue()
+    request_watchers.setdefault(request_id, []).append(watcher)
+
+    async def events():
+        try:
+            for event in history:
+                yield f"event: stage\ndata: {json.dumps(event)}\n\n"
+            stage = history[-1]["stage"] if history else None
+            while stage not in TERMINAL_STAGES:
+                event = await watcher.get()
+                stage = event["stage"]
+                yield f"event: stage\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # The request may have been evicted in the meantime
+            watchers = request_watchers.get(request_id, [])
+            if watcher in watchers:
+                watchers.remove(watcher)
+            if not watchers:
+                request_watchers.pop(request_id, None)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+async def download_file_from_catalog(file_name: str) -> str | None:
     url = f'{SERVICE_CATALOG_URL}/retrieve/{file_name}'
     print(f"Downloading file from {url}")
     try:
-        response = requests.get(url)
-        print(f"Response status code: {response.status_code}")
-        response.raise_for_status()
-    except:
-        print(f"Error downloading file: {response.text}")
+        response = await upstream.service_catalog.request("GET", url)
+    except httpx.HTTPError as e:
+        print(f"Error downloading file: {e}")
         return None
+    print(f"Response status code: {response.status_code}")
     if response.status_code == 200:
         return response.json()["file_content"]
     else:
@@ -186,19 +461,33 @@ def download_file_from_catalog(file_name: str) -> str | None:
 def interpret_message(message):
     if message is None:
         return None
+    # Typed replies are already decoded by the messaging client
+    if not isinstance(message, (str, bytes)):
+        return message
+    if isinstance(message, bytes):
+        message = message.decode('utf-8', errors='replace')
+    # Legacy replies are JSON. A JSON string is the request relayed as received (base64 YAML),
+    # anything that is not JSON is tried as base64 and then as JSON or YAML.
     try:
-        message = base64.b64decode(message).decode('utf-8')
+        msg = json.loads(message)
+        if not isinstance(msg, str):
+            return msg
+        message = msg
+    except ValueError:
+        pass
+    try:
+        message = base64.b64decode(message, validate=True).decode('utf-8')
     except Exception:
         pass
     msg = ""
     try:
         msg = json.loads(message)
-    except:
-        pass
-    try:
-        msg = yaml.safe_load(message)
-    except:
-        pass
+    except ValueError:
+        # Only fall back to YAML when the message is not JSON
+        try:
+            msg = yaml.load(message, Loader=codec.YAML_LOADER)
+        except yaml.YAMLError:
+            pass
     if isinstance(msg, str):
         if msg == "":
             return None
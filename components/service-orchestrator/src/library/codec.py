@@ -0,0 +1,91 @@
+# SO <-> OE message codec
+#
+# With MESSAGE_CODEC=msgpack (or json) service requests are sent as MessagePack (or JSON) with a
+# content-type header and, above a size threshold, zstd compressed (content-encoding header).
+# The Optimization Engine replies in the same format. MESSAGE_CODEC=legacy keeps the base64
+# encoded YAML requests and untyped JSON replies. The format is a configuration switch, not
+# negotiated: every Optimization Engine behind INPUT_TOPIC must understand it.
+#
+# YAML timestamps (dates and datetimes) are sent as ISO 8601 strings and sets as lists, a
+# request holding anything else MessagePack/JSON cannot represent is sent in the legacy format.
+
+import base64
+import datetime
+import json
+import os
+import yaml
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MSGPACK = "application/msgpack"
+JSON = "application/json"
+ZSTD = "zstd"
+
+CONTENT_TYPES = {"msgpack": MSGPACK, "json": JSON}
+
+MESSAGE_CODEC = os.getenv("MESSAGE_CODEC", "msgpack" if msgpack is not None else "legacy")
+MESSAGE_COMPRESS_THRESHOLD = int(os.getenv("MESSAGE_COMPRESS_THRESHOLD", "16384"))
+MESSAGE_COMPRESS_LEVEL = int(os.getenv("MESSAGE_COMPRESS_LEVEL", "3"))
+
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _default(value):
+    # Values of YAML documents that have no MessagePack/JSON counterpart
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} cannot be encoded")
+
+
+def encode(payload, content_type):
+    # Returns (body, content_encoding), raises TypeError for values that cannot be encoded
+    if content_type == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        body = msgpack.packb(payload, use_bin_type=True, default=_default)
+    elif content_type == JSON:
+        body = json.dumps(payload, separators=(",", ":"), default=_default).encode('utf-8')
+    else:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    if zstandard is not None and 0 < MESSAGE_COMPRESS_THRESHOLD <= len(body):
+        return zstandard.ZstdCompressor(level=MESSAGE_COMPRESS_LEVEL).compress(body), ZSTD
+    return body, None
+
+
+def decode(body, content_type, content_encoding=None):
+    if content_encoding == ZSTD:
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif content_encoding not in (None, "", "identity"):
+        raise ValueError(f"Unsupported content encoding: {content_encoding}")
+    if content_type == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(body, raw=False)
+    if content_type == JSON:
+        return json.loads(body)
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+
+def encode_request(file_content: str):
+    # Returns (body, content_type, content_encoding) for a service request read from the catalog
+    content_type = CONTENT_TYPES.get(MESSAGE_CODEC)
+    if content_type is not None and (content_type != MSGPACK or msgpack is not None):
+        try:
+            body, content_encoding = encode(yaml.load(file_content, Loader=YAML_LOADER), content_type)
+            return body, content_type, content_encoding
+        except TypeError as e:
+            print(f"Sending the service request in the legacy format: {e}")
+    return base64.b64encode(file_content.encode()), None, None
+
@@ -1,26 +1,77 @@
 from abc import ABC, abstractmethod
-from kafka import KafkaProducer, KafkaConsumer
-from kafka.errors import KafkaError
+from aiokafka import AIOKafkaProducer, AIOKafkaConsumer
+from aiokafka.errors import KafkaError
 from typing import Optional
 import asyncio
-from aio_pika import connect_robust, Message
-from aio_pika.exceptions import QueueEmpty, AMQPConnectionError
+import time
+import uuid
+from aio_pika import connect_robust, Message, IncomingMessage
+from aio_pika.exceptions import AMQPConnectionError
 import os
+from library import codec
 
 
 class MessageClient(ABC):
+    # Requests are published with a correlation id and the queue/topic of this client to reply to.
+    # A single consumer hands every reply to the request waiting for its correlation id, so any
+    # number of requests can be in flight and each is answered as soon as the OE replies.
+
+    def __init__(self, input_topic: str, final_topic: str, reply_timeout: float):
+        self.input_topic = input_topic
+        self.final_topic = final_topic
+        self.reply_timeout = reply_timeout
+        self._pending: dict[str, asyncio.Future] = {}
+        self._connect_lock = asyncio.Lock()
+
     @abstractmethod
     async def connect(self):
         pass
 
     @abstractmethod
-    async def send_message(self, message: bytes):
+    def connected(self) -> bool:
         pass
 
     @abstractmethod
-    async def receive_message(self) -> str | None:
+    async def _publish(self, message: bytes, content_type: str | None, content_encoding: str | None,
+                       correlation_id: str):
+        # Raises when the broker is not reachable
         pass
 
+    def _resolve(self, correlation_id: str | None, body: bytes, content_type: str | None, content_encoding: str | None):
+        future = self._pending.pop(correlation_id, None) if correlation_id else None
+        if future is None or future.done():
+            # Late replies of requests that timed out, or replies without a correlation id
+            print(f"Dropping reply without a waiting request (correlation_id={correlation_id})")
+            return
+        try:
+            future.set_result(decode_body(body, content_type, content_encoding))
+        except Exception as e:
+            future.set_exception(e)
+
+    async def request(self, message: bytes, content_type: str | None = None, content_encoding: str | None = None,
+                      timeout: float | None = None) -> str | object | None:
+        # Sends a request and waits for its reply, None on timeout
+        correlation_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[correlation_id] = future
+        try:
+            await self._publish(message, content_type, content_encoding, correlation_id)
+            return await asyncio.wait_for(future, self.reply_timeout if timeout is None else timeout)
+        except (AMQPConnectionError, KafkaError) as e:
+            print(f"Error sending message: {e}")
+            return None
+        except asyncio.TimeoutError:
+            print(f"No reply to request {correlation_id} within the timeout.")
+            return None
+        finally:
+            self._pending.pop(correlation_id, None)
+
+
+def decode_body(body: bytes, content_type: str | None, content_encoding: str | None):
+    if content_type:
+        return codec.decode(body, content_type, content_encoding)
+    return body.decode()
+
 
 def get_message_client() -> MessageClient:
     backend = os.getenv("MESSAGING_SYSTEM", "rabbitmq")
@@ -29,7 +80,8 @@ def get_message_client() -> MessageClient:
             kafka_bootstrap_servers=os.getenv(
                 "KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"),
             input_topic=os.getenv("INPUT_TOPIC", "input_topic"),
-            final_topic=os.getenv("FINAL_TOPIC", "final_topic")
+            final_topic=os.getenv("FINAL_TOPIC", "final_topic"),
+            reply_timeout=float(os.getenv("OE_REPLY_TIMEOUT", "60"))
         )
 
     if backend == "rabbitmq":
@@ -37,113 +89,133 @@ def get_message_client() -> MessageClient:
             rabbitmq_host=os.getenv("RABBITMQ_HOST", "localhost"),
             input_topic=os.getenv("INPUT_TOPIC", "input_topic"),
             final_topic=os.getenv("FINAL_TOPIC", "final_topic"),
-            max_retries=int(os.getenv("RABBITMQ_MAX_RETRIES", 150))
+            reply_timeout=float(os.getenv("OE_REPLY_TIMEOUT", "60"))
         )
     raise ValueError(f"Invalid messaging system specified: {backend}")
 
 
 class KafkaClient(MessageClient):
-    producer: Optional[KafkaProducer]
-    consumer: Optional[KafkaConsumer]
-
-    def __init__(self, kafka_bootstrap_servers: str, input_topic: str, final_topic: str):
+    # Requests are keyed by their correlation id, so they spread over the partitions of the input
+    # topic. The producer batches (KAFKA_LINGER_MS, KAFKA_MAX_BATCH_SIZE) and compresses
+    # (KAFKA_COMPRESSION) them. Replies are read from every partition of the final topic without
+    # a consumer group, each orchestrator instance sees all replies and keeps its own.
+    producer: Optional[AIOKafkaProducer]
+    consumer: Optional[AIOKafkaConsumer]
+
+    def __init__(self, kafka_bootstrap_servers: str, input_topic: str, final_topic: str, reply_timeout: float):
+        super().__init__(input_topic, final_topic, reply_timeout)
         self.kafka_bootstrap_servers = kafka_bootstrap_servers
-        self.input_topic = input_topic
-        self.final_topic = final_topic
         self.producer = None
         self.consumer = None
+        self._consumer_task = None
+
+    def connected(self) -> bool:
+        return self.producer is not None
 
     async def connect(self):
-        try:
-            self.producer = KafkaProducer(
-                bootstrap_servers=self.kafka_bootstrap_servers)
-            self.consumer = KafkaConsumer(
-                self.final_topic, bootstrap_servers=self.kafka_bootstrap_servers)
-        except KafkaError as e:
-            print(f"Error connecting to Kafka: {e}")
-            self.producer = None  # Explicitly set to None on failure
-            self.consumer = None
-
-    async def send_message(self, message: bytes):
-        try:
-            if self.producer is None:
-                await self.connect()
-            if self.producer is None:
-                raise KafkaError("Producer is not connected")
-
-            future = self.producer.send(self.input_topic, message)
-            record_metadata = future.get(timeout=10)
-            print("Message sent successfully:", record_metadata)
-        except KafkaError as e:
-            print("Error sending message:", e)
-
-    async def receive_message(self) -> str | None:
-        try:
-            if self.consumer is None:
-                await self.connect()
-            if self.consumer is None:
-                raise KafkaError("Consumer is not connected")
-            for message in self.consumer:
-                return message.value.decode()
-        except KafkaError as e:
-            print("Error receiving message:", e)
+        async with self._connect_lock:
+            if self.producer is not None:
+                return
+            producer = AIOKafkaProducer(
+                bootstrap_servers=self.kafka_bootstrap_servers,
+                linger_ms=int(os.getenv("KAFKA_LINGER_MS", "5")),
+                max_batch_size=int(os.getenv("KAFKA_MAX_BATCH_SIZE", str(256 * 1024))),
+                compression_type=os.getenv("KAFKA_COMPRESSION", "zstd") or None)
+            consumer = AIOKafkaConsumer(
+                self.final_topic, bootstrap_servers=self.kafka_bootstrap_servers, group_id=None,
+                auto_offset_reset="latest",
+                fetch_max_wait_ms=int(os.getenv("KAFKA_FETCH_MAX_WAIT_MS", "50")))
+            try:
+                await producer.start()
+                await consumer.start()
+                # Resolve the end offsets now, a reply published before the first fetch is not missed
+                if consumer.assignment():
+                    await consumer.seek_to_end()
+            except KafkaError as e:
+                print(f"Error connecting to Kafka: {e}")
+                await producer.stop()
+                await consumer.stop()
+                return
+            self.producer, self.consumer = producer, consumer
+            self._consumer_task = asyncio.create_task(self._consume())
+
+    async def _consume(self):
+        while True:
+            try:
+                batches = await self.consumer.getmany(timeout_ms=1000)
+            except KafkaError as e:
+                print(f"Error receiving message: {e}")
+                await asyncio.sleep(1)
+                continue
+            for records in batches.values():
+                for record in records:
+                    headers = {key: value.decode() for key, value in (record.headers or [])}
+                    self._resolve(headers.get("correlation-id"), record.value,
+                                  headers.get("content-type"), headers.get("content-encoding"))
+
+    async def _publish(self, message: bytes, content_type: str | None, content_encoding: str | None,
+                       correlation_id: str):
+        if self.producer is None:
+            await self.connect()
+        if self.producer is None:
+            raise KafkaError("Producer is not connected")
+
+        headers = [(key, value.encode()) for key, value in
+                   (("content-type", content_type), ("content-encoding", content_encoding),
+                    ("correlation-id", correlation_id), ("reply-to", self.final_topic)) if value]
+        # Waits for the batch to be delivered, so a broker error fails the request right away
+        # instead of running into the reply timeout
+        await self.producer.send_and_wait(self.input_topic, message, key=correlation_id.encode(), headers=headers)
 
 
 class RabbitMQClient(MessageClient):
+    # Replies come back on a queue of this client only, named after the final topic. It is
+    # exclusive and auto-deleted, so another orchestrator instance never takes (and drops) a reply
+    # meant for this one.
 
-    def __init__(self, rabbitmq_host: str, input_topic: str, final_topic: str, max_retries: int):
+    def __init__(self, rabbitmq_host: str, input_topic: str, final_topic: str, reply_timeout: float):
+        super().__init__(input_topic, final_topic, reply_timeout)
         self.rabbitmq_host = rabbitmq_host
-        self.input_topic = input_topic
-        self.final_topic = final_topic
+        self.reply_queue = f"{final_topic}.{uuid.uuid4().hex}"
         self.channel = None
         self.connection = None
-        self.max_retries = max_retries
         print("input_topic: %s, output_topic:%s, rabbitmqhost=%s " %
               (input_topic, final_topic, rabbitmq_host))
 
-    async def connect(self):
-        try:
-            self.connection = await connect_robust(f"amqp://{self.rabbitmq_host}/")
-            self.channel = await self.connection.channel()
-            await self.channel.declare_queue(self.input_topic)
-            await self.channel.declare_queue(self.final_topic)
-        except AMQPConnectionError as e:
-            print(f"Error connecting to RabbitMQ: {e}")
-
-    async def send_message(self, message: bytes):
-        try:
-            if self.channel is None or self.connection is None:
-                await self.connect()
-            if self.channel is None:
-                raise AMQPConnectionError("Channel is not connected")
-
-            await self.channel.default_exchange.publish(
-                Message(body=message),
-                routing_key=self.input_topic
-            )
-        except AMQPConnectionError as e:
-            print(f"Error sending message: {e}")
+    def connected(self) -> bool:
+        return self.channel is not None and self.connection is not None
 
-    async def receive_message(self) -> str | None:
-        try:
-            if self.channel is None or self.connection is None:
-                await self.connect()
-
-            if self.channel is None:
-                raise AMQPConnectionError("Channel is not connected")
-
-            queue = await self.channel.get_queue(self.final_topic)
-            for _ in range(self.max_retries):
-                try:
-                    message = await queue.get(timeout=3)
-                    if message:
-                        await message.ack()
-                        return message.body.decode()
-                except QueueEmpty:
-                    print("No message yet available in the queue.")
-                    # Wait for 3 seconds before retrying
-                    await asyncio.sleep(3)
-            print("No message available after retrying.")
-            return None
-        except AMQPConnectionError as e:
-            print(f"Error receiving message: {e}")
+    async def connect(self):
+        async with self._connect_lock:
+            if self.channel is not None:
+                return
+            try:
+                self.connection = await connect_robust(f"amqp://{self.rabbitmq_host}/")
+                channel = await self.connection.channel()
+                await channel.declare_queue(self.input_topic)
+                reply_queue = await channel.declare_queue(self.reply_queue, exclusive=True, auto_delete=True)
+                # The robust connection declares the queue again and restores the consumer after a reconnect
+                await reply_queue.consume(self._on_reply)
+                self.channel = channel
+            except AMQPConnectionError as e:
+                print(f"Error connecting to RabbitMQ: {e}")
+
+    async def _on_reply(self, message: IncomingMessage):
+        async with message.process():
+            self._resolve(message.correlation_id, message.body, message.content_type, message.content_encoding)
+
+    async def _publish(self, message: bytes, content_type: str | None, content_encoding: str | None,
+                       correlation_id: str):
+        if not self.connected():
+            await self.connect()
+        if self.channel is None:
+            raise AMQPConnectionError("Channel is not connected")
+        # The OE measures the queue wait from the publish time, the AMQP timestamp only has whole
+        # seconds so the exact time also goes in the sent-at header
+        sent_at = time.time()
+        await self.channel.default_exchange.publish(
+            Message(body=message, content_type=content_type, content_encoding=content_encoding,
+                    correlation_id=correlation_id, reply_to=self.reply_queue,
+                    timestamp=sent_at, headers={"sent-at": sent_at}),
+            routing_key=self.input_topic
+        )
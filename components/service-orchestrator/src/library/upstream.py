@@ -0,0 +1,116 @@
+# Async HTTP clients for the upstream modules (Service Catalog, Topology, IML)
+#
+# Every upstream has its own httpx.AsyncClient, so a slow upstream only exhausts its own
+# connection pool. Calls get connect/read timeouts and an overall deadline. Failed calls are
+# retried (connection errors and timeouts, 502/503/504 responses) while the upstream's retry
+# budget lasts: every call earns UPSTREAM_RETRY_BUDGET retries, so an upstream that is down is
+# not hit with UPSTREAM_RETRIES + 1 times the load.
+
+import asyncio
+import os
+import time
+import httpx
+from library.metrics import REGISTRY
+
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "1.0"))
+UPSTREAM_READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", "5.0"))
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "10.0"))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "100"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BUDGET = float(os.getenv("UPSTREAM_RETRY_BUDGET", "0.2"))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.05"))
+# Deployments to the IML take longer than the lookups
+IML_CONNECT_TIMEOUT = float(os.getenv("IML_CONNECT_TIMEOUT", "0.5"))
+IML_READ_TIMEOUT = float(os.getenv("IML_READ_TIMEOUT", "10.0"))
+IML_DEADLINE = float(os.getenv("IML_DEADLINE", "15.0"))
+
+RETRY_STATUS = (502, 503, 504)
+# Retries an idle upstream may spend at once
+RETRY_BUDGET_BURST = 10.0
+
+UPSTREAM_SECONDS = REGISTRY.histogram("so_upstream_request_seconds", "Latency of upstream HTTP calls", ("upstream",))
+UPSTREAM_ERRORS = REGISTRY.counter("so_upstream_errors_total", "Failed upstream HTTP calls", ("upstream",))
+UPSTREAM_RETRIES_TOTAL = REGISTRY.counter("so_upstream_retries_total", "Retried upstream HTTP calls", ("upstream",))
+
+
+class RetryBudget:
+    def __init__(self, ratio: float, burst: float = RETRY_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class Upstream:
+    def __init__(self, name: str, connect_timeout: float, read_timeout: float, deadline: float):
+        self.name = name
+        self.deadline = deadline
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.budget = RetryBudget(UPSTREAM_RETRY_BUDGET)
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            limits = httpx.Limits(max_connections=UPSTREAM_POOL_SIZE, max_keepalive_connections=UPSTREAM_POOL_SIZE)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        return self._client
+
+    async def request(self, method: str, url: str, deadline: float | None = None, **kwargs) -> httpx.Response:
+        # Returns the response whatever its status, raises httpx.HTTPError when there is none
+        deadline = self.deadline if deadline is None else deadline
+        try:
+            async with asyncio.timeout(deadline):
+                return await self._request(method, url, **kwargs)
+        except TimeoutError:
+            UPSTREAM_ERRORS.inc(upstream=self.name)
+            raise httpx.TimeoutException(f"{self.name} did not answer within the {deadline:.1f}s deadline")
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        self.budget.deposit()
+        # Only lookups are repeated after a response, a deployment only when it never reached the IML
+        idempotent = method in ("GET", "HEAD", "DELETE")
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+                retry = idempotent and response.status_code in RETRY_STATUS
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                error, response, retry = e, None, True
+            except httpx.HTTPError as e:
+                error, response, retry = e, None, idempotent
+            finally:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, upstream=self.name)
+            if response is None or response.status_code >= 500:
+                UPSTREAM_ERRORS.inc(upstream=self.name)
+            if not retry or attempt >= UPSTREAM_RETRIES or not self.budget.withdraw():
+                if response is None:
+                    raise error
+                return response
+            attempt += 1
+            UPSTREAM_RETRIES_TOTAL.inc(upstream=self.name)
+            await asyncio.sleep(UPSTREAM_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+service_catalog = Upstream("service_catalog", UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, UPSTREAM_DEADLINE)
+topology = Upstream("topology", UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, UPSTREAM_DEADLINE)
+iml = Upstream("iml", IML_CONNECT_TIMEOUT, IML_READ_TIMEOUT, IML_DEADLINE)
+
+
+async def close():
+    for upstream in (service_catalog, topology, iml):
+        await upstream.close()
@@ -0,0 +1,6 @@
+# Tests import the SO library the way app.py does (src on the path), app.py itself needs Python 3.12
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
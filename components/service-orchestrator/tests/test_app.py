@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+import json
+import sys
+import pytest
+
+if sys.version_info < (3, 12):
+    pytest.skip("app.py needs Python 3.12", allow_module_level=True)
+
+import httpx
+import app
+from library import upstream
+
+
+class OptimizationEngine:
+    # Answers every request with a placement, or with the given reply
+    def __init__(self, reply=None):
+        self.reply = reply or {"lnsd": {"ns": {}}}
+        self.requests = 0
+
+    async def request(self, *args, **kwargs):
+        self.requests += 1
+        await asyncio.sleep(0.01)
+        return self.reply
+
+
+class Upstreams:
+    # Service Catalog, Topology and IML, every site has its own IML endpoint
+    def __init__(self):
+        self.calls = []
+        self.deployed = 0
+
+    async def __call__(self, request):
+        path = request.url.path
+        self.calls.append((request.method, request.url.host, path))
+        if path.startswith("/retrieve/"):
+            return httpx.Response(200, json={"file_content": "lnsd: {}\n"})
+        if path.startswith("/nodes/"):
+            site_id = path.rsplit("/", 1)[1]
+            if site_id == "UNKNOWN":
+                return httpx.Response(404)
+            return httpx.Response(200, json={"iml_endpoint": f"http://iml-{site_id.lower()}:5000"})
+        if request.method == "DELETE":
+            return httpx.Response(200, json={})
+        self.deployed += 1
+        return httpx.Response(200, json={"response": "{id: %d, Deployed: svc%d}" % (self.deployed, self.deployed)})
+
+
+@pytest.fixture
+def so(monkeypatch):
+    stubs = Upstreams()
+    for name in ("service_catalog", "topology", "iml"):
+        monkeypatch.setattr(getattr(upstream, name), "_client", httpx.AsyncClient(transport=httpx.MockTransport(stubs)))
+    monkeypatch.setattr(app, "client", OptimizationEngine())
+    for name in ("request_states", "deployed_services", "request_watchers"):
+        monkeypatch.setattr(app, name, {})
+    monkeypatch.setattr(app, "deploy_workers", [])
+    monkeypatch.setattr(app, "request_ids", itertools.count(1))
+    monkeypatch.setattr(app, "finished_requests", {})
+    monkeypatch.setattr(app, "DEPLOY_WORKERS", 8)
+
+    def run(scenario, queue_size=100):
+        async def main():
+            # The queue and the workers belong to the event loop of the test
+            monkeypatch.setattr(app, "deploy_queue", asyncio.Queue(maxsize=queue_size))
+            try:
+                transport = httpx.ASGITransport(app=app.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://so") as client:
+                    return await scenario(client)
+            finally:
+                for worker in app.deploy_workers:
+                    worker.cancel()
+                app.deploy_workers.clear()
+        return asyncio.run(main())
+    run.stubs = stubs
+    return run
+
+
+def test_single_and_batch_teardown_use_the_same_service_ids(so):
+    async def scenario(client):
+        deployed = await client.post("/services", json={"name": "a.yaml", "site_id": "SITE1"})
+        assert deployed.json()["status"] == "deployed"
+        assert (await client.get("/services")).json() == {"deployed_services": [1]}
+        assert (await client.get("/services/1")).json()["details"]["site_id"] == "SITE1"
+        assert (await client.delete("/services/1")).status_code == 200
+        assert (await client.delete("/services/1")).status_code == 404
+        await client.post("/services", json={"name": "b.yaml", "site_id": "SITE1"})
+        batch = await client.request("DELETE", "/services/batch", json={"service_ids": [2, 1]})
+        return batch.json()
+    batch = so(scenario)
+    assert (batch["deleted"], batch["not_found"]) == (1, 1)
+    assert ("DELETE", "iml-site1", "/1") in so.stubs.calls and ("DELETE", "iml-site1", "/2") in so.stubs.calls
+
+
+def events(body):
+    return [json.loads(line[len("data: "):])["stage"] for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_background_job_reports_its_stages(so):
+    async def scenario(client):
+        accepted = await client.post("/services?wait=false", json={"name": "a.yaml", "site_id": "SITE1"})
+        assert accepted.status_code == 202
+        request_id = accepted.json()["request"]
+        assert accepted.headers["location"] == f"/requests/{request_id}"
+        async with client.stream("GET", f"/requests/{request_id}/events") as stream:
+            body = "".join([chunk async for chunk in stream.aiter_text()])
+        details = (await client.get(f"/requests/{request_id}")).json()["details"]
+        # A stream opened after the end replays the history and ends
+        replay = (await client.get(f"/requests/{request_id}/events")).text
+        return body, details, replay
+    body, details, replay = so(scenario)
+    assert events(body)[-1] == "deployed"
+    assert events(replay) == ["queued", "fetching", "optimizing", "deploying", "deployed"]
+    assert (details["status"], details["stage"], details["result"]["status"]) == ("completed", "deployed", "deployed")
+    assert app.request_watchers == {}
+
+
+def test_unknown_site_fails_the_job(so):
+    async def scenario(client):
+        response = await client.post("/services", json={"name": "a.yaml", "site_id": "UNKNOWN"})
+        return response, (await client.get("/requests/1")).json()["details"]
+    response, details = so(scenario)
+    assert response.status_code == 404
+    assert (details["status"], details["stage"], details["stages"][-1]["code"]) == ("failed", "failed", 404)
+
+
+def test_full_queue_is_answered_with_503(so):
+    async def scenario(client):
+        app.deploy_queue.put_nowait(None)
+        response = await client.post("/services?wait=false", json={"name": "a.yaml", "site_id": "SITE1"})
+        return response, (await client.get("/requests/1")).json()["details"]
+    response, details = so(scenario, queue_size=1)
+    assert response.status_code == 503 and details["stage"] == "failed"
+
+
+def test_ended_requests_are_evicted(so, monkeypatch):
+    monkeypatch.setattr(app, "REQUEST_STATE_MAX", 2)
+    async def scenario(client):
+        for _ in range(4):
+            await client.post("/services", json={"name": "a.yaml", "site_id": "SITE1"})
+        return (await client.get("/requests")).json()["requested_services"]
+    # Evicted when the next request arrives, ids are not reused
+    assert so(scenario) == [2, 3, 4]
+    monkeypatch.setattr(app, "REQUEST_STATE_TTL", 0)
+    async def later(client):
+        await client.post("/services?wait=false", json={"name": "a.yaml", "site_id": "SITE1"})
+        return (await client.get("/requests")).json()["requested_services"]
+    assert so(later) == [5]
+
+
+def test_batch_fetches_every_nsd_and_site_once(so):
+    services = [{"name": name, "site_id": site} for name in ("a.yaml", "b.yaml") for site in ("SITE1", "SITE2")]
+    services.append({"name": "a.yaml", "site_id": "UNKNOWN"})
+    async def scenario(client):
+        return (await client.post("/services/batch", json={"services": services})).json()
+    batch = so(scenario)
+    assert (batch["deployed"], batch["failed"]) == (4, 1)
+    assert [result["request"] for result in batch["results"]] == [1, 2, 3, 4, 5]
+    assert batch["results"][-1]["code"] == 404
+    fetches = [call for call in so.stubs.calls if call[0] == "GET"]
+    assert sorted(path for _, _, path in fetches) == [
+        "/nodes/SITE1", "/nodes/SITE2", "/nodes/UNKNOWN", "/retrieve/a.yaml", "/retrieve/b.yaml"]
+    assert sorted(host for method, host, _ in so.stubs.calls if method == "POST") == ["iml-site1"] * 2 + ["iml-site2"] * 2
+
+
+def test_batch_items_rejected_by_a_full_queue_keep_their_id(so):
+    async def scenario(client):
+        services = [{"name": "a.yaml", "site_id": "SITE1"}] * 3
+        return (await client.post("/services/batch", json={"services": services})).json()
+    batch = so(scenario, queue_size=2)
+    assert [(result["request"], result["code"]) for result in batch["results"]] == [(1, 200), (2, 200), (3, 503)]
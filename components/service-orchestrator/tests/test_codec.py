@@ -0,0 +1,65 @@
+import base64
+import pytest
+import yaml
+from library import codec
+
+REQUEST = """
+lnsd:
+  ns-instance-id: 11223344
+  created: 2024-05-01
+  updated: 2024-05-01 10:20:30
+  ns:
+    network-functions:
+      - nf-instance-id: upf-i01
+        nf-vcpu: 2
+"""
+
+
+@pytest.mark.parametrize("content_type", [codec.MSGPACK, codec.JSON])
+def test_round_trip(content_type):
+    payload = {"lnsd": {"ns": {"network-functions": [{"nf-instance-id": "upf-i01", "nf-vcpu": 2}]}}, "ratio": 0.5}
+    body, content_encoding = codec.encode(payload, content_type)
+    assert codec.decode(body, content_type, content_encoding) == payload
+
+
+@pytest.mark.parametrize("content_type", [codec.MSGPACK, codec.JSON])
+def test_large_payloads_are_compressed(content_type, monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(codec, "MESSAGE_COMPRESS_THRESHOLD", 64)
+    payload = {"functions": [{"nf-instance-id": f"nf-{i}"} for i in range(100)]}
+    body, content_encoding = codec.encode(payload, content_type)
+    assert content_encoding == codec.ZSTD
+    assert codec.decode(body, content_type, content_encoding) == payload
+
+
+@pytest.mark.parametrize("codec_name", ["msgpack", "json"])
+def test_yaml_timestamps_are_sent_as_iso_strings(codec_name, monkeypatch):
+    monkeypatch.setattr(codec, "MESSAGE_CODEC", codec_name)
+    body, content_type, content_encoding = codec.encode_request(REQUEST)
+    assert content_type == codec.CONTENT_TYPES[codec_name]
+    lnsd = codec.decode(body, content_type, content_encoding)["lnsd"]
+    assert lnsd["created"] == "2024-05-01"
+    assert lnsd["updated"] == "2024-05-01T10:20:30"
+    assert lnsd["ns"]["network-functions"][0]["nf-vcpu"] == 2
+
+
+def test_unencodable_request_falls_back_to_legacy(monkeypatch):
+    monkeypatch.setattr(codec, "MESSAGE_CODEC", "json")
+    request = "lnsd:\n  blob: !!binary aGVsbG8=\n"
+    body, content_type, content_encoding = codec.encode_request(request)
+    assert (content_type, content_encoding) == (None, None)
+    assert base64.b64decode(body).decode() == request
+
+
+def test_legacy_codec(monkeypatch):
+    monkeypatch.setattr(codec, "MESSAGE_CODEC", "legacy")
+    body, content_type, _ = codec.encode_request(REQUEST)
+    assert content_type is None
+    assert yaml.safe_load(base64.b64decode(body))["lnsd"]["ns-instance-id"] == 11223344
+
+
+def test_unsupported_formats_are_rejected():
+    with pytest.raises(ValueError):
+        codec.decode(b"{}", "text/plain")
+    with pytest.raises(ValueError):
+        codec.decode(b"{}", codec.JSON, "gzip")
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+from aiokafka.errors import KafkaTimeoutError
+from library.messaging import KafkaClient, MessageClient, RabbitMQClient
+
+
+class LoopbackClient(MessageClient):
+    # Answers every request with its own body, in reverse order of arrival
+    def __init__(self, reply_timeout=1.0, batch=1):
+        super().__init__("input_topic", "final_topic", reply_timeout)
+        self.batch = batch
+        self.published = []
+
+    async def connect(self):
+        pass
+
+    def connected(self):
+        return True
+
+    async def _publish(self, message, content_type, content_encoding, correlation_id):
+        self.published.append((correlation_id, message, content_type, content_encoding))
+        if len(self.published) % self.batch == 0:
+            for correlation_id, body, content_type, content_encoding in reversed(self.published[-self.batch:]):
+                asyncio.get_running_loop().call_soon(self._resolve, correlation_id, body, content_type, content_encoding)
+
+
+def test_concurrent_requests_get_their_own_reply():
+    async def run():
+        client = LoopbackClient(batch=10)
+        bodies = [json.dumps({"request": i}).encode() for i in range(10)]
+        replies = await asyncio.gather(*(client.request(body, "application/json") for body in bodies))
+        assert replies == [{"request": i} for i in range(10)]
+        assert len({correlation_id for correlation_id, *_ in client.published}) == 10
+        assert client._pending == {}
+    asyncio.run(run())
+
+
+def test_untyped_reply_is_returned_as_text():
+    async def run():
+        return await LoopbackClient().request(b"legacy reply")
+    assert asyncio.run(run()) == "legacy reply"
+
+
+def test_request_times_out_and_late_reply_is_dropped():
+    async def run():
+        client = LoopbackClient(reply_timeout=0.05, batch=2)
+        assert await client.request(b"first") is None
+        assert client._pending == {}
+        # The reply of the first request arrives with the second one, and nobody waits for it
+        assert await client.request(b"second") == "second"
+    asyncio.run(run())
+
+
+def test_reply_without_correlation_id_is_dropped():
+    async def run():
+        client = LoopbackClient()
+        future = asyncio.get_running_loop().create_future()
+        client._pending["abc"] = future
+        client._resolve(None, b"stray", None, None)
+        client._resolve("other", b"stray", None, None)
+        assert not future.done()
+        client._resolve("abc", b"mine", None, None)
+        assert future.result() == "mine"
+    asyncio.run(run())
+
+
+def test_rabbitmq_clients_reply_on_their_own_queue():
+    async def run():
+        return [RabbitMQClient("localhost", "input_topic", "final_topic", 1.0) for _ in range(2)]
+    first, second = asyncio.run(run())
+    assert first.reply_queue.startswith("final_topic.")
+    assert first.reply_queue != second.reply_queue
+
+
+def test_rabbitmq_requests_carry_their_publish_time():
+    class Exchange:
+        async def publish(self, message, routing_key):
+            self.message, self.routing_key = message, routing_key
+
+    class Channel:
+        default_exchange = Exchange()
+
+    async def run():
+        client = RabbitMQClient("localhost", "input_topic", "final_topic", 1.0)
+        client.channel, client.connection = Channel(), object()
+        before = time.time()
+        await client._publish(b"{}", "application/json", None, "abc")
+        return client, before
+    client, before = asyncio.run(run())
+    message = Channel.default_exchange.message
+    assert before <= message.headers["sent-at"] <= time.time()
+    assert int(message.timestamp.timestamp()) == int(message.headers["sent-at"])
+    assert (message.correlation_id, message.reply_to) == ("abc", client.reply_queue)
+
+
+def test_kafka_publish_failure_fails_the_request_right_away():
+    class Producer:
+        async def send_and_wait(self, topic, value, key=None, headers=None):
+            raise KafkaTimeoutError()
+
+    async def run():
+        client = KafkaClient("localhost:9092", "input_topic", "final_topic", 5.0)
+        client.producer = Producer()
+        start = time.perf_counter()
+        reply = await client.request(b"{}", "application/json")
+        return reply, time.perf_counter() - start, client
+    reply, elapsed, client = asyncio.run(run())
+    assert reply is None and elapsed < 1.0
+    assert client._pending == {}